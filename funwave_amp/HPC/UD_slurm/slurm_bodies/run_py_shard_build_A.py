@@ -0,0 +1,33 @@
+def run_py_shard_build_A(file=None, env=None, n_shards=None):
+    '''
+    Creates a slurm script body that runs the 'build' stage of a sharded
+    generation, where `file` is the python script that calls
+    `process_design_matrix`. Each task of the array builds the trials of the
+    combinations of its slice that passed the 'filter' stage, with ITERs
+    after those of the shards before it.
+
+    Note that this inherently assumes that the job is submitted as an ARRAY of
+    `n_shards` tasks, indexed from 0, such that the `SLURM_ARRAY_TASK_ID` exists.
+
+    The script must pass the shard on to `process_design_matrix` explicitly,
+    ie- `process_design_matrix(..., **shard_args_from_env())`, as the
+    N_SHARDS/SHARD_INDEX/SHARD_STAGE exported here are not read otherwise.
+    '''
+
+    text_content = f"""
+    ## Access environment variables
+    source {env}
+
+    ## Activate Python Environment
+    conda activate $CONDA_ENV
+
+    ## Export out environment variables
+    export $(xargs <{env})
+    export N_SHARDS={n_shards}
+    export SHARD_INDEX=$SLURM_ARRAY_TASK_ID
+    export SHARD_STAGE=build
+
+    python "{file}"
+
+    """
+    return text_content
@@ -0,0 +1,28 @@
+def run_py_shard_reduce(file=None, env=None, n_shards=None):
+    '''
+    Creates a slurm script body that runs the 'reduce' stage of a sharded
+    generation, where `file` is the python script that calls
+    `process_design_matrix`. The summaries of the `n_shards` shards are merged
+    into the input/failure summaries. This is a single job, not an array.
+
+    The script must pass the shard on to `process_design_matrix` explicitly,
+    ie- `process_design_matrix(..., **shard_args_from_env())`, as the
+    N_SHARDS/SHARD_INDEX/SHARD_STAGE exported here are not read otherwise.
+    '''
+
+    text_content = f"""
+    ## Access environment variables
+    source {env}
+
+    ## Activate Python Environment
+    conda activate $CONDA_ENV
+
+    ## Export out environment variables
+    export $(xargs <{env})
+    export N_SHARDS={n_shards}
+    export SHARD_STAGE=reduce
+
+    python "{file}"
+
+    """
+    return text_content
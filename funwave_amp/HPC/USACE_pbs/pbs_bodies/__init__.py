@@ -2,4 +2,7 @@ from .run_fw_A import run_fw_A
 from .run_fw_run_py_A import run_fw_run_py_A
 from .run_fw_run_py_del_A import run_fw_run_py_del_A
 from .run_py import run_py
-from .run_py_A import run_py_A
\ No newline at end of file
+from .run_py_A import run_py_A
+from .run_py_shard_filter_A import run_py_shard_filter_A
+from .run_py_shard_build_A import run_py_shard_build_A
+from .run_py_shard_reduce import run_py_shard_reduce
\ No newline at end of file
@@ -26,8 +26,9 @@ def run_fw_run_py_del_A(file=None, env=None):
     
     ## Construct name of file
         input_dir="$in"
-        task_id=$(printf "%05d" $PBS_ARRAY_INDEX)
-        input_file="${{input_dir}}/input_${{task_id}}.txt"
+        task_id=$(printf "%0${{pad_width:-5}}d" $PBS_ARRAY_INDEX)
+        fan_dir=${{task_id:0:${{fan_digits:-0}}}}
+        input_file="${{input_dir}}/${{fan_dir:+$fan_dir/}}input_${{task_id}}.txt"
 
     ## Run FUNWAVE [TODO: Change to however you call MPI on USACE servers]
         ${{UD_MPIRUN}} $FW_ex "$input_file"
@@ -44,8 +45,8 @@ def run_fw_run_py_del_A(file=None, env=None):
     python "{file}"
 
     ## Run the Raw Output Deletions
-    echo "Deleting Raw Outputs from: ${{or}}/out_raw_${{task_id}}"
-    rm -rf "${{or}}/out_raw_${{task_id}}"
+    echo "Deleting Raw Outputs from: ${{or}}/${{fan_dir:+$fan_dir/}}out_raw_${{task_id}}"
+    rm -rf "${{or}}/${{fan_dir:+$fan_dir/}}out_raw_${{task_id}}"
     """
     return text_content
 
@@ -3,4 +3,6 @@ from .HPC import *
 from .print_files import *
 from .setup_paths_envs import *
 from .xarray_obj import *
-from .animation import *
\ No newline at end of file
+from .animation import *
+from .wave_theory import *
+from .log_tools import *
\ No newline at end of file
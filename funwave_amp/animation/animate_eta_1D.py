@@ -11,6 +11,8 @@ def animate_eta_1D(ds):
     Animates the surface profile of a 1D simulation, where Nglob == 1. 
     '''
     ## UNPACK ---------------------------------------------------------------------
+    # Full (X, Y) fields, should the file store profiles/implicit coordinates
+    ds = fpy.expand_alongshore_uniform(fpy.restore_implicit_coords(ds))
     # Coordinates
     X = ds.X.values
     Z = -ds.Z.values[:,0]
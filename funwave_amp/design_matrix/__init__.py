@@ -1,2 +1,7 @@
 from .combinations import find_combinations
-from .design_matrix import process_design_matrix
\ No newline at end of file
+from .design_matrix import process_design_matrix
+from ._lazy_permutations import LazyPermutations
+from ._apply_filters import vectorized_filter, filter_params
+from ._add_params import vectorized_dependency, dependency_params
+from ._sharding import shard_args_from_env
+from .adaptive import propose_adaptive_design, process_adaptive_design
\ No newline at end of file
@@ -1,4 +1,11 @@
-from ..setup_paths_envs import get_key_dirs
+import numpy as np
+import pandas as pd
+import xarray as xr
+from collections import OrderedDict
+
+from ..setup_paths_envs import get_key_dirs, get_path_resolver
+from ._instrumentation import timed
+from ..log_tools import logger
 
 
 def add_dependent_values(var_dict,
@@ -15,35 +22,134 @@ def add_dependent_values(var_dict,
     - var_dict (dictionary): dictionary of FUNWAVE parameters, with dependent
         parameters added on
     '''
-    print('\nApplying DEPENDENCY functions')
+    logger.debug('\nApplying DEPENDENCY functions')
     
     
-    # Loop through to apply each dependency function
-    dependent_vars = {}
+    # Loop through to apply each dependency function, updating a single copy
+    var_dict = dict(var_dict)
     for func in functions_to_apply:
-        print(f'\tApplying DEPENDENCY function: {func.__name__}')
+        logger.debug(f'\tApplying DEPENDENCY function: {func.__name__}')
 
-        # Calculate
-        result = func(var_dict)
-        # Update
-        dependent_vars.update(result)
-        # Merge
-        var_dict = {**var_dict, **dependent_vars}
+        # Calculate (or reuse if memoized) and merge
+        with timed('dependency', func.__name__) as record:
+            result = _call_dependency(func, var_dict, record)
+        var_dict.update(result)
 
-    print('All DEPENDENCY functions completed successfully!')
+    logger.debug('All DEPENDENCY functions completed successfully!')
     return var_dict
 
 
 
-def add_required_params(var_dict,iter_num,comb_i):
+#%% MEMOIZED DEPENDENCIES
+class _DependencyCache:
+    '''
+    Least-recently-used cache of the results of a dependency function, keyed
+    by the values of its declared parameters
+    '''
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if key not in self.results:
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        self.results.move_to_end(key)
+        return self.results[key]
+
+    def put(self, key, result):
+        self.results[key] = result
+        self.results.move_to_end(key)
+        while len(self.results) > self.maxsize:
+            self.results.popitem(last=False)
+
+    def clear(self):
+        self.results.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def dependency_params(*params, maxsize=32):
+    '''
+    Decorator to declare the parameters that a dependency function reads, ie-
+    `@dependency_params('DX','DY','Mglob','Nglob','DEPTH_FLAT')`. The result
+    of the function is then memoized: combinations that share the values of
+    those parameters reuse the same result (including any DomainObject or
+    WK_TIME_SERIES Datasets) rather than calling the function again. Up to
+    `maxsize` results are kept, discarding the least recently used, and the
+    cache is cleared at the start of each `process_design_matrix` run.
+
+    The function must not read anything other than the declared parameters.
+    Reused Datasets are shallow copies: their attributes and variables may be
+    replaced by later functions, but the underlying arrays are SHARED between
+    combinations, so they must not be modified in place.
+    '''
+    def decorator(func):
+        func.params = tuple(params)
+        func.cache = _DependencyCache(maxsize)
+        return func
+    return decorator
+
+
+def clear_dependency_caches(functions):
+    '''
+    Clears the memoized results of the dependency functions that declared
+    their parameters with `dependency_params`, ie- at the start of a run
+    '''
+    for func in functions or []:
+        cache = getattr(func, 'cache', None)
+        if cache is not None:
+            cache.clear()
+
+
+def _call_dependency(func, var_dict, record=None):
+    '''
+    Calls a dependency function, reusing the memoized result if the function
+    declared its parameters with `dependency_params`. Whether the cache was
+    hit is noted in the instrumentation `record`, if given.
+    '''
+    cache = getattr(func, 'cache', None)
+    if cache is None:
+        return func(var_dict)
+
+    missing = [p for p in func.params if p not in var_dict]
+    if missing:
+        raise KeyError(f'Dependency function {func.__name__} declares parameters {missing} that are not available')
+
+    key = tuple(var_dict[p] for p in func.params)
+    try:
+        result = cache.get(key)
+    except TypeError:
+        # Unhashable values (ie- arrays) are not memoized
+        return func(var_dict)
+
+    if record is not None:
+        record['cache_hit'] = result is not None
+    if result is None:
+        result = func(var_dict)
+        cache.put(key, result)
+    else:
+        logger.debug(f'\t\tReusing memoized result of: {func.__name__}')
+
+    # Shallow copies of Datasets, such that the cached ones are not modified
+    return {name: value.copy(deep=False) if isinstance(value, (xr.Dataset, xr.DataArray)) else value
+            for name, value in result.items()}
+
+
+def add_required_params(var_dict,iter_num,comb_i,resolver=None):
     '''
     Add in parameters that FUNWAVE either needs or that we need to keep track
     of everything. This is applied to each ROW of the design matrix
     '''
     
-    ptr = get_key_dirs(iter_num)
+    if resolver is None:
+        resolver = get_path_resolver()
+    ptr = get_key_dirs(iter_num, resolver=resolver)
     # Title of Run- use iteration number to keep things tidy
-    var_dict['TITLE'] = f'input_{iter_num:05}'
+    var_dict['TITLE'] = f'input_{resolver.format_trial(iter_num)}'
     # Result Folder
     var_dict['RESULT_FOLDER'] = ptr['or']    
     # ITERATION NUMBER  
@@ -62,7 +168,63 @@ def add_load_params(var_dict,functions_to_apply):
     
     load_vars = {}
     for func in functions_to_apply:
-        result = func(var_dict)
+        with timed('load', func.__name__):
+            result = func(var_dict)
         load_vars.update(result)
         var_dict = {**var_dict, **load_vars}
     return var_dict
+
+
+#%% VECTORIZED DEPENDENCIES
+def vectorized_dependency(func):
+    '''
+    Decorator to register a dependency function as VECTORIZED. Rather than a
+    dictionary for a single combination, a vectorized dependency function 
+    takes in a DataFrame of many combinations (one column per parameter) and 
+    returns a dictionary (or DataFrame) of NEW columns, each either an array
+    with one entry per combination or a scalar. Lists are stored as-is, one 
+    object per combination.
+
+    Vectorized dependency functions may be mixed in with ordinary ones in 
+    `function_set`. They are applied BEFORE the core loop, in the order given,
+    and before any vectorized filters, such that both ordinary functions and
+    vectorized filters can use their results.
+    '''
+    func.vectorized = True
+    return func
+
+
+def is_vectorized_dependency(func):
+    '''
+    Checks if a dependency function was registered with `vectorized_dependency`
+    '''
+    return getattr(func, 'vectorized', False)
+
+
+def add_vectorized_dependent_values(df_chunk,functions_to_apply):
+    '''
+    Add on the columns of the vectorized dependency functions to a DataFrame
+    of combinations
+
+    Arguments:
+    - df_chunk (DataFrame): combinations, indexed by combination index
+    - functions_to_apply (list): list of vectorized dependency functions
+
+    Returns:
+    - df_chunk (DataFrame): copy of the combinations with new columns
+    '''
+    df_chunk = df_chunk.copy()
+    for func in functions_to_apply:
+        with timed('vectorized_dependency', func.__name__):
+            result = func(df_chunk)
+        for name, column in dict(result).items():
+            # Lists are kept as objects (ie- one Dataset per combination)
+            if isinstance(column, list):
+                df_chunk[name] = pd.Series(column, index=df_chunk.index, dtype=object)
+            # Scalars broadcast to all combinations
+            elif np.ndim(column) == 0:
+                df_chunk[name] = column
+            else:
+                df_chunk[name] = np.asarray(column)
+    return df_chunk
+
@@ -1,7 +1,12 @@
+import numpy as np
+
+from ._instrumentation import timed
+from ..log_tools import logger
+
 
 def apply_filters(var_dict,functions_to_apply):
     '''
-    Applies the defined filter functions to knock out trials that are not 
+    Applies the defined filter functions to knock out trials that are not
     valid.
 
     Arguments:
@@ -14,26 +19,27 @@ def apply_filters(var_dict,functions_to_apply):
 
     failed_checks = []  # List to keep track of functions that return False
     failed_vars = {}    # Dictionary to keep track of variables causing the failure
-    print('\nApplying FILTER functions')
+    logger.debug('\nApplying FILTER functions')
 
     # Loop through all filter functions
     for func in functions_to_apply:
-        print(f'\tApplying FILTER function: {func.__name__}')
-        result = func(var_dict)
-        
+        logger.debug(f'\tApplying FILTER function: {func.__name__}')
+        with timed('filter', func.__name__):
+            result = func(var_dict)
+      
         # Record failure and key data
         if not result:
-            
+          
             # Record function name and what the iteration would have been
-            print(f'\tFailed FILTER function: {func.__name__}')
-            failed_checks.append(func.__name__)  
+            logger.debug(f'\tFailed FILTER function: {func.__name__}')
+            failed_checks.append(func.__name__)
 
             # Loop through (valid) variables
             for k, v in var_dict.items():
                 if isinstance(v, (str, int, float)):
                     failed_vars[k] = v
 
-    # Record failures out 
+    # Record failures out
     if failed_checks:
         # Record which functions trigger the failure
         failed_vars['failed_checks'] = ', '.join(failed_checks)
@@ -42,6 +48,91 @@ def apply_filters(var_dict,functions_to_apply):
         return failed_vars
 
     else:
-        print("All FILTER functions passed successfully!")
+        logger.debug("All FILTER functions passed successfully!")
         return None
-    
\ No newline at end of file
+
+
+
+#%% VECTORIZED FILTERS
+def vectorized_filter(func):
+    '''
+    Decorator to register a filter function as VECTORIZED. Rather than a
+    dictionary for a single combination, a vectorized filter takes in a
+    DataFrame of many combinations (one column per parameter in the design
+    matrix) and returns a boolean array/Series that is True where the
+    combination passes. The parameters in the design matrix are available, as
+    well as those added by vectorized dependency functions (which are applied
+    first), but not those of ordinary dependency functions.
+
+    Vectorized filters may be mixed in with ordinary filters in `filter_sets`,
+    and are applied BEFORE the core loop.
+    '''
+    func.vectorized = True
+    return func
+
+
+def filter_params(*params):
+    '''
+    Decorator to declare the design matrix parameters that a filter function
+    reads, ie- `@filter_params('Tperiod','DEPTH_FLAT')`. It may be used on
+    both ordinary and vectorized filters. When `process_design_matrix` is run
+    with `lazy=True`, such filters are evaluated ONCE on the sub-product of
+    just those parameters, and only the surviving sub-combinations are
+    enumerated (see `prune_permutations`). The filter must not read anything
+    other than the declared parameters, as nothing else is available.
+    '''
+    def decorator(func):
+        func.params = tuple(params)
+        return func
+    return decorator
+
+
+def get_filter_params(func):
+    '''
+    Parameters declared with `filter_params`, or None if not declared
+    '''
+    return getattr(func, 'params', None)
+
+
+def is_vectorized_filter(func):
+    '''
+    Checks if a filter function was registered with `vectorized_filter`
+    '''
+    return getattr(func, 'vectorized', False)
+
+
+def apply_vectorized_filters(df_chunk,functions_to_apply):
+    '''
+    Applies the vectorized filter functions to a DataFrame of combinations
+
+    Arguments:
+    - df_chunk (DataFrame): combinations, indexed by combination index
+    - functions_to_apply (list): list of vectorized filter functions
+
+    Returns:
+    - passed (np.ndarray): boolean array, True where all filters passed
+    - failed_data (list): list of dictionaries of failed variables, with
+        `failed_checks` and `COMBO_NUM` as in the row-by-row version
+    '''
+    # Record the names of the functions that fail for each row
+    passed = np.ones(len(df_chunk), dtype=bool)
+    failed_checks = [[] for _ in range(len(df_chunk))]
+
+    for func in functions_to_apply:
+        with timed('vectorized_filter', func.__name__):
+            result = np.asarray(func(df_chunk), dtype=bool)
+        result = np.broadcast_to(result, passed.shape)
+        for i in np.flatnonzero(~result):
+            failed_checks[i].append(func.__name__)
+        passed &= result
+
+    # Record failures out
+    failed_data = []
+    for i in np.flatnonzero(~passed):
+        failed_vars = {k: v for k, v in df_chunk.iloc[i].to_dict().items()
+                       if isinstance(v, (str, int, float))}
+        failed_vars['failed_checks'] = ', '.join(failed_checks[i])
+        failed_vars['COMBO_NUM'] = int(df_chunk.index[i]) + 1
+        failed_data.append(failed_vars)
+
+    return passed, failed_data
@@ -3,6 +3,7 @@ from ._assertions import assert_design_matrix_csv, assert_design_matrix_dict
 import pandas as pd
 import numpy as np
 from itertools import product
+from ..log_tools import logger
 
 # Fortran numbers
 def convert_to_number(value):
@@ -22,8 +23,30 @@ def convert_to_number(value):
         return value
 
 
+def expand_param_specs(param_specs):
+    '''
+    Expands the specification of each parameter (see `get_param_specs_from_csv`)
+    into the list of every value that parameter assumes
+    '''
+    param_ranges = {}
+    for name, entries in param_specs.items():
+        val_list = []
+        for entry in entries:
+            if entry[0] == 'CON':
+                val_list.append(entry[1])
+            else:
+                val_list.extend(np.linspace(entry[1],entry[2],entry[3]))
+        param_ranges[name] = val_list
+    return param_ranges
+
+
 #%% CSV Version
-def find_combinations_from_csv(matrix_path):
+def get_param_specs_from_csv(matrix_path):
+    '''
+    Parses the design matrix csv into a dictionary with keys of each FUNWAVE
+    parameter and values of a list of its entries, each either a constant
+    ('CON', value) or a range ('RANGE', LO, HI, NUM)
+    '''
     
     # Read in the Matrix
     df = pd.read_csv(matrix_path,
@@ -32,14 +55,14 @@ def find_combinations_from_csv(matrix_path):
     # Assert Conditions
     df = assert_design_matrix_csv(df)
 
-    # Dictionary: key = Parameter, value = list of values it assumes
-    param_ranges = {}
+    # Dictionary: key = Parameter, value = list of entries
+    param_specs = {}
     
     # Find every unique PARAMETER represented in the matrix 
     for name, group in df.groupby('VAR'):
-        print(name)
+        logger.info(name)
         
-        # List: contains every VALUE the parameter assumes
+        # List: contains every entry of the parameter
         val_list = []
         # Within each group
         for i,row in group.iterrows():
@@ -48,8 +71,8 @@ def find_combinations_from_csv(matrix_path):
             if not pd.isna(row['CON']):
                 # Convert as necessary
                 value = convert_to_number(row['CON'])
-                val_list.append(value)
-                print(f"\t• CONSTANT: {row['CON']}")
+                val_list.append(('CON', value))
+                logger.info(f"\t• CONSTANT: {row['CON']}")
                 
             # If ranged, construct the range
             elif not (pd.isna(row['LO']) & pd.isna(row['HI']) & pd.isna(row['NUM'])):
@@ -58,13 +81,31 @@ def find_combinations_from_csv(matrix_path):
                 val_hi = convert_to_number(row['HI'])
                 val_num = convert_to_number(row['NUM'])
                 
-                # Construct the linspace and append
-                val_list.extend(np.linspace(val_lo,val_hi,val_num))
-                print(f"\t• RANGED: np.linspace({row['LO']},{row['HI']}, {row['NUM']})")
+                # Append the range
+                val_list.append(('RANGE', val_lo, val_hi, val_num))
+                logger.info(f"\t• RANGED: np.linspace({row['LO']},{row['HI']}, {row['NUM']})")
         
         # Append to dictionary                
-        param_ranges[name] = val_list
-        
+        param_specs[name] = val_list
+    
+    return param_specs
+
+
+def get_param_ranges_from_csv(matrix_path):
+    '''
+    Parses the design matrix csv into a dictionary with keys of each FUNWAVE
+    parameter and values of the list of every value that parameter assumes.
+    No combinations are formed here.
+    '''
+    return expand_param_specs(get_param_specs_from_csv(matrix_path))
+
+
+def find_combinations_from_csv(matrix_path):
+    '''
+    Finds the full cartesian product of the design matrix csv as a DataFrame
+    '''
+    param_ranges = get_param_ranges_from_csv(matrix_path)
+    
     # Find all combinations and convert to dataframe
     combinations = list(product(*param_ranges.values()))
     dfv = pd.DataFrame(combinations, columns=param_ranges.keys())
@@ -73,34 +114,38 @@ def find_combinations_from_csv(matrix_path):
 
 
 #%% Dictionary Version
-def find_combinations_from_dict(input_dict):
-    # 
-    print('\nRANGES OF FUNWAVE-TVD VALUES' + '=' * (80 - len('\nRANGES OF FUNWAVE-TVD VALUES')))
+def get_param_specs_from_dict(input_dict):
+    '''
+    Parses the design matrix dictionary into a dictionary with keys of each
+    FUNWAVE parameter and values of a list of its entries, each either a
+    constant ('CON', value) or a range ('RANGE', LO, HI, NUM)
+    '''
+    logger.info('\nRANGES OF FUNWAVE-TVD VALUES' + '=' * (80 - len('\nRANGES OF FUNWAVE-TVD VALUES')))
     # Assert condition
     assert_design_matrix_dict(input_dict)
     # Loop through each category
     
-    param_ranges = {}
+    param_specs = {}
     for category, category_dict in input_dict.items():
-        print(f'{category}' + '-' * (80 - len(category)))
+        logger.info(f'{category}' + '-' * (80 - len(category)))
         
         
         # Loop through each FUNWAVE parameter
         for FW_PARAM_NAME, FW_PARAM_VALUES in category_dict.items():
             val_list = []
-            print(f'\t{FW_PARAM_NAME}')
+            logger.info(f'\t{FW_PARAM_NAME}')
             
             # If value is just a string, add to list
             if isinstance(FW_PARAM_VALUES, str):
                 # Convert and append to list
                 value =  convert_to_number(FW_PARAM_VALUES)
-                val_list.append(value)
-                print(f'\t\t• CONSTANT: {FW_PARAM_VALUES}')
+                val_list.append(('CON', value))
+                logger.info(f'\t\t• CONSTANT: {FW_PARAM_VALUES}')
                 
             # If a tuple, it's a ranged parameter
             elif isinstance(FW_PARAM_VALUES, tuple):
-                print(f"\t\t• RANGED: np.linspace({FW_PARAM_VALUES[0]},{FW_PARAM_VALUES[1]},{FW_PARAM_VALUES[2]})")
-                val_list.extend(np.linspace(FW_PARAM_VALUES[0],FW_PARAM_VALUES[1],FW_PARAM_VALUES[2]))
+                logger.info(f"\t\t• RANGED: np.linspace({FW_PARAM_VALUES[0]},{FW_PARAM_VALUES[1]},{FW_PARAM_VALUES[2]})")
+                val_list.append(('RANGE', *FW_PARAM_VALUES[:3]))
             
             # If value is a list, it's either a list/ranged parameter
             elif isinstance(FW_PARAM_VALUES, list):
@@ -108,22 +153,41 @@ def find_combinations_from_dict(input_dict):
                     # Deal with constants
                     if isinstance(entry,str):
                         value =  convert_to_number(entry)
-                        val_list.append(value)
-                        print(f'\t\t• CONSTANT: {value}')
+                        val_list.append(('CON', value))
+                        logger.info(f'\t\t• CONSTANT: {value}')
                         
                     # Deal with ranges
                     if isinstance(entry,tuple):
-                        print(f"\t\t• RANGED: np.linspace({entry[0]},{entry[1]},{entry[2]})")
-                        val_list.extend(np.linspace(entry[0],entry[1],entry[2]))
+                        logger.info(f"\t\t• RANGED: np.linspace({entry[0]},{entry[1]},{entry[2]})")
+                        val_list.append(('RANGE', *entry[:3]))
                         
-            # Add onto ranges
-            param_ranges[FW_PARAM_NAME] = val_list
+            # Add onto specifications
+            param_specs[FW_PARAM_NAME] = val_list
     
+    logger.info('='*80)
+    return param_specs
+
+
+def get_param_ranges_from_dict(input_dict):
+    '''
+    Parses the design matrix dictionary into a dictionary with keys of each
+    FUNWAVE parameter and values of the list of every value that parameter 
+    assumes. No combinations are formed here.
+    '''
+    return expand_param_specs(get_param_specs_from_dict(input_dict))
+
+
+def find_combinations_from_dict(input_dict):
+    '''
+    Finds the full cartesian product of the design matrix dictionary as a 
+    DataFrame
+    '''
+    param_ranges = get_param_ranges_from_dict(input_dict)
+
     # Find all combinations and convert to dataframe
     combinations = list(product(*param_ranges.values()))
     dfv = pd.DataFrame(combinations, columns=param_ranges.keys())
     
-    print('='*80)
     return dfv
 
 
@@ -0,0 +1,290 @@
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from ._process_combination import evaluate_combination
+from ._make_summary import SummaryWriter
+from ..setup_paths_envs import get_env
+from ..xarray_obj import get_net_cdf_dtype
+from ..log_tools import logger, TRIAL
+
+
+'''
+Pre-flight cost estimate of an ensemble (`process_design_matrix(dry_run=True)`).
+Every combination is evaluated (dependencies and filters), but no files are
+created for it. Instead, the cost of each passing trial is estimated from its
+FUNWAVE parameters:
+    > EST_DT/EST_STEPS: time step and number of FUNWAVE steps. Unless a fixed
+      `DT_fixed` is given, the time step is CFL*min(DX,DY)/sqrt(g*h_max) for
+      the deepest point of the domain, such that velocities are neglected and
+      the number of steps is a LOWER bound.
+    > EST_CORE_HOURS: steps*Mglob*Nglob at `core_seconds_per_cell_step`
+    > EST_RAW_FILES/EST_RAW_BYTES: files and bytes FUNWAVE writes to
+      RESULT_FOLDER, from the OUT_* flags, PLOT_INTV, PLOT_INTV_STATION,
+      T_INTV_mean, NumberStations, and FIELD_IO_TYPE
+    > EST_NC_BYTES: size of the NetCDF files of the trial: the input tri
+      NetCDF (its fields, coordinates, and attributes at their NetCDF types,
+      uncompressed, and the HDF5 headers) plus the float32 size of the output
+      fields and stations times `nc_compression_ratio` (zlib level 4, set 1.0
+      for an upper bound)
+
+Parameters FUNWAVE would take defaults for are given its defaults (all OUT_*
+flags off, FIELD_IO_TYPE ASCII, CFL 0.5). The estimates of each trial are
+written to `{name}_cost_estimate`, and their totals/distributions to
+`{name}_cost_summary.csv`.
+'''
+
+G = 9.81
+
+COST_DEFAULTS = {'core_seconds_per_cell_step': 2e-6,
+                 'nc_compression_ratio': 0.7}
+
+# Raw files written every PLOT_INTV for each OUT_* flag
+FIELD_OUTPUTS = {'OUT_ETA': ['eta'],
+                 'OUT_U': ['u'],
+                 'OUT_V': ['v'],
+                 'OUT_MASK': ['mask'],
+                 'OUT_MASK9': ['mask9'],
+                 'OUT_P': ['p'],
+                 'OUT_Q': ['q'],
+                 'OUT_AGE': ['age'],
+                 'OUT_ROLLER': ['roller'],
+                 'OUT_UNDERTOW': ['U_undertow', 'V_undertow'],
+                 'OUT_NU': ['nubrk'],
+                 'OUT_TMP': ['tmp'],
+                 'OUT_FRC': ['frc'],
+                 'OUT_Hmax': ['hmax'],
+                 'OUT_Hmin': ['hmin'],
+                 'OUT_Umax': ['umax'],
+                 'OUT_MFmax': ['MFmax'],
+                 'OUT_VORmax': ['VORmax']}
+
+# Raw files written every T_INTV_mean for each OUT_* flag
+MEAN_OUTPUTS = {'OUT_Umean': ['umean'],
+                'OUT_Vmean': ['vmean'],
+                'OUT_ETAmean': ['etamean'],
+                'OUT_WaveHeight': ['Havg', 'Hrms', 'Hsig']}
+
+# Characters FUNWAVE writes per value in ASCII (E16.6)
+ASCII_VALUE_BYTES = 16
+
+# Header bytes of a NetCDF4 (HDF5) file, and of each of its variables
+NC_FILE_BYTES = 5200
+NC_VARIABLE_BYTES = 960
+
+
+#%% ESTIMATES
+def _get_params(var_dict):
+    '''
+    Scalar parameters of a combination, including the attributes of any of
+    its xarray objects (ie- Mglob of a DomainObject)
+    '''
+    params = {}
+    for value in var_dict.values():
+        if isinstance(value, xr.Dataset):
+            params.update(value.attrs)
+    params.update({key: value for key, value in var_dict.items()
+                   if isinstance(value, (int, float, str, np.number))})
+    return params
+
+
+def _is_on(flag):
+    if isinstance(flag, str):
+        return flag.strip().upper().startswith('T')
+    return bool(flag)
+
+
+def _get_max_depth(var_dict, params):
+    for value in var_dict.values():
+        if isinstance(value, xr.Dataset) and 'Z' in value:
+            return float(np.nanmax(value['Z'].values))
+    if 'DEPTH_FLAT' in params:
+        return float(params['DEPTH_FLAT'])
+    return np.nan
+
+
+def _get_number_stations(var_dict, params):
+    if 'NumberStations' in params:
+        return int(params['NumberStations'])
+    for value in var_dict.values():
+        if isinstance(value, xr.Dataset) and 'GAGE_NUM' in value.coords:
+            return int(value.sizes['GAGE_NUM'])
+    return 0
+
+
+def _input_nc_bytes(var_dict):
+    '''
+    Uncompressed size of the input tri NetCDF of a combination: the fields
+    and coordinates of its xarray objects at their NetCDF types (see
+    `get_net_cdf_dtype`), its attributes, and the headers of the file
+    '''
+    n_bytes = NC_FILE_BYTES
+    variables = {}
+    for value in var_dict.values():
+        if isinstance(value, xr.Dataset):
+            variables.update(value.variables)
+            n_bytes += sum(len(str(attr)) for attr in value.attrs.values())
+    for name, variable in variables.items():
+        dtype = get_net_cdf_dtype(variable) or variable.dtype
+        n_bytes += variable.size * dtype.itemsize + NC_VARIABLE_BYTES
+    n_bytes += sum(len(str(value)) for value in var_dict.values()
+                   if isinstance(value, (int, float, str)))
+    return n_bytes
+
+
+def _n_outputs(total_time, interval):
+    if not interval or interval <= 0:
+        return 0
+    return int(np.floor(total_time / interval)) + 1
+
+
+def estimate_trial_cost(var_dict, cost_params=None):
+    '''
+    Estimated cost of a single trial (see module docstring)
+
+    Arguments:
+    - var_dict (dictionary): FUNWAVE parameters of the trial, after the
+        dependency functions
+    - cost_params (dictionary/None): overrides of `COST_DEFAULTS`
+
+    Returns:
+    - cost (dictionary): EST_* estimates
+    '''
+    cost_params = {**COST_DEFAULTS, **(cost_params or {})}
+    params = _get_params(var_dict)
+    Mglob, Nglob = int(float(params['Mglob'])), int(float(params['Nglob']))
+    n_cells = Mglob * Nglob
+    total_time = float(params.get('TOTAL_TIME', 0))
+
+    ## Time stepping
+    if 'DT_fixed' in params:
+        dt = float(params['DT_fixed'])
+    else:
+        h_max = _get_max_depth(var_dict, params)
+        dx = min(float(params.get('DX', 1.0)), float(params.get('DY', params.get('DX', 1.0))))
+        dt = float(params.get('CFL', 0.5)) * dx / np.sqrt(G * h_max) if h_max > 0 else np.nan
+    steps = np.ceil(total_time / dt) if dt > 0 else np.nan
+
+    ## Raw outputs
+    if str(params.get('FIELD_IO_TYPE', 'ASCII')).strip().upper() == 'BINARY':
+        field_bytes = 4 * n_cells
+    else:
+        field_bytes = Nglob * (ASCII_VALUE_BYTES * Mglob + 1)
+
+    n_plot = _n_outputs(total_time, float(params.get('PLOT_INTV', 1.0)))
+    n_mean = _n_outputs(total_time, float(params.get('T_INTV_mean', total_time)))
+    n_fields = sum(len(names) for flag, names in FIELD_OUTPUTS.items() if _is_on(params.get(flag, False)))
+    n_means = sum(len(names) for flag, names in MEAN_OUTPUTS.items() if _is_on(params.get(flag, False)))
+    n_depth = int(_is_on(params.get('OUT_DEPTH', False)))
+
+    n_stations = _get_number_stations(var_dict, params)
+    n_station_lines = _n_outputs(total_time, float(params.get('PLOT_INTV_STATION', 1.0)))
+    station_bytes = n_station_lines * (4 * ASCII_VALUE_BYTES + 1)
+
+    raw_files = n_plot * n_fields + n_mean * n_means + n_depth + n_stations + 1
+    raw_bytes = ((n_plot * n_fields + n_mean * n_means + n_depth) * field_bytes
+                 + n_stations * station_bytes
+                 + n_plot * (2 * ASCII_VALUE_BYTES + 1))
+
+    ## NetCDF (input tri file, and compressed fields and stations as float32)
+    nc_bytes = 4 * ((n_plot * n_fields + n_mean * n_means) * n_cells
+                    + 3 * n_stations * n_station_lines)
+    nc_bytes = _input_nc_bytes(var_dict) + nc_bytes * cost_params['nc_compression_ratio']
+
+    return {'EST_DT': dt,
+            'EST_STEPS': steps,
+            'EST_CORE_HOURS': steps * n_cells * cost_params['core_seconds_per_cell_step'] / 3600,
+            'EST_RAW_FILES': raw_files,
+            'EST_RAW_BYTES': raw_bytes,
+            'EST_NC_BYTES': nc_bytes}
+
+
+#%% DRY RUN
+def get_cost_writer(summary_formats, flush_every=100):
+    base_path = get_env('is')
+    name = get_env('name')
+    return SummaryWriter(os.path.join(base_path,f'{name}_cost_estimate'),
+                         summary_formats,
+                         flush_every = flush_every)
+
+
+def estimate_permutations(permutations,
+                          pass_data,
+                          fail_data,
+                          load_vars = None,
+                          function_set = None,
+                          filter_sets = None,
+                          cost_params = None,
+                          progress = None,
+                          first_iter = 1):
+    '''
+    Dry run version of the core loop of `process_design_matrix`: the cost of
+    each passing combination is estimated and appended to `pass_data`, with
+    the ITER it would be assigned, rather than its files being created.
+    '''
+    k = first_iter
+    for perm_i, var_dict in permutations:
+        combo_num = perm_i + 1
+        var_dict, failed_params = evaluate_combination(var_dict,
+                                                       load_vars,
+                                                       function_set,
+                                                       filter_sets)
+        if failed_params is not None:
+            failed_params['COMBO_NUM'] = combo_num
+            fail_data.append(failed_params)
+            logger.log(TRIAL, f'Combination {combo_num:05} FAILED. Moving on.')
+        else:
+            cost = estimate_trial_cost(var_dict, cost_params)
+            row = {key: value for key, value in var_dict.items()
+                   if isinstance(value, (int, float, str, np.number))}
+            pass_data.append({**row, 'ITER': k, 'COMBO_NUM': combo_num, **cost})
+            logger.log(TRIAL, f'Trial {k:05}: {cost["EST_STEPS"]:.0f} steps, '
+                              f'{_format_bytes(cost["EST_RAW_BYTES"])} raw output')
+            k = k + 1
+        if progress is not None:
+            progress.update(combo_num)
+    return
+
+
+def _format_bytes(n_bytes):
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if abs(n_bytes) < 1024 or unit == 'TB':
+            return f'{n_bytes:.1f} {unit}'
+        n_bytes = n_bytes / 1024
+
+
+def summarize_costs(df_cost, base_path=None, name=None):
+    '''
+    Totals and distributions of the estimates over all trials, saved to
+    `{name}_cost_summary.csv` in `base_path` (`is` and `name` of the
+    environment if None)
+
+    Returns:
+    - summary (DataFrame): one row per estimate, with its total, mean, p50,
+        p95, and max
+    '''
+    columns = [column for column in ['EST_STEPS', 'EST_CORE_HOURS', 'EST_RAW_FILES',
+                                     'EST_RAW_BYTES', 'EST_NC_BYTES']
+               if column in df_cost.columns]
+    summary = pd.DataFrame({'total': df_cost[columns].sum(),
+                            'mean': df_cost[columns].mean(),
+                            'p50': df_cost[columns].quantile(0.50),
+                            'p95': df_cost[columns].quantile(0.95),
+                            'max': df_cost[columns].max()}).rename_axis('estimate').reset_index()
+    base_path = base_path or get_env('is')
+    name = name or get_env('name')
+    summary_path = os.path.join(base_path, f'{name}_cost_summary.csv')
+    summary.to_csv(summary_path, index=False)
+
+    logger.info(f'\nCOST ESTIMATE ({len(df_cost)} trials)')
+    if len(df_cost):
+        totals = summary.set_index('estimate')['total']
+        logger.info(f"\tFUNWAVE steps : {totals['EST_STEPS']:.0f}")
+        logger.info(f"\tCore-hours    : {totals['EST_CORE_HOURS']:.1f}")
+        logger.info(f"\tRaw files     : {totals['EST_RAW_FILES']:.0f}")
+        logger.info(f"\tRaw bytes     : {_format_bytes(totals['EST_RAW_BYTES'])} "
+                    f"(largest trial {_format_bytes(df_cost['EST_RAW_BYTES'].max())})")
+        logger.info(f"\tNetCDF bytes  : {_format_bytes(totals['EST_NC_BYTES'])}")
+    logger.info(f'Cost summary saved to: {summary_path}')
+    return summary
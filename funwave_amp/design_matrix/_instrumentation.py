@@ -0,0 +1,237 @@
+import os
+import time
+import heapq
+import cProfile
+from contextlib import contextmanager
+import pandas as pd
+
+from ._make_summary import SummaryWriter
+from ..setup_paths_envs import get_env
+from ..log_tools import logger
+
+
+'''
+Instrumentation of the generation pipeline. When enabled, every named
+function of every stage (load, dependency, filter, print, plot, netcdf,
+input) records its wall time for the combination being processed, along
+with the bytes it wrote and, for memoized dependency functions, whether the
+cache was hit. Each trial also records its total time, and may be profiled
+with cProfile.
+
+Records are kept per process and drained by `drain_records`, such that the
+worker processes of the parallel version can send them back to the main
+process, where the `TimingCollector` streams them out and aggregates them.
+Note that in the parallel version, the dependency functions and their
+timings appear in both the FILTER and BUILD stages.
+'''
+
+
+class _Instrumentation:
+    def __init__(self):
+        self.enabled = False
+        self.profile_dir = None
+        self.records = []
+        self.combo_num = None
+        self.trial_index = 0
+        self.trial_start = None
+        self.profiler = None
+
+# State of this process
+_STATE = _Instrumentation()
+
+
+#%% RECORDING
+def enable_instrumentation(profile_dir=None):
+    '''
+    Start recording in this process. If `profile_dir` is given, each trial is
+    profiled with cProfile and dumped to `profile_dir/trial_XXXXX.prof`.
+    '''
+    _STATE.enabled = True
+    _STATE.profile_dir = profile_dir
+    _STATE.records = []
+
+
+def disable_instrumentation():
+    _STATE.enabled = False
+    _STATE.profile_dir = None
+    _STATE.profiler = None
+
+
+def get_profile_path(profile_dir, iter_num):
+    return os.path.join(profile_dir, f'trial_{iter_num:05}.prof')
+
+
+def file_bytes(paths):
+    '''
+    Total size of any of the paths that are files
+    '''
+    return sum(os.path.getsize(p) for p in paths
+               if isinstance(p, str) and os.path.isfile(p))
+
+
+@contextmanager
+def timed(stage, function):
+    '''
+    Records the wall time of the block as `function` of `stage`. The yielded
+    dictionary may be given `bytes` and `cache_hit` entries to record.
+    '''
+    record = {}
+    if not _STATE.enabled:
+        yield record
+        return
+
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        _STATE.records.append({'COMBO_NUM': _STATE.combo_num,
+                               'ITER': None,
+                               'stage': stage,
+                               'function': function,
+                               'seconds': time.perf_counter() - start,
+                               'bytes': record.get('bytes'),
+                               'cache_hit': record.get('cache_hit')})
+
+
+def start_trial(combo_num):
+    '''
+    Marks the start of the processing of a combination
+    '''
+    if not _STATE.enabled:
+        return
+    _STATE.combo_num = combo_num
+    _STATE.trial_index = len(_STATE.records)
+    _STATE.trial_start = time.perf_counter()
+    if _STATE.profile_dir:
+        _STATE.profiler = cProfile.Profile()
+        _STATE.profiler.enable()
+
+
+def end_trial(iter_num=None):
+    '''
+    Marks the end of the processing of a combination, with the trial number
+    it was assigned (None if it failed)
+    '''
+    if not _STATE.enabled:
+        return
+    seconds = time.perf_counter() - _STATE.trial_start
+
+    # Dump the profile of trials that passed
+    if _STATE.profiler is not None:
+        _STATE.profiler.disable()
+        if iter_num is not None:
+            _STATE.profiler.dump_stats(get_profile_path(_STATE.profile_dir, iter_num))
+        _STATE.profiler = None
+
+    for record in _STATE.records[_STATE.trial_index:]:
+        record['ITER'] = iter_num
+    _STATE.records.append({'COMBO_NUM': _STATE.combo_num,
+                           'ITER': iter_num,
+                           'stage': 'trial',
+                           'function': 'total',
+                           'seconds': seconds,
+                           'bytes': None,
+                           'cache_hit': None})
+    _STATE.combo_num = None
+
+
+def drain_records():
+    '''
+    Returns and clears the records of this process
+    '''
+    records = _STATE.records
+    _STATE.records = []
+    return records
+
+
+#%% AGGREGATION
+def summarize_timing(df_records):
+    '''
+    Aggregates the records of each function of each stage: number of calls,
+    total/mean/p50/p95/max wall time, bytes written, and cache hits
+    '''
+    if df_records.empty:
+        return pd.DataFrame()
+
+    df_records = df_records.assign(
+        bytes = df_records['bytes'].fillna(0),
+        cache_hit = df_records['cache_hit'].astype(object).eq(True))
+    groups = df_records.groupby(['stage','function'], sort=False)
+    summary = groups['seconds'].agg(count = 'count',
+                                    total_s = 'sum',
+                                    mean_s = 'mean',
+                                    p50_s = lambda s: s.quantile(0.50),
+                                    p95_s = lambda s: s.quantile(0.95),
+                                    max_s = 'max')
+    summary['bytes'] = groups['bytes'].sum().astype('int64')
+    summary['cache_hits'] = groups['cache_hit'].sum().astype('int64')
+    return summary.reset_index()
+
+
+class TimingCollector:
+    '''
+    Collects the records of all processes in the main process, streaming them
+    out to `{name}_timing_trials.parquet`, and keeps the cProfile dumps of
+    only the `profile_slowest` slowest trials in `{name}_profiles`. On close,
+    the aggregate table is written to `{name}_timing_summary.csv`.
+
+    The running total time of each stage is kept in `stage_totals`. If
+    `write` is False, that is ALL that is kept (ie- for the progress line).
+    The files are written to `base_path` (default `is`) and named by `name`
+    (default `name`).
+    '''
+    def __init__(self, profile_slowest=0, flush_every=1000, write=True,
+                 base_path=None, name=None):
+        base_path = base_path or get_env('is')
+        name = name or get_env('name')
+        self.stage_totals = {}
+        self.writer = None
+        if write:
+            self.writer = SummaryWriter(os.path.join(base_path,f'{name}_timing_trials'),
+                                        ['parquet'],
+                                        flush_every = flush_every)
+        self.summary_path = os.path.join(base_path,f'{name}_timing_summary.csv')
+
+        self.profile_slowest = profile_slowest
+        self.profile_dir = None
+        self.slowest = []
+        if profile_slowest:
+            self.profile_dir = os.path.join(base_path,f'{name}_profiles')
+            os.makedirs(self.profile_dir, exist_ok=True)
+
+    def collect(self, records):
+        for record in records:
+            if record['stage'] != 'trial':
+                self.stage_totals[record['stage']] = self.stage_totals.get(record['stage'], 0.0) + record['seconds']
+        if self.writer is not None:
+            self.writer.extend(records)
+        if not self.profile_dir:
+            return
+
+        # Keep the profiles of the slowest trials only
+        for record in records:
+            if record['stage'] == 'trial' and record['ITER'] is not None:
+                heapq.heappush(self.slowest, (record['seconds'], record['ITER']))
+                if len(self.slowest) > self.profile_slowest:
+                    _, iter_num = heapq.heappop(self.slowest)
+                    profile_path = get_profile_path(self.profile_dir, iter_num)
+                    if os.path.exists(profile_path):
+                        os.remove(profile_path)
+
+    def close(self):
+        '''
+        Returns:
+        - summary (DataFrame/None): aggregate timing of each function
+        '''
+        if self.writer is None:
+            return None
+        summary = summarize_timing(self.writer.close())
+        summary.to_csv(self.summary_path, index=False)
+
+        logger.info('\nTIMING SUMMARY')
+        if not summary.empty:
+            logger.info(summary.to_string(index=False, float_format=lambda x: f'{x:.4f}'))
+        logger.info(f'Timing summary saved to: {self.summary_path}')
+        if self.profile_dir:
+            logger.info(f'Profiles of the {len(self.slowest)} slowest trials saved to: {self.profile_dir}')
+        return summary
@@ -0,0 +1,236 @@
+import os
+import json
+import hashlib
+import numpy as np
+import xarray as xr
+
+from ..setup_paths_envs import get_key_dirs, get_env
+from ..log_tools import logger
+
+
+'''
+Append-only journal of the combinations completed by `process_design_matrix`,
+such that an interrupted generation run can be resumed. Each line is a JSON
+record of either:
+    - a PASSED combination: COMBO_NUM, ITER, the hash of the combination's
+        design matrix parameters, the content hash of its final parameters
+        (after the load sets and dependency functions, see `hash_content`),
+        the hash of its final attributes, the attributes themselves (for the
+        summary), and the size of every file written for it
+    - a FAILED combination: COMBO_NUM, the hash of the combination's design
+        matrix parameters, and the failed parameters (for the summary)
+
+A record is only written once all the files of a trial have been written, so
+a trial cut off midway is simply redone. On resume, every combination is
+evaluated again (load sets, dependency functions, and filters), and a PASSED
+trial is only reused if the content hash of its final parameters is
+unchanged, such that trials made stale by a changed dependency function or
+load set are redone rather than rebuilt from the journal. A record cut off midway (the last
+line) is dropped from the file before appending to it, and PASSED records
+whose attributes do not match their hash are ignored.
+'''
+
+
+def _to_json(value):
+    '''
+    Converts numpy scalars for JSON
+    '''
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def hash_var_dict(var_dict):
+    '''
+    Content hash of the strings/numbers of a dictionary of FUNWAVE parameters
+    '''
+    content = {k: v for k, v in var_dict.items()
+               if isinstance(v, (str, int, float, np.integer, np.floating))}
+    text = json.dumps(content, sort_keys=True, default=_to_json)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def hash_content(var_dict):
+    '''
+    Content hash of the final FUNWAVE parameters of a trial: its
+    strings/numbers, and the variables and attributes of any Datasets (ie-
+    DomainObject, WK_TIME_SERIES)
+    '''
+    sha = hashlib.sha1(hash_var_dict(var_dict).encode())
+    for name in sorted(k for k, v in var_dict.items() if isinstance(v, xr.Dataset)):
+        ds = var_dict[name]
+        sha.update(str(name).encode())
+        for var_name in sorted(ds.variables, key=str):
+            variable = ds.variables[var_name]
+            sha.update(f'{var_name}{variable.dims}{variable.dtype}'.encode())
+            sha.update(np.ascontiguousarray(variable.values).tobytes())
+        sha.update(json.dumps(ds.attrs, sort_keys=True, default=_to_json).encode())
+    return sha.hexdigest()
+
+
+def _truncate_partial_line(path):
+    '''
+    Truncates a file after its last newline, dropping a partially written
+    last line (if any)
+    '''
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(position - 4096, 0)
+            f.seek(start)
+            i_newline = f.read(position - start).rfind(b'\n')
+            if i_newline >= 0:
+                position = start + i_newline + 1
+                break
+            position = start
+        if position < end:
+            f.truncate(position)
+            logger.info(f'Dropped a partially written record from the journal: {path}')
+
+
+def _restore_attrs(entry):
+    '''
+    Restores the numpy types of the attributes of a PASSED record
+    '''
+    attrs = entry['attrs']
+    for key, dtype in entry.get('dtypes', {}).items():
+        attrs[key] = np.dtype(dtype).type(attrs[key])
+    return attrs
+
+
+class TrialJournal:
+
+    ## INITIALIZE =============================================================
+    def __init__(self, path, resume=False, append=False, store=None):
+        '''
+        Arguments:
+        - path (str): path to the journal file
+        - resume (bool): if True, read in the records of an existing journal
+            and append to it. Otherwise, start a new journal.
+        - append (bool): if True, append to an existing journal without
+            reading in its records
+        - store (EnsembleStore/None): ensemble store the NetCDF data of the
+            trials is in, if not in the trial NetCDFs
+        '''
+        self.path = path
+        self.entries = {}
+        self.store = store
+
+        # Records are appended after the last complete line
+        if (resume or append) and os.path.exists(path):
+            _truncate_partial_line(path)
+
+        if resume and os.path.exists(path):
+            n_corrupt = 0
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        n_corrupt = n_corrupt + 1
+                        continue
+                    if 'attrs' in entry:
+                        entry['attrs'] = _restore_attrs(entry)
+                        if entry.get('hash') != hash_var_dict(entry['attrs']):
+                            n_corrupt = n_corrupt + 1
+                            continue
+                    self.entries[entry['COMBO_NUM']] = entry
+            if n_corrupt:
+                logger.warning(f'Warning: ignoring {n_corrupt} corrupt journal records, they will be redone')
+            logger.info(f'Resuming from journal with {len(self.entries)} records: {path}')
+
+        self.file = open(path, 'a' if (resume or append) else 'w')
+    ## [END] INITIALIZE =======================================================
+
+
+    ## LOOKUP =================================================================
+    def lookup(self, combo_num, var_dict):
+        '''
+        Finds the record of a combination with matching design matrix
+        parameters, if any.
+
+        Returns:
+        - entry (dictionary/None): record of the combination
+        '''
+        entry = self.entries.get(combo_num)
+        if entry is None or entry['input_hash'] != hash_var_dict(var_dict):
+            return None
+        return entry
+
+    def is_complete(self, entry, iter_num):
+        '''
+        Checks that a PASSED record has the expected trial number, that all
+        of its files still exist with the recorded sizes, and that it is in
+        the ensemble store (if any). See also `is_current`.
+        '''
+        if entry['ITER'] != iter_num:
+            return False
+        if self.store is not None and iter_num not in self.store:
+            return False
+        for file_path, size in entry['files'].items():
+            if not os.path.isfile(file_path) or os.path.getsize(file_path) != size:
+                return False
+        return True
+
+    def is_current(self, entry, var_dict):
+        '''
+        Checks that the final parameters of a combination (after the load
+        sets and dependency functions) are those of its PASSED record
+        '''
+        return entry.get('var_hash') == hash_content(var_dict)
+    ## [END] LOOKUP ===========================================================
+
+
+    ## RECORD =================================================================
+    def _write(self, entry):
+        self.file.write(json.dumps(entry, default=_to_json) + '\n')
+        self.file.flush()
+        self.entries[entry['COMBO_NUM']] = entry
+
+    def record_pass(self, combo_num, var_dict, attrs, var_hash):
+        '''
+        Record a trial once all of its files have been written, with the
+        content hash of its final parameters `var_hash` (see `hash_content`)
+        '''
+        iter_num = int(attrs['ITER'])
+        ptr = get_key_dirs(tri_num=iter_num)
+
+        # All files written for the trial
+        file_paths = {ptr[key] for key in ['in', 'nc'] if key in ptr}
+        file_paths.update(v for v in attrs.values()
+                          if isinstance(v, str) and os.path.isfile(v))
+        files = {p: os.path.getsize(p) for p in sorted(file_paths) if os.path.isfile(p)}
+
+        # numpy types of the attributes, since JSON only keeps the values
+        dtypes = {key: np.asarray(value).dtype.str for key, value in attrs.items()
+                  if isinstance(value, np.generic)}
+
+        self._write({'COMBO_NUM': combo_num,
+                     'ITER': iter_num,
+                     'input_hash': hash_var_dict(var_dict),
+                     'var_hash': var_hash,
+                     'hash': hash_var_dict(attrs),
+                     'files': files,
+                     'attrs': dict(attrs),
+                     'dtypes': dtypes})
+
+    def record_fail(self, combo_num, var_dict, failed_params):
+        '''
+        Record a combination that failed the filters
+        '''
+        self._write({'COMBO_NUM': combo_num,
+                     'input_hash': hash_var_dict(var_dict),
+                     'failed': failed_params})
+
+    def close(self):
+        self.file.close()
+    ## [END] RECORD ===========================================================
+
+
+
+def get_journal_path():
+    '''
+    Path to the journal, alongside the input summary
+    '''
+    return os.path.join(get_env('is'), f"{get_env('name')}_journal.jsonl")
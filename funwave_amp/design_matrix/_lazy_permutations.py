@@ -0,0 +1,251 @@
+import numpy as np
+import pandas as pd
+
+
+'''
+The LazyPermutations object represents the cartesian product of all the
+parameter ranges in a design matrix WITHOUT ever building it. Each combination
+is identified by its (0-based) combination index, which is decoded into the
+value of each parameter by mixed-radix decoding, where the radix of each
+"digit" is the number of values that parameter assumes. The ordering is
+identical to that of `itertools.product`, such that the last parameter varies
+the fastest and combination indices match the rows of the DataFrame version.
+
+Internally, the product is made up of FACTORS, each a contiguous span of
+parameters with a table of the allowed digits of those parameters. Initially
+every parameter is its own factor allowing all of its values. When a span of
+parameters is pruned (see `restrict_span`), its factor only holds the
+surviving sub-combinations, in order, such that enumerating the product of
+the factors still visits the surviving combinations in combination index
+order. Positions (0 to len-1) refer to the surviving combinations, while
+combination indices always refer to the FULL cartesian product.
+'''
+
+
+class LazyPermutations:
+
+    ## INITIALIZE =============================================================
+    def __init__(self, param_ranges):
+        '''
+        Arguments:
+        - param_ranges (dictionary): keys of FUNWAVE parameters, and values of
+            a list of every value that parameter assumes
+        '''
+        self.param_ranges = {name: list(values)
+                             for name, values in param_ranges.items()}
+        self.names = list(self.param_ranges.keys())
+        self.radices = [len(values) for values in self.param_ranges.values()]
+
+        # Strides of each digit in the full product
+        self.strides = [1] * len(self.radices)
+        for j in range(len(self.radices) - 2, -1, -1):
+            self.strides[j] = self.strides[j + 1] * self.radices[j + 1]
+
+        # Factors: (first parameter, last parameter + 1, table of digits)
+        self.factors = [(j, j + 1, np.arange(radix, dtype=np.int64)[:, None])
+                        for j, radix in enumerate(self.radices)]
+    ## [END] INITIALIZE =======================================================
+
+
+    ## SIZE/ACCESS ============================================================
+    @property
+    def columns(self):
+        '''
+        Names of the parameters, analogous to `DataFrame.columns`
+        '''
+        return self.names
+
+    @property
+    def n_full(self):
+        '''
+        Number of combinations in the full (unpruned) cartesian product
+        '''
+        n = 1
+        for radix in self.radices:
+            n = n * radix
+        return n
+
+    def __len__(self):
+        n = 1
+        for _, _, table in self.factors:
+            n = n * len(table)
+        return n
+
+    def decode(self, combo_index):
+        '''
+        Mixed-radix decoding of a combination index into the index of the value
+        taken by each parameter
+        '''
+        digits = [0] * len(self.radices)
+        for j in range(len(self.radices) - 1, -1, -1):
+            combo_index, digits[j] = divmod(combo_index, self.radices[j])
+        return digits
+
+    def encode(self, digits):
+        '''
+        Inverse of `decode`: index of the value taken by each parameter into
+        a combination index
+        '''
+        return sum(int(d) * s for d, s in zip(digits, self.strides))
+
+    def position_digits(self, position):
+        '''
+        Decodes a position among the surviving combinations into the index of
+        the value taken by each parameter
+        '''
+        digits = [0] * len(self.radices)
+        for first, last, table in reversed(self.factors):
+            position, row = divmod(position, len(table))
+            digits[first:last] = table[row].tolist()
+        return digits
+
+    def combo_index(self, position):
+        '''
+        Combination index (in the full product) of a position
+        '''
+        return self.encode(self.position_digits(position))
+
+    def __getitem__(self, position):
+        '''
+        Random access to a single combination by position. Without pruning,
+        the position IS the combination index.
+        '''
+        n = len(self)
+        if position < 0:
+            position = position + n
+        if not 0 <= position < n:
+            raise IndexError(f'Position {position} out of range for {n} combinations')
+
+        digits = self.position_digits(position)
+        return {name: self.param_ranges[name][d]
+                for name, d in zip(self.names, digits)}
+
+    def combination(self, combo_index):
+        '''
+        Dictionary of parameters of a combination index (in the full product)
+        '''
+        digits = self.decode(combo_index)
+        return {name: self.param_ranges[name][d]
+                for name, d in zip(self.names, digits)}
+    ## [END] SIZE/ACCESS ======================================================
+
+
+    ## PRUNING ================================================================
+    def restrict_span(self, first, last, table):
+        '''
+        Replaces all factors within parameters [first, last) by a single
+        factor that only allows the rows of `table`, an (n, last-first) array
+        of digits. The table is sorted such that the order of the combinations
+        is preserved.
+        '''
+        # Factors must not straddle the span
+        if any(f < first < l or f < last < l for f, l, _ in self.factors):
+            raise ValueError(f'Span [{first},{last}) straddles an existing factor')
+
+        # Sort lexicographically, last column varies fastest
+        table = np.asarray(table, dtype=np.int64).reshape(-1, last - first)
+        if len(table):
+            table = table[np.lexsort(table.T[::-1])]
+
+        kept = [factor for factor in self.factors
+                if factor[1] <= first or factor[0] >= last]
+        kept.append((first, last, table))
+        self.factors = sorted(kept, key=lambda factor: factor[0])
+        return
+
+    def span_digits(self, first, last):
+        '''
+        Table of digits of the sub-product of parameters [first, last),
+        respecting any restrictions already applied within the span
+        '''
+        tables = [table for f, l, table in self.factors if first <= f and l <= last]
+        if not tables:
+            return np.zeros((1, 0), dtype=np.int64)
+        rows = np.indices([len(table) for table in tables]).reshape(len(tables), -1)
+        return np.hstack([table[row] for table, row in zip(tables, rows)])
+    ## [END] PRUNING ==========================================================
+
+
+    ## ITERATION ==============================================================
+    def __iter__(self):
+        for _, var_dict in self.iterrows():
+            yield var_dict
+
+    def iterrows(self, start=0, stop=None):
+        '''
+        Yields (combination index, dictionary of parameters) for each
+        position in [start, stop), analogous to `DataFrame.iterrows`
+        '''
+        if stop is None:
+            stop = len(self)
+        for position in range(start, stop):
+            digits = self.position_digits(position)
+            yield self.encode(digits), {name: self.param_ranges[name][d]
+                                        for name, d in zip(self.names, digits)}
+
+    def get_chunk(self, start, stop):
+        '''
+        Builds a DataFrame of the combinations at positions [start, stop),
+        indexed by combination index. Decoding is done on the whole chunk at
+        once.
+        '''
+        stop = min(stop, len(self))
+        remainder = np.arange(start, stop, dtype=np.int64)
+
+        # Decode all positions at once, last factor varies fastest
+        digits = np.zeros((len(remainder), len(self.names)), dtype=np.int64)
+        for first, last, table in reversed(self.factors):
+            remainder, rows = np.divmod(remainder, len(table))
+            digits[:, first:last] = table[rows]
+
+        # Look up values, and the combination index of each row
+        columns = {name: pd.Series(self.param_ranges[name]).take(digits[:, j]).to_numpy()
+                   for j, name in enumerate(self.names)}
+        combo_index = digits @ np.asarray(self.strides, dtype=np.int64)
+
+        return pd.DataFrame(columns, index=combo_index)
+
+    def iter_chunks(self, chunk_size, start=0, stop=None):
+        '''
+        Yields DataFrames of at most `chunk_size` combinations at a time
+        '''
+        if stop is None:
+            stop = len(self)
+        for chunk_start in range(start, stop, chunk_size):
+            yield self.get_chunk(chunk_start, min(chunk_start + chunk_size, stop))
+
+    def to_dataframe(self):
+        '''
+        Materializes the full cartesian product. Only use for small matrices!
+        '''
+        return self.get_chunk(0, len(self))
+    ## [END] ITERATION ========================================================
+
+
+
+def iter_permutation_dicts(permutations, start=0, stop=None):
+    '''
+    Yields (combination index, dictionary of parameters) for either a
+    DataFrame of permutations or a LazyPermutations object, for positions
+    [start, stop)
+    '''
+    if isinstance(permutations, LazyPermutations):
+        yield from permutations.iterrows(start, stop)
+    else:
+        for perm_i, row in permutations.iloc[start:stop].iterrows():
+            yield perm_i, row.to_dict()
+
+
+def iter_permutation_chunks(permutations, chunk_size, start=0, stop=None):
+    '''
+    Yields DataFrames of at most `chunk_size` combinations, indexed by
+    combination index, for either a DataFrame of permutations or a
+    LazyPermutations object, for positions [start, stop)
+    '''
+    if stop is None:
+        stop = len(permutations)
+    if isinstance(permutations, LazyPermutations):
+        yield from permutations.iter_chunks(chunk_size, start, stop)
+    else:
+        for chunk_start in range(start, stop, chunk_size):
+            yield permutations.iloc[chunk_start:min(chunk_start + chunk_size, stop)]
@@ -3,9 +3,13 @@ import pandas as pd
 from itertools import product
 import xarray as xr
 import os
+import pyarrow as pa
+import pyarrow.parquet as pq
 ## NOTE: These must be here for compatibility reasons
 from netCDF4 import Dataset
 import h5py
+from ..setup_paths_envs import get_env
+from ..log_tools import logger
 
 #%% SUMMARY FILES FROM GENERATION
 def make_pass_parquet(summary_data,p):
@@ -38,30 +42,255 @@ def make_fail_parquet(fail_data,p):
         return merged_df
     
 
+#%% STREAMING SUMMARIES
+def _conform(table, schema):
+    '''
+    Casts a table to a schema, filling columns it does not have with nulls
+    '''
+    arrays = []
+    for field in schema:
+        if field.name in table.column_names:
+            arrays.append(table[field.name].cast(field.type))
+        else:
+            arrays.append(pa.nulls(len(table), field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+class SummaryWriter:
+    '''
+    Incremental writer of a summary (one row per trial/failed combination).
+    Rows are held in memory only until `flush_every` have accumulated, and
+    are then written as a row group of a Parquet file. The schema is set by
+    the first row group; should a later row group have new columns (or need
+    a wider type), the rows already written are rewritten with the promoted
+    schema.
+
+    The Parquet file is only valid once the writer is closed, so it is
+    written to `<path>.partial` and moved into place by `close`. The CSV is
+    streamed out of the finished Parquet file, one row group at a time.
+
+    `append`/`extend` match a list, such that a writer can be passed
+    anywhere a list of summary rows was before.
+
+    If `append_existing` is True, the rows of an existing summary are copied
+    over first (one row group at a time), such that new rows are added on.
+    '''
+
+    ## INITIALIZE =============================================================
+    def __init__(self, path_base, summary_formats, flush_every=100, sort_by=None,
+                 append_existing=False):
+        '''
+        Arguments:
+        - path_base (str): path of the summary without extension
+        - summary_formats (list): any of 'parquet' and 'csv'
+        - flush_every (int): number of rows per row group
+        - sort_by (str/None): column the finished summary must be sorted by,
+            only re-sorted if rows arrived out of order
+        - append_existing (bool): add on to an existing summary
+        '''
+        self.parquet_path = f'{path_base}.parquet'
+        self.csv_path = f'{path_base}.csv'
+        self.partial_path = f'{self.parquet_path}.partial'
+        self.summary_formats = summary_formats
+        self.flush_every = flush_every
+        self.sort_by = sort_by
+
+        self.rows = []
+        self.n_written = 0
+        self.schema = None
+        self.writer = None
+        self.is_sorted = True
+        self.last_key = None
+
+        if append_existing and os.path.exists(self.parquet_path):
+            self._copy_existing()
+
+    def _copy_existing(self):
+        '''
+        Starts the summary with the row groups of the existing one
+        '''
+        existing = pq.ParquetFile(self.parquet_path)
+        schema = existing.schema_arrow.remove_metadata()
+        if not len(schema):
+            return
+        self.schema = schema
+        self.writer = pq.ParquetWriter(self.partial_path, self.schema)
+        for batch in existing.iter_batches(batch_size=self.flush_every):
+            table = pa.Table.from_batches([batch]).replace_schema_metadata(None)
+            self.writer.write_table(_conform(table, self.schema))
+            self.n_written = self.n_written + len(table)
+        logger.info(f'Appending to existing summary with {self.n_written} rows: {self.parquet_path}')
+    ## [END] INITIALIZE =======================================================
+
+
+    ## ROWS ===================================================================
+    def __len__(self):
+        return self.n_written + len(self.rows)
+
+    def append(self, row):
+        # Keep track of whether rows arrive in order
+        if self.sort_by is not None and self.sort_by in row:
+            key = row[self.sort_by]
+            if self.last_key is not None and key < self.last_key:
+                self.is_sorted = False
+            self.last_key = key
+
+        self.rows.append(dict(row))
+        if len(self.rows) >= self.flush_every:
+            self.flush()
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+    ## [END] ROWS =============================================================
+
+
+    ## WRITING ================================================================
+    def flush(self):
+        '''
+        Writes the rows held in memory as a row group
+        '''
+        if not self.rows:
+            return
+        table = pa.Table.from_pandas(pd.DataFrame(self.rows), preserve_index=False)
+        self.rows = []
+        self._write(table)
+
+    def write_table(self, table):
+        '''
+        Writes an Arrow table of rows (ie- from another summary) as-is,
+        after any rows held in memory
+        '''
+        self.flush()
+        if self.sort_by is not None and self.sort_by in table.column_names:
+            keys = [key for key in table[self.sort_by].to_pylist() if key is not None]
+            if keys and (keys != sorted(keys) or
+                         (self.last_key is not None and keys[0] < self.last_key)):
+                self.is_sorted = False
+            if keys:
+                self.last_key = keys[-1]
+        if len(table):
+            self._write(table)
+
+    def _write(self, table):
+        table = table.replace_schema_metadata(None)
+
+        # First row group sets the schema
+        if self.writer is None:
+            self.schema = table.schema
+            self.writer = pq.ParquetWriter(self.partial_path, self.schema)
+        # Promote the schema if needed
+        else:
+            schema = pa.unify_schemas([self.schema, table.schema],
+                                      promote_options='permissive')
+            if not schema.equals(self.schema):
+                self._promote(schema)
+
+        self.writer.write_table(_conform(table, self.schema))
+        self.n_written = self.n_written + len(table)
+
+    def _promote(self, schema):
+        '''
+        Rewrites the row groups already written with a promoted schema
+        '''
+        logger.debug(f'\tPromoting summary schema of: {self.parquet_path}')
+        self.writer.close()
+        tmp_path = f'{self.partial_path}.tmp'
+        writer = pq.ParquetWriter(tmp_path, schema)
+        for batch in pq.ParquetFile(self.partial_path).iter_batches():
+            writer.write_table(_conform(pa.Table.from_batches([batch]), schema))
+        os.replace(tmp_path, self.partial_path)
+        self.writer = writer
+        self.schema = schema
+
+    def close(self):
+        '''
+        Finalizes the summary files, including after an interruption.
+
+        Returns:
+        - df (DataFrame): the full summary
+        '''
+        self.flush()
+        if self.writer is None:
+            pd.DataFrame().to_parquet(self.partial_path)
+        else:
+            self.writer.close()
+            self.writer = None
+
+        # Re-sort if rows arrived out of order
+        if not self.is_sorted:
+            table = pq.read_table(self.partial_path).sort_by(self.sort_by)
+            pq.write_table(table, self.partial_path)
+
+        # Stream out the CSV
+        if 'csv' in self.summary_formats:
+            parquet_file = pq.ParquetFile(self.partial_path)
+            with open(self.csv_path, 'w', newline='') as f:
+                header = True
+                for batch in parquet_file.iter_batches():
+                    batch.to_pandas().to_csv(f, index=False, header=header)
+                    header = False
+                if header:
+                    pd.DataFrame(columns=parquet_file.schema_arrow.names).to_csv(f, index=False)
+
+        df = pd.read_parquet(self.partial_path)
+        if 'parquet' in self.summary_formats:
+            os.replace(self.partial_path, self.parquet_path)
+        else:
+            os.remove(self.partial_path)
+        return df
+    ## [END] WRITING ==========================================================
+
+
+
+def get_summary_writers(summary_formats, flush_every=100, append=False):
+    '''
+    Streaming writers for the input (pass) and failure summaries, adding on
+    to the existing summaries if `append`
+    '''
+    base_path = get_env('is')
+    name = get_env('name')
+    pass_writer = SummaryWriter(os.path.join(base_path,f'{name}_input_summary'),
+                                summary_formats,
+                                flush_every = flush_every,
+                                append_existing = append)
+    fail_writer = SummaryWriter(os.path.join(base_path,f'{name}_failure_summary'),
+                                summary_formats,
+                                flush_every = flush_every,
+                                sort_by = 'COMBO_NUM',
+                                append_existing = append)
+    return pass_writer, fail_writer
+
+
+def get_summary_offsets():
+    '''
+    Largest ITER and COMBO_NUM in the existing input/failure summaries, such
+    that new trials can be numbered after them (0 if there are none)
+    '''
+    base_path = get_env('is')
+    name = get_env('name')
+    offsets = {'ITER': 0, 'COMBO_NUM': 0}
+    for kind in ['input', 'failure']:
+        path = os.path.join(base_path,f'{name}_{kind}_summary.parquet')
+        if not os.path.exists(path):
+            continue
+        names = pq.ParquetFile(path).schema_arrow.names
+        for column in offsets:
+            if column in names:
+                values = pd.read_parquet(path, columns=[column])[column].dropna()
+                if len(values):
+                    offsets[column] = max(offsets[column], int(values.max()))
+    return offsets['ITER'], offsets['COMBO_NUM']
+
+
 #%% Main function
 
 def save_out_summary(success_dict,fail_dict,summary_formats):
-    # Pass data
-    df_pass = pd.DataFrame(success_dict)
-    # Failure data
-    df_fail = pd.DataFrame(fail_dict)
-
-    # File Paths
-    base_path = os.getenv('is')
-    name = os.getenv('name')
-
-    # Save out as parquet
-    if 'parquet' in summary_formats:
-        pass_name = f'{name}_input_summary.parquet'
-        fail_name = f'{name}_failure_summary.parquet'
-        df_pass.to_parquet(os.path.join(base_path,pass_name))
-        df_fail.to_parquet(os.path.join(base_path,fail_name))
-
-    if 'csv' in summary_formats:
-        pass_name = f'{name}_input_summary.csv'
-        fail_name = f'{name}_failure_summary.csv'
-        df_pass.to_csv(os.path.join(base_path,pass_name), index=False)
-        df_fail.to_csv(os.path.join(base_path,fail_name), index=False)
-
-
-    return df_pass,df_fail
+    '''
+    Saves out the summaries of a list of passing trials and a list of failed
+    combinations all at once
+    '''
+    pass_writer, fail_writer = get_summary_writers(summary_formats)
+    pass_writer.extend(success_dict)
+    fail_writer.extend(fail_dict)
+    return pass_writer.close(), fail_writer.close()
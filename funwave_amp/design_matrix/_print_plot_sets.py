@@ -7,6 +7,9 @@ import os
 from netCDF4 import Dataset
 import h5py
 
+from ._instrumentation import timed, file_bytes
+from ..log_tools import logger
+
     
 def print_supporting_file(var_dict,functions_to_apply):
     '''
@@ -21,14 +24,16 @@ def print_supporting_file(var_dict,functions_to_apply):
     '''
 
     print_path_vars = {}
-    print('\nApplying PRINT functions')
+    logger.debug('\nApplying PRINT functions')
     for func in functions_to_apply:
-        print(f'\tApplying PRINT function: {func.__name__}')
-        print_paths = func(var_dict)
+        logger.debug(f'\tApplying PRINT function: {func.__name__}')
+        with timed('print', func.__name__) as record:
+            print_paths = func(var_dict)
+            record['bytes'] = file_bytes(print_paths.values())
         # Merge path variables back into input
         print_path_vars.update(print_paths)
         var_dict = {**var_dict, **print_path_vars}
-    print('All PRINT functions completed successfully!')
+    logger.debug('All PRINT functions completed successfully!')
     return var_dict
 
 
@@ -42,11 +47,12 @@ def plot_supporting_file(var_dict,
     - functions_to_apply (list): list of plot functions
     '''
 
-    print('\nApplying PLOT functions')
+    logger.debug('\nApplying PLOT functions')
     for func in functions_to_apply:
-        print(f'\tApplying PLOT function: {func.__name__}')
-        func(var_dict)
-    print('All PLOT functions completed successfully!')
+        logger.debug(f'\tApplying PLOT function: {func.__name__}')
+        with timed('plot', func.__name__):
+            func(var_dict)
+    logger.debug('All PLOT functions completed successfully!')
     
     return
 
@@ -0,0 +1,97 @@
+# Inner module imports
+from ._add_params import add_dependent_values,add_required_params
+from ._apply_filters import apply_filters
+from ._vectorized_pipeline import VectorizedFailure
+from ._print_plot_sets import print_supporting_file, plot_supporting_file
+from ._instrumentation import timed, file_bytes
+
+# Outer module imports
+from ..print_files import print_input_dot_text
+from ..xarray_obj import get_net_cdf
+from ..setup_paths_envs import get_key_dirs, get_path_resolver
+
+
+'''
+Work done on a single combination of the design matrix. These are shared by
+the serial and parallel versions of `process_design_matrix` so that both
+produce identical trials.
+'''
+
+def evaluate_combination(var_dict,
+                         load_vars = None,
+                         function_set = None,
+                         filter_sets = None):
+    '''
+    Merges a combination with the load set, adds on the dependent parameters,
+    and applies the filters. Combinations that already failed the vectorized
+    filters (see `VectorizedFailure`) are not evaluated again.
+
+    Returns:
+    - var_dict (dictionary): dictionary of FUNWAVE parameters, with dependent
+        parameters added on
+    - failed_params (dictionary/None): failed parameters, None if passed
+    '''
+    if isinstance(var_dict, VectorizedFailure):
+        return var_dict, dict(var_dict.failed_params)
+
+    # Merge with load set
+    if load_vars:
+        var_dict = {**var_dict, **load_vars}
+
+    ## Add on dependent parameters
+    var_dict = add_dependent_values(var_dict,function_set)
+
+    ## Filtering conditions
+    failed_params = apply_filters(var_dict,filter_sets)
+
+    return var_dict, failed_params
+
+
+def build_trial(var_dict,
+                iter_num,
+                combo_num,
+                print_inputs = True,
+                print_sets = None,
+                plot_sets = None,
+                resolver = None,
+                store = None,
+                nc_options = None):
+    '''
+    Creates all the files for a combination that passed the filters and has
+    been assigned the trial number `iter_num`. Paths are resolved with
+    `resolver`, or the active resolver (see `set_path_resolver`). If `store`
+    is given (an EnsembleStore, or a list), the NetCDF data is appended to it
+    rather than written to the trial NetCDF. `nc_options` are passed on to
+    `get_net_cdf` (ie- `implicit_coords`, `encoding`).
+
+    Returns:
+    - attrs (dictionary): attributes of the trial NetCDF, for the summary
+    '''
+    if resolver is None:
+        resolver = get_path_resolver()
+    resolver.make_trial_dirs(iter_num)
+
+    ##  Add on required parameters
+    var_dict = add_required_params(var_dict,iter_num,combo_num,resolver=resolver)
+
+    # Create files other than input.txt
+    if print_sets:
+        var_dict = print_supporting_file(var_dict,print_sets)
+
+    # Output plots for visualization of input
+    if plot_sets:
+        plot_supporting_file(var_dict,plot_sets)
+
+    # Create xarray
+    ptr = get_key_dirs(tri_num = iter_num, resolver = resolver)
+    with timed('netcdf', 'get_net_cdf') as record:
+        ds = get_net_cdf(var_dict, resolver=resolver, store=store, **(nc_options or {}))
+        record['bytes'] = file_bytes([ptr['nc']])
+
+    ## Print `input.txt` for this given trial
+    if print_inputs:
+        with timed('input', 'print_input_dot_text') as record:
+            print_input_dot_text(ds.attrs, resolver=resolver)
+            record['bytes'] = file_bytes([ptr['in']])
+
+    return ds.attrs
@@ -0,0 +1,121 @@
+import numpy as np
+
+from ._apply_filters import get_filter_params, is_vectorized_filter
+from ._lazy_permutations import LazyPermutations
+from ..log_tools import logger
+
+
+'''
+Constraint-propagating pruning of the cartesian product BEFORE enumeration.
+
+Filters that declare the parameters they read (see `filter_params`) are
+evaluated once on the sub-product of just those parameters. The span of
+parameters covered by the filter (from the first to the last declared
+parameter, in design matrix order) is then restricted to the surviving
+sub-combinations, such that the rejected ones are never enumerated, while the
+order of the remaining combinations (and thus COMBO_NUM/ITER) is unchanged.
+Filters whose spans overlap are pruned together.
+'''
+
+
+def _evaluate_on_sub_product(func, permutations):
+    '''
+    Evaluates a filter on the sub-product of its declared parameters
+
+    Returns:
+    - sub (LazyPermutations): the sub-product
+    - df_sub (DataFrame): the sub-product as a DataFrame
+    - passed (np.ndarray): boolean array, True where the filter passed
+    '''
+    params = get_filter_params(func)
+    sub = LazyPermutations({p: permutations.param_ranges[p] for p in params})
+    df_sub = sub.to_dataframe()
+
+    if is_vectorized_filter(func):
+        passed = np.asarray(func(df_sub), dtype=bool)
+        passed = np.broadcast_to(passed, (len(df_sub),)).copy()
+    else:
+        passed = np.array([bool(func(var_dict)) for var_dict in sub], dtype=bool)
+    return sub, df_sub, passed
+
+
+def prune_permutations(permutations,
+                       filter_sets,
+                       fail_data,
+                       max_span_size = 1_000_000):
+    '''
+    Prunes a LazyPermutations object (in place) with the filters that declare
+    the parameters they read.
+
+    Arguments:
+    - permutations (LazyPermutations): combinations to prune
+    - filter_sets (list): filter functions, any without declared parameters
+        are ignored
+    - fail_data (list): a record of each rejected sub-combination is appended
+        here, with `failed_checks` and `N_PRUNED`, the number of combinations
+        it removed (not already removed by an earlier filter), such that the
+        N_PRUNED of all records sum to the number of combinations pruned
+    - max_span_size (int): spans whose sub-product is larger than this are
+        not pruned, and their filters are applied as usual instead
+
+    Returns:
+    - remaining_filters (list): filters that were NOT used for pruning
+    '''
+    names = permutations.names
+    remaining_filters = []
+
+    # Spans of each filter with declared design matrix parameters
+    spans = []
+    for func in filter_sets:
+        params = get_filter_params(func)
+        if not params or not all(p in names for p in params):
+            remaining_filters.append(func)
+            continue
+        j = [names.index(p) for p in params]
+        spans.append([min(j), max(j) + 1, [func]])
+
+    # Merge overlapping spans
+    merged = []
+    for first, last, funcs in sorted(spans, key=lambda span: span[0]):
+        if merged and first < merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], last)
+            merged[-1][2].extend(funcs)
+        else:
+            merged.append([first, last, funcs])
+
+    ## PRUNE EACH SPAN ========================================================
+    for first, last, funcs in merged:
+        span_size = int(np.prod([permutations.radices[j] for j in range(first, last)]))
+        if span_size > max_span_size:
+            logger.info(f'Span {names[first]}...{names[last-1]} too large to prune ({span_size} sub-combinations)')
+            remaining_filters.extend(funcs)
+            continue
+
+        span_table = permutations.span_digits(first, last)
+        keep = np.ones(len(span_table), dtype=bool)
+        # Combinations (of those remaining) per row of the span
+        n_per_row = len(permutations) // max(len(span_table), 1)
+
+        for func in funcs:
+            logger.info(f'\tPruning with FILTER function: {func.__name__}')
+            sub, df_sub, passed = _evaluate_on_sub_product(func, permutations)
+
+            # Map each row of the span onto its sub-combination
+            cols = [names.index(p) - first for p in sub.names]
+            sub_index = span_table[:, cols] @ np.asarray(sub.strides, dtype=np.int64)
+
+            # Record each rejected sub-combination once, with the rows of the
+            # span it removes that are still kept
+            removed = keep & ~passed[sub_index]
+            n_pruned = np.bincount(sub_index[removed], minlength=len(sub)) * n_per_row
+            for i_sub, failed_vars in zip(np.flatnonzero(~passed), df_sub[~passed].to_dict('records')):
+                failed_vars['failed_checks'] = func.__name__
+                failed_vars['N_PRUNED'] = int(n_pruned[i_sub])
+                fail_data.append(failed_vars)
+            keep &= ~removed
+
+        permutations.restrict_span(first, last, span_table[keep])
+        logger.info(f'Pruned {names[first]}...{names[last-1]}: {keep.sum()} of {len(keep)} sub-combinations remain')
+    ## [END] PRUNE EACH SPAN ==================================================
+
+    return remaining_filters
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+
+from ._combination_functions import expand_param_specs
+from ..log_tools import logger
+
+
+'''
+Space-filling sampling designs, as an alternative to the full cartesian
+product. Rather than every combination, `n_samples` well-spread samples are
+drawn from the unit hypercube with one of:
+    > 'lhs'   : Latin hypercube
+    > 'sobol' : scrambled Sobol sequence (best with a power of 2 samples)
+    > 'halton': scrambled Halton sequence
+
+and mapped onto the parameters of the design matrix:
+    > a parameter with a single constant stays constant
+    > a parameter with a single range (LO, HI, NUM) is CONTINUOUS, uniform
+      over [LO, HI]. NUM is ignored.
+    > unless LO and HI are both integers as parsed (ie- `(50, 100, 6)` for
+      Mglob, but not `(4.0, 8.0, 5)`), in which case it is INTEGER, uniform
+      over the integers in [LO, HI]
+    > any other parameter (ie- a list of strings, several constants and/or
+      ranges) is DISCRETE, taking each of the values it would assume in the
+      cartesian product with equal probability
+'''
+
+SAMPLING_METHODS = ['lhs', 'sobol', 'halton']
+
+
+def _is_integer_range(lo, hi):
+    '''
+    Whether a range is over integers, by the parsed types of LO and HI (see
+    `convert_to_number`, '4' is an integer while '4.0' is not)
+    '''
+    return all(isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+               for value in (lo, hi))
+
+
+def _get_sampler(method, d, seed):
+    if method == 'lhs':
+        return qmc.LatinHypercube(d=d, seed=seed)
+    elif method == 'sobol':
+        return qmc.Sobol(d=d, scramble=True, seed=seed)
+    elif method == 'halton':
+        return qmc.Halton(d=d, scramble=True, seed=seed)
+
+
+def sample_design(param_specs, n_samples, method='lhs', seed=None):
+    '''
+    Draws a space-filling sample of the design matrix
+
+    Arguments:
+    - param_specs (dictionary): entries of each parameter, as from
+        `get_param_specs_from_csv`/`get_param_specs_from_dict`
+    - n_samples (int): number of samples
+    - method (str): one of 'lhs', 'sobol', or 'halton'
+    - seed (int/None): seed of the sampler, for reproducibility
+
+    Returns:
+    - df_samples (DataFrame): one row per sample, with columns in the same
+        order as the cartesian product version
+    '''
+    if method not in SAMPLING_METHODS:
+        raise ValueError(f'`sampling` must be one of {SAMPLING_METHODS}, not {method}')
+    if not n_samples or n_samples < 1:
+        raise ValueError('`n_samples` must be a positive integer when sampling')
+
+    # Classify each parameter
+    param_values = expand_param_specs(param_specs)
+    constants, continuous, integers, discrete = {}, {}, {}, {}
+    for name, entries in param_specs.items():
+        if len(entries) == 1 and entries[0][0] == 'CON':
+            constants[name] = entries[0][1]
+        elif len(entries) == 1 and entries[0][0] == 'RANGE' and _is_integer_range(*entries[0][1:3]):
+            integers[name] = (int(entries[0][1]), int(entries[0][2]))
+        elif len(entries) == 1 and entries[0][0] == 'RANGE':
+            continuous[name] = (entries[0][1], entries[0][2])
+        else:
+            discrete[name] = param_values[name]
+
+    # Sample the unit hypercube, one dimension per non-constant parameter
+    dims = list(continuous) + list(integers) + list(discrete)
+    logger.info(f'SAMPLING: {n_samples} samples by {method} over {len(continuous)} '
+                f'continuous, {len(integers)} integer, and {len(discrete)} discrete parameters')
+    unit = np.zeros((n_samples, 0))
+    if dims:
+        unit = _get_sampler(method, len(dims), seed).random(n_samples)
+
+    # Map onto each parameter
+    columns = {}
+    for name in param_specs:
+        if name in constants:
+            columns[name] = [constants[name]] * n_samples
+        elif name in continuous:
+            lo, hi = continuous[name]
+            columns[name] = lo + unit[:, dims.index(name)] * (hi - lo)
+        elif name in integers:
+            lo, hi = integers[name]
+            columns[name] = np.minimum(lo + (unit[:, dims.index(name)] * (hi - lo + 1)).astype(int), hi)
+        else:
+            values = discrete[name]
+            index = np.minimum((unit[:, dims.index(name)] * len(values)).astype(int),
+                               len(values) - 1)
+            columns[name] = pd.Series(values, dtype=object).take(index).tolist()
+
+    return pd.DataFrame(columns)
@@ -0,0 +1,204 @@
+import os
+import json
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ._make_summary import SummaryWriter, get_summary_writers
+from ._process_combination import evaluate_combination
+from ._vectorized_pipeline import VectorizedFailure
+from ..setup_paths_envs import get_env
+from ..xarray_obj import EnsembleStore, get_ensemble_path
+from ..log_tools import logger, TRIAL
+
+
+'''
+Sharded generation, such that `process_design_matrix` can run as an HPC array
+job (see the `run_py_shard_*` bodies of `SlurmPipeline`/`PBS_Pipeline`).
+Each task of the array processes a disjoint, contiguous slice of the
+combinations, in three stages:
+    > 'filter': every shard evaluates the dependency and filter functions of
+      its slice, writing its failures and the COMBO_NUM of each passing
+      combination to `{is}/shards`
+    > 'build' : every shard counts the passing combinations of the shards
+      before it, such that ITER is assigned exactly as in the serial version,
+      and builds the trials of its passing combinations
+    > 'reduce': a single task merges the summaries of the shards, in order,
+      into `{name}_input_summary` and `{name}_failure_summary` (and their
+      ensemble stores into `{name}_ensemble.nc`, see `nc_store`)
+
+As in the parallel version, the dependency functions are evaluated in both
+the 'filter' and 'build' stages.
+
+The shard of a task is only ever passed to `process_design_matrix`
+explicitly. The `run_py_shard_*` bodies export it as `N_SHARDS`,
+`SHARD_INDEX`, and `SHARD_STAGE`, which the script they run passes on with
+`shard_args_from_env`, ie-
+    process_design_matrix(..., **shard_args_from_env())
+'''
+
+SHARD_STAGES = ['filter', 'build', 'reduce']
+
+
+class Shard:
+    '''
+    One task of a sharded generation
+    '''
+    def __init__(self, index, n_shards, stage):
+        if stage not in SHARD_STAGES:
+            raise ValueError(f'`shard_stage` must be one of {SHARD_STAGES}, not {stage}')
+        if stage != 'reduce' and not 0 <= index < n_shards:
+            raise ValueError(f'`shard_index` must be in [0, {n_shards}), not {index}')
+        self.index = index
+        self.n_shards = n_shards
+        self.stage = stage
+
+    def bounds(self, n):
+        '''
+        Positions [start, stop) of the slice of `n` combinations
+        '''
+        return self.index*n // self.n_shards, (self.index + 1)*n // self.n_shards
+
+    def path(self, kind, index=None):
+        '''
+        Path (without extension) of a file of this shard, or of shard `index`
+        '''
+        index = self.index if index is None else index
+        return os.path.join(get_shard_dir(), f"{get_env('name')}_{kind}_shard_{index:04}")
+
+    ## COUNTS =================================================================
+    def write_passed(self, start, stop, passed):
+        '''
+        Records the COMBO_NUM of each passing combination of the slice
+        '''
+        path = self.path('passed') + '.json'
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump({'start': start, 'stop': stop, 'passed': passed}, f)
+        os.replace(f'{path}.tmp', path)
+
+    def read_passed(self, index=None):
+        path = self.path('passed', index) + '.json'
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Shard {self.index if index is None else index} has not "
+                                    f"finished the 'filter' stage: {path}")
+        with open(path) as f:
+            return json.load(f)['passed']
+
+    def iter_offset(self):
+        '''
+        Number of passing combinations in the shards before this one
+        '''
+        return sum(len(self.read_passed(i)) for i in range(self.index))
+    ## [END] COUNTS ===========================================================
+
+
+def get_shard_dir():
+    shard_dir = os.path.join(get_env('is'), 'shards')
+    os.makedirs(shard_dir, exist_ok=True)
+    return shard_dir
+
+
+def get_shard(n_shards, shard_index=None, shard_stage=None):
+    '''
+    Shard of this task
+    '''
+    if shard_index is None:
+        shard_index = 0
+    return Shard(int(shard_index), int(n_shards), shard_stage)
+
+
+def shard_args_from_env():
+    '''
+    Arguments of `process_design_matrix` for the shard of this task, from
+    `N_SHARDS`, `SHARD_INDEX`, and `SHARD_STAGE` as exported by the
+    `run_py_shard_*` bodies. Empty (ie- not sharded) if `N_SHARDS` is not set.
+
+    Returns:
+    - shard_args (dictionary): `n_shards`, `shard_index`, and `shard_stage`
+    '''
+    n_shards = int(os.getenv('N_SHARDS') or 0)
+    if not n_shards:
+        return {}
+    return {'n_shards': n_shards,
+            'shard_index': int(os.getenv('SHARD_INDEX') or 0),
+            'shard_stage': os.getenv('SHARD_STAGE')}
+
+
+def get_shard_writers(shard, flush_every=100):
+    '''
+    Writers for the summary rows of a shard: failures in the 'filter' stage,
+    and trials in the 'build' stage
+    '''
+    if shard.stage == 'filter':
+        return [], SummaryWriter(shard.path('failure_summary'), ['parquet'],
+                                 flush_every = flush_every,
+                                 sort_by = 'COMBO_NUM')
+    return SummaryWriter(shard.path('input_summary'), ['parquet'],
+                         flush_every = flush_every), []
+
+
+def filter_shard(permutations,
+                 load_vars = None,
+                 function_set = None,
+                 filter_sets = None,
+                 fail_data = None,
+                 progress = None):
+    '''
+    'filter' stage of a shard: applies the filters to each combination
+
+    Returns:
+    - passed (list): COMBO_NUM of each passing combination
+    '''
+    passed = []
+    for perm_i, var_dict in permutations:
+        combo_num = perm_i + 1
+        # Without filters, there is no need to evaluate anything
+        if filter_sets or isinstance(var_dict, VectorizedFailure):
+            _, failed_params = evaluate_combination(var_dict,
+                                                    load_vars,
+                                                    function_set,
+                                                    filter_sets)
+            if failed_params is not None:
+                failed_params['COMBO_NUM'] = combo_num
+                fail_data.append(failed_params)
+                logger.log(TRIAL, f'Combination {combo_num:05} FAILED. Moving on.')
+                continue
+        passed.append(int(combo_num))
+        if progress is not None:
+            progress.update(combo_num)
+    return passed
+
+
+def reduce_shards(n_shards, summary_formats, flush_every=100, nc_store='trial'):
+    '''
+    'reduce' stage: merges the summaries of every shard, in order, into the
+    input/failure summaries, and their ensemble stores if `nc_store` is
+    'ensemble'
+
+    Returns:
+    - df_pass, df_fail (DataFrame): the merged summaries
+    '''
+    shard = Shard(0, n_shards, 'reduce')
+    pass_data, fail_data = get_summary_writers(summary_formats,
+                                               flush_every = flush_every)
+    for kind, writer in [('input_summary', pass_data), ('failure_summary', fail_data)]:
+        for index in range(n_shards):
+            path = shard.path(kind, index) + '.parquet'
+            if not os.path.exists(path):
+                if kind == 'input_summary' and shard.read_passed(index):
+                    raise FileNotFoundError(f"Shard {index} has not finished the 'build' stage: {path}")
+                continue
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=flush_every):
+                writer.write_table(pa.Table.from_batches([batch]))
+    logger.info(f'Merged the summaries of {n_shards} shards')
+
+    if nc_store == 'ensemble':
+        with EnsembleStore(get_ensemble_path(), mode='w', flush_every=flush_every) as store:
+            for index in range(n_shards):
+                path = shard.path('ensemble', index) + '.nc'
+                if not os.path.exists(path):
+                    if shard.read_passed(index):
+                        raise FileNotFoundError(f"Shard {index} has not finished the 'build' stage: {path}")
+                    continue
+                store.merge(path)
+        logger.info(f'Merged the ensemble stores of {n_shards} shards')
+    return pass_data.close(), fail_data.close()
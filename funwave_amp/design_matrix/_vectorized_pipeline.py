@@ -0,0 +1,72 @@
+from ._add_params import add_vectorized_dependent_values
+from ._apply_filters import apply_vectorized_filters
+from ._lazy_permutations import LazyPermutations, iter_permutation_chunks
+from ..log_tools import logger
+
+
+'''
+Chunk-wise evaluation of the vectorized dependency functions and vectorized
+filters on the design matrix, BEFORE the core loop. Combinations are handled
+`chunk_size` at a time (ie- as column arrays), and handed on to the
+row-by-row core loop in order. Those that fail a vectorized filter are handed
+on as a `VectorizedFailure`, such that the core loop records (and journals)
+them as failures in COMBO_NUM order, like any other failure, without
+evaluating them again.
+'''
+
+
+class VectorizedFailure(dict):
+    '''
+    Parameters of a combination that failed the vectorized filters, with the
+    failed parameters in `failed_params` (see `evaluate_combination`)
+    '''
+    def __init__(self, var_dict, failed_params):
+        super().__init__(var_dict)
+        self.failed_params = failed_params
+
+
+def iter_vectorized_pipeline(df_permutations,
+                             dependency_sets = None,
+                             filter_sets = None,
+                             chunk_size = 10000,
+                             start = 0,
+                             stop = None):
+    '''
+    Yields (combination index, dictionary of parameters) for each
+    combination, including the columns added by the vectorized dependency
+    functions. The dictionary of a combination that failed the vectorized
+    filters is a `VectorizedFailure`.
+
+    Arguments:
+    - df_permutations (DataFrame/LazyPermutations): combinations
+    - dependency_sets (list): vectorized dependency functions
+    - filter_sets (list): vectorized filter functions
+    - chunk_size (int): number of combinations evaluated at once
+    - start/stop (int): positions of the combinations to evaluate
+    '''
+    for df_chunk in iter_permutation_chunks(df_permutations, chunk_size, start, stop):
+        # Add on vectorized dependent values
+        if dependency_sets:
+            df_chunk = add_vectorized_dependent_values(df_chunk,dependency_sets)
+        new_columns = [name for name in df_chunk.columns
+                       if name not in df_permutations.columns]
+
+        # Apply vectorized filters, failures by combination index
+        failures = {}
+        if filter_sets:
+            passed, failed_data = apply_vectorized_filters(df_chunk,filter_sets)
+            failures = dict(zip(df_chunk.index[~passed], failed_data))
+            if failed_data:
+                logger.info(f'{len(failed_data)} combinations FAILED vectorized FILTER functions')
+
+        for perm_i in df_chunk.index:
+            # Lazy permutations keep their native types
+            if isinstance(df_permutations, LazyPermutations):
+                var_dict = df_permutations.combination(int(perm_i))
+                var_dict.update(df_chunk.loc[perm_i, new_columns].to_dict())
+                perm_i = int(perm_i)
+            else:
+                var_dict = df_chunk.loc[perm_i].to_dict()
+            if perm_i in failures:
+                var_dict = VectorizedFailure(var_dict, failures[perm_i])
+            yield perm_i, var_dict
@@ -0,0 +1,313 @@
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from ._combination_functions import get_param_specs_from_csv, get_param_specs_from_dict
+from ._combination_functions import expand_param_specs
+from ._sampling import sample_design, _is_integer_range
+from .design_matrix import process_design_matrix
+from ..setup_paths_envs import get_key_dirs, get_env
+from ..xarray_obj import expand_alongshore_uniform, restore_implicit_coords
+from ..log_tools import logger
+
+
+'''
+Adaptive sequential design. Rather than generating the whole design matrix up
+front, a first (ie- sampled) batch of trials is generated and run, and each
+following batch is proposed where the response of the completed trials is
+least known and changing fastest:
+    > a scalar metric of each completed trial is read from the attributes of
+      its compressed output (tri_XXXXX.nc), the input summary, or computed
+      from the dataset by a function
+    > a Gaussian process (RBF kernel) is fit to the metric over the design
+      matrix parameters, scaled to [0, 1]
+    > a scrambled Sobol set of candidates is scored by the predictive
+      variance, weighted up by the gradient of the predictive mean
+    > the best `n_propose` candidates are chosen one at a time, each chosen
+      candidate reducing the variance around it (kriging believer), such
+      that the batch does not cluster
+
+The proposals are appended to the existing generation as new trials, with
+COMBO_NUM/ITER continuing from the existing ones.
+'''
+
+
+#%% ENCODING
+def _get_param_specs(matrix_dict=None, matrix_csv=None):
+    if matrix_csv:
+        return get_param_specs_from_csv(matrix_csv)
+    elif matrix_dict:
+        return get_param_specs_from_dict(matrix_dict)
+    raise ValueError('Need either matrix_csv or matrix_dict!')
+
+
+class _Encoder:
+    '''
+    Scales the non-constant parameters of the design matrix to [0, 1], in the
+    same way as `sample_design` classifies them: a single range (continuous,
+    or integer if LO and HI are integers) is scaled over [LO, HI], anything
+    else is discrete, by index of its value.
+    '''
+    def __init__(self, param_specs):
+        param_values = expand_param_specs(param_specs)
+        self.continuous, self.integers, self.discrete = {}, {}, {}
+        for name, entries in param_specs.items():
+            if len(entries) == 1 and entries[0][0] == 'CON':
+                continue
+            elif len(entries) == 1 and entries[0][0] == 'RANGE' and _is_integer_range(*entries[0][1:3]):
+                self.integers[name] = (entries[0][1], entries[0][2])
+            elif len(entries) == 1 and entries[0][0] == 'RANGE':
+                self.continuous[name] = (entries[0][1], entries[0][2])
+            else:
+                self.discrete[name] = list(param_values[name])
+        self.names = list(self.continuous) + list(self.integers) + list(self.discrete)
+
+    def _discrete_index(self, values, value):
+        if value in values:
+            return values.index(value)
+        # Numbers that have been converted (ie- float32) match the nearest
+        numeric = [v for v in values if isinstance(v, (int, float, np.number))]
+        if numeric and isinstance(value, (int, float, np.number)):
+            nearest = min(numeric, key=lambda v: abs(v - value))
+            return values.index(nearest)
+        raise ValueError(f'Value {value} is not in the design matrix')
+
+    def encode(self, df):
+        X = np.zeros((len(df), len(self.names)))
+        for j, name in enumerate(self.names):
+            if name not in df.columns:
+                raise ValueError(f'Parameter {name} is not in the input summary')
+            if name in self.continuous or name in self.integers:
+                lo, hi = self.continuous.get(name) or self.integers[name]
+                X[:, j] = (df[name].to_numpy(dtype=float) - lo) / ((hi - lo) or 1.0)
+            else:
+                values = self.discrete[name]
+                index = [self._discrete_index(values, v) for v in df[name]]
+                X[:, j] = np.asarray(index) / max(len(values) - 1, 1)
+        return X
+
+
+#%% SURROGATE
+class _GaussianProcess:
+    '''
+    Gaussian process with an isotropic RBF kernel on normalized data. The
+    length scale is chosen from a grid by log marginal likelihood, and the
+    signal variance is its maximum likelihood estimate.
+    '''
+    def __init__(self, nugget=1e-6):
+        self.nugget = nugget
+
+    def _kernel(self, A, B):
+        sq_dist = (np.sum(A**2, axis=1)[:, None] + np.sum(B**2, axis=1)[None, :]
+                   - 2 * A @ B.T)
+        return np.exp(-0.5 * np.maximum(sq_dist, 0) / self.length_scale**2)
+
+    def _factor(self, X):
+        K = self._kernel(X, X) + self.nugget * np.eye(len(X))
+        return np.linalg.cholesky(K)
+
+    def fit(self, X, y):
+        self.X = X
+        self.y_mean, self.y_std = y.mean(), (y.std() or 1.0)
+        y = (y - self.y_mean) / self.y_std
+        n = len(y)
+
+        # Length scale by log marginal likelihood (signal variance profiled out)
+        best = None
+        for length_scale in np.geomspace(0.05, 2.0, 24):
+            self.length_scale = length_scale
+            try:
+                L = self._factor(X)
+            except np.linalg.LinAlgError:
+                continue
+            alpha = np.linalg.solve(L.T, np.linalg.solve(L, y))
+            variance = max(y @ alpha / n, 1e-12)
+            log_likelihood = -0.5 * n * np.log(variance) - np.sum(np.log(np.diag(L)))
+            if best is None or log_likelihood > best[0]:
+                best = (log_likelihood, length_scale, L, alpha, variance)
+        if best is None:
+            raise np.linalg.LinAlgError('Could not fit the surrogate to the completed trials')
+        _, self.length_scale, self.L, self.alpha, self.variance = best
+        return self
+
+    def predict(self, X_new):
+        '''
+        Returns the predictive mean and variance (in units of the metric)
+        '''
+        K_new = self._kernel(X_new, self.X)
+        mean = K_new @ self.alpha
+        v = np.linalg.solve(self.L, K_new.T)
+        var = self.variance * np.maximum(1 - np.sum(v**2, axis=0), 0)
+        return mean * self.y_std + self.y_mean, var * self.y_std**2
+
+    def mean_gradient_norm(self, X_new):
+        '''
+        Norm of the gradient of the predictive mean (normalized units)
+        '''
+        K_new = self._kernel(X_new, self.X)
+        diff = X_new[:, None, :] - self.X[None, :, :]
+        grad = -np.einsum('ij,ijk->ik', K_new * self.alpha[None, :], diff) / self.length_scale**2
+        return np.linalg.norm(grad, axis=1)
+
+
+def _select_batch(gp, X_candidates, n_propose, X_failed=None):
+    '''
+    Chooses `n_propose` candidates by variance weighted by the gradient of the
+    mean, updating the variance after each choice (kriging believer). Failed
+    combinations (`X_failed`) count as known, such that they are not proposed
+    again.
+    '''
+    grad = gp.mean_gradient_norm(X_candidates)
+    weight = 1 + grad / (grad.max() or 1.0)
+
+    X = gp.X if X_failed is None else np.vstack([gp.X, X_failed])
+    chosen = []
+    for _ in range(min(n_propose, len(X_candidates))):
+        L = gp._factor(X)
+        v = np.linalg.solve(L, gp._kernel(X_candidates, X).T)
+        var = np.maximum(1 - np.sum(v**2, axis=0), 0)
+        score = var * weight
+        score[chosen] = -np.inf
+        best = int(np.argmax(score))
+        chosen.append(best)
+        X = np.vstack([X, X_candidates[best]])
+    return chosen
+
+
+#%% METRICS
+def get_trial_metrics(metric, df_summary=None):
+    '''
+    Scalar metric of each completed trial
+
+    Arguments:
+    - metric (str/function): either the name of a column of the input summary,
+        the name of an attribute of tri_XXXXX.nc, or a function taking the
+        xarray Dataset of tri_XXXXX.nc and returning a number
+    - df_summary (DataFrame/None): input summary, read in if None
+
+    Returns:
+    - df_metrics (DataFrame): input summary rows of the trials with a finite
+        metric, with the metric in `METRIC`
+    '''
+    if df_summary is None:
+        summary_path = os.path.join(get_env('is'), f"{get_env('name')}_input_summary.parquet")
+        if not os.path.exists(summary_path):
+            raise FileNotFoundError(f'No input summary to adapt from: {summary_path}')
+        df_summary = pd.read_parquet(summary_path)
+
+    if isinstance(metric, str) and metric in df_summary.columns:
+        values = pd.to_numeric(df_summary[metric], errors='coerce').to_numpy(dtype=float)
+    else:
+        values = np.full(len(df_summary), np.nan)
+        for i, iter_num in enumerate(df_summary['ITER']):
+            nc_path = get_key_dirs(tri_num=int(iter_num))['nc']
+            if not os.path.exists(nc_path):
+                continue
+            with xr.open_dataset(nc_path) as ds:
+                value = ds.attrs.get(metric) if isinstance(metric, str) else metric(expand_alongshore_uniform(restore_implicit_coords(ds)))
+            if value is not None:
+                values[i] = float(np.asarray(value))
+
+    finite = np.isfinite(values)
+    if not finite.all():
+        logger.warning(f'Warning: no metric for {np.sum(~finite)} of {len(values)} trials, ignoring them')
+    return df_summary[finite].assign(METRIC = values[finite])
+
+
+def _get_failed_points(encoder):
+    '''
+    Encoded parameters of the failed combinations, skipping any without them
+    (ie- pruned sub-combinations)
+    '''
+    failure_path = os.path.join(get_env('is'), f"{get_env('name')}_failure_summary.parquet")
+    if not os.path.exists(failure_path):
+        return None
+    df_fail = pd.read_parquet(failure_path)
+    if df_fail.empty or not set(encoder.names).issubset(df_fail.columns):
+        return None
+    df_fail = df_fail.dropna(subset=encoder.names)
+    return encoder.encode(df_fail) if len(df_fail) else None
+
+
+#%% PROPOSALS
+def propose_adaptive_design(matrix_dict = None,
+                            matrix_csv = None,
+                            metric = None,
+                            n_propose = 10,
+                            n_candidates = None,
+                            seed = None):
+    '''
+    Proposes the next batch of combinations of an adaptive sequential design,
+    from the completed trials of the current generation (see `setup_key_dirs`)
+
+    Arguments:
+    - matrix_dict/matrix_csv: design matrix, as for `process_design_matrix`
+    - metric (str/function): scalar metric of each trial, see
+        `get_trial_metrics`
+    - n_propose (int): number of combinations to propose
+    - n_candidates (int/None): number of Sobol candidates to choose from,
+        a power of 2 of at least 32*`n_propose` if None
+    - seed (int/None): seed of the candidates
+
+    Returns:
+    - df_proposals (DataFrame): one row per proposed combination, with the
+        same columns as `find_combinations`, plus the predicted `METRIC_MEAN`
+        and `METRIC_STD`
+    '''
+    if metric is None:
+        raise ValueError('Need a `metric` to adapt the design to!')
+    param_specs = _get_param_specs(matrix_dict, matrix_csv)
+    encoder = _Encoder(param_specs)
+    if not encoder.names:
+        raise ValueError('The design matrix has no parameters to vary')
+
+    ## Fit the surrogate to the completed trials
+    df_metrics = get_trial_metrics(metric)
+    if len(df_metrics) < 2:
+        raise ValueError(f'Need at least 2 completed trials with a metric, not {len(df_metrics)}')
+    gp = _GaussianProcess().fit(encoder.encode(df_metrics), df_metrics['METRIC'].to_numpy())
+    logger.info(f'ADAPTIVE DESIGN: surrogate fit to {len(df_metrics)} trials '
+                f'over {len(encoder.names)} parameters (length scale {gp.length_scale:.3f})')
+
+    ## Score the candidates and choose the batch
+    if n_candidates is None:
+        n_candidates = 2**int(np.ceil(np.log2(max(256, 32*n_propose))))
+    df_candidates = sample_design(param_specs, n_candidates, method='sobol', seed=seed)
+    X_candidates = encoder.encode(df_candidates)
+    chosen = _select_batch(gp, X_candidates, n_propose, _get_failed_points(encoder))
+
+    mean, var = gp.predict(X_candidates[chosen])
+    df_proposals = df_candidates.iloc[chosen].reset_index(drop=True)
+    logger.info(f'ADAPTIVE DESIGN: proposed {len(df_proposals)} combinations')
+    return df_proposals.assign(METRIC_MEAN = mean, METRIC_STD = np.sqrt(var))
+
+
+def process_adaptive_design(matrix_dict = None,
+                            matrix_csv = None,
+                            metric = None,
+                            n_propose = 10,
+                            n_candidates = None,
+                            seed = None,
+                            **kwargs):
+    '''
+    Proposes the next batch of an adaptive sequential design (see
+    `propose_adaptive_design`) and generates it, appended to the existing
+    trials: COMBO_NUM/ITER continue from the existing summaries, and the
+    existing trials are untouched. The remaining keyword arguments (ie-
+    `function_set`, `filter_sets`, `print_sets`) are passed on to
+    `process_design_matrix`, and should match those of the first batch.
+
+    Returns:
+    - df_pass, df_fail (DataFrame): the full input/failure summaries
+    '''
+    df_proposals = propose_adaptive_design(matrix_dict = matrix_dict,
+                                           matrix_csv = matrix_csv,
+                                           metric = metric,
+                                           n_propose = n_propose,
+                                           n_candidates = n_candidates,
+                                           seed = seed)
+    design = df_proposals.drop(columns=['METRIC_MEAN','METRIC_STD'])
+    return process_design_matrix(design = design,
+                                 append = True,
+                                 **kwargs)
@@ -1,27 +1,63 @@
 from ._combination_functions import find_combinations_from_csv,find_combinations_from_dict
+from ._combination_functions import get_param_ranges_from_csv,get_param_ranges_from_dict
+from ._combination_functions import get_param_specs_from_csv,get_param_specs_from_dict
+from ._sampling import sample_design
+from ._lazy_permutations import LazyPermutations
 
 
 def find_combinations(matrix_dict=None,
-                      matrix_csv= None):
+                      matrix_csv= None,
+                      lazy = False,
+                      sampling = None,
+                      n_samples = None,
+                      seed = None):
     '''
     Finds the cartesian product of the range of all the parameters with 
     multiple possible values
+
+    If `lazy` is True, a LazyPermutations object is returned instead of a 
+    DataFrame. It supports len(), random access by combination index, and 
+    iteration (row by row or in chunks) without materializing the product.
+
+    If `sampling` is one of 'lhs', 'sobol', or 'halton', a DataFrame of
+    `n_samples` space-filling samples (seeded by `seed`) is returned instead
+    of the cartesian product. Single ranges are sampled continuously over
+    [LO, HI] (or over its integers, if LO and HI are integers), while
+    constants and lists of values are honoured (see `sample_design`).
     '''
     # Assert that both are not specified
     assert not (matrix_dict is not None 
                 and matrix_csv is not None), "Choose either dictionary OR CSV, not both!"
     
+    # Sampling designs: only the specification of each parameter is needed
+    if sampling is not None:
+        if lazy:
+            raise ValueError('`lazy` only applies to the cartesian product, not sampling designs')
+        if matrix_csv:
+            param_specs = get_param_specs_from_csv(matrix_csv)
+        elif matrix_dict:
+            param_specs = get_param_specs_from_dict(matrix_dict)
+        else:
+            raise ValueError('Need either matrix_csv or matrix_dict!')
+        return sample_design(param_specs, n_samples, method=sampling, seed=seed)
+    
     
     # Deal with the csv version
     if matrix_csv:
-          df_permutations = find_combinations_from_csv(matrix_csv)
+          if lazy:
+              df_permutations = LazyPermutations(get_param_ranges_from_csv(matrix_csv))
+          else:
+              df_permutations = find_combinations_from_csv(matrix_csv)
     
     # Deal with the dictionary version
     elif matrix_dict:
-          df_permutations = find_combinations_from_dict(matrix_dict)
+          if lazy:
+              df_permutations = LazyPermutations(get_param_ranges_from_dict(matrix_dict))
+          else:
+              df_permutations = find_combinations_from_dict(matrix_dict)
     
     # Raise error if both are none
     else:
           raise ValueError('Need either matrix_csv or matrix_dict!')
     
-    return df_permutations
\ No newline at end of file
+    return df_permutations
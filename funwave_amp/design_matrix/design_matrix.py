@@ -1,13 +1,28 @@
+import os
+import pandas as pd
+
 # Inner module imports
-from ._add_params import add_dependent_values,add_required_params, add_load_params
-from ._apply_filters import apply_filters
-from ._make_summary import save_out_summary
-from ._print_plot_sets import print_supporting_file, plot_supporting_file
+from ._add_params import add_load_params, is_vectorized_dependency, clear_dependency_caches
+from ._apply_filters import is_vectorized_filter
+from ._vectorized_pipeline import iter_vectorized_pipeline
+from ._pruning import prune_permutations
+from ._make_summary import get_summary_writers, get_summary_offsets
+from ._process_combination import evaluate_combination, build_trial
 from .combinations import find_combinations
+from ._lazy_permutations import iter_permutation_dicts
+from .parallel import process_permutations_parallel
+from ._journal import TrialJournal, get_journal_path, hash_content
+from ._sharding import (get_shard, get_shard_dir, get_shard_writers,
+                        filter_shard, reduce_shards)
+from ._cost_estimate import get_cost_writer, estimate_permutations, summarize_costs
+from ._instrumentation import (TimingCollector, enable_instrumentation,
+                               disable_instrumentation, drain_records,
+                               start_trial, end_trial)
 
 # Outer module imports
-from ..print_files import print_input_dot_text
-from ..xarray_obj import get_net_cdf
+from ..setup_paths_envs import PathResolver, set_path_resolver
+from ..xarray_obj import NC_STORES, EnsembleStore, get_ensemble_path
+from ..log_tools import logger, TRIAL, ProgressLine, set_log_level, get_log_level
 
 
 
@@ -16,15 +31,38 @@ Main design matrix file
 '''
 
 #%%
-def process_design_matrix(matrix_csv=None, 
+def process_design_matrix(matrix_csv=None,
                           matrix_dict=None,
                           print_inputs = True,
                           load_sets = None,
-                          function_set = None, 
+                          function_set = None,
                           filter_sets = None,
-                          print_sets = None, 
+                          print_sets = None,
                           plot_sets = None,
-                          summary_formats = ['parquet','csv']):
+                          summary_formats = ['parquet','csv'],
+                          lazy = False,
+                          n_workers = 1,
+                          chunk_size = 16,
+                          resume = False,
+                          summary_flush_every = 100,
+                          instrument = False,
+                          profile_slowest = 0,
+                          log_level = None,
+                          sampling = None,
+                          n_samples = None,
+                          seed = None,
+                          design = None,
+                          append = False,
+                          n_shards = None,
+                          shard_index = None,
+                          shard_stage = None,
+                          dry_run = False,
+                          cost_params = None,
+                          env_file = None,
+                          nc_store = 'trial',
+                          implicit_coords = False,
+                          compact_uniform = False,
+                          nc_encoding = None):
     '''
     Works through the design matrix process
         - Loads in and checks data from either csv or dictionary
@@ -35,83 +73,466 @@ def process_design_matrix(matrix_csv=None,
             - add on dependent values from pipeline
             - add on required parameters
             - apply filtering conditions
+
+    If `sampling` is one of 'lhs', 'sobol', or 'halton', `n_samples`
+    space-filling samples (seeded by `seed`) of the design matrix are used
+    instead of the full cartesian product (see `find_combinations`).
+
+    If `lazy` is True, the combinations are decoded one at a time from a
+    LazyPermutations object, such that the full cartesian product is never
+    held in memory.
+
+    If `n_workers` > 1, combinations are processed by a pool of `n_workers`
+    processes, `chunk_size` combinations at a time. ITER numbers are assigned
+    exactly as in the serial version: consecutively over the passing
+    combinations in COMBO_NUM order.
+
+    Dependency functions registered with `vectorized_dependency` and filters
+    registered with `vectorized_filter` are split out of `function_set` and
+    `filter_sets`, and applied to the design matrix `chunk_size`*1000
+    combinations at a time BEFORE the core loop, such that rejected
+    combinations never have their (row-by-row) dependent values computed.
+
+    If `lazy` is True, filters that declare the design matrix parameters they
+    read with `filter_params` are evaluated on the sub-product of just those
+    parameters, and the rejected sub-combinations are never enumerated. Each
+    rejected sub-combination is recorded once in the failure summary, with
+    `N_PRUNED` combinations, rather than once per combination.
+
+    Every completed combination is recorded in an append-only journal
+    (`{name}_journal.jsonl` alongside the summaries). If `resume` is True,
+    every combination is evaluated again (load sets, dependency functions,
+    and filters), but trials already in the journal are not rebuilt, as long
+    as their design matrix parameters, final parameters (see
+    `hash_content`), and trial number are unchanged and their files still
+    exist. Their summary data is taken from the journal.
+
+    The input/failure summaries are streamed out to Parquet (and CSV) every
+    `summary_flush_every` rows rather than held in memory, and are finalized
+    even if generation is interrupted.
+
+    If `instrument` is True, the wall time of every function of every stage
+    (load, dependency, filter, print, plot, netcdf, input) is recorded per
+    trial, along with bytes written and dependency cache hits, to
+    `{name}_timing_trials.parquet`, and aggregated (count, total, mean, p50,
+    p95, max) to `{name}_timing_summary.csv`. If `profile_slowest` > 0, every
+    trial is also profiled with cProfile, keeping the dumps of the slowest
+    `profile_slowest` trials in `{name}_profiles`.
+
+    `log_level` sets the level of output for this run (see `set_log_level`):
+    'debug' for the output of every function of every trial, 'trial' for one
+    line per trial, 'info' for the run as a whole only, or 'progress' for a
+    single progress line with the rate, ETA, pass/fail counts, and slowest
+    stage.
+
+    If `design` is given (DataFrame, one row per combination), it is used as
+    the design matrix instead of `matrix_csv`/`matrix_dict`. If `append` is
+    True, the combinations are added on to an existing generation: COMBO_NUM
+    and ITER continue from the largest in the existing summaries, the new
+    rows are appended to the summaries and journal, and existing trials are
+    left untouched (see `process_adaptive_design`).
+
+    If `n_shards` is given, this is one task of a sharded generation, run as
+    an HPC array job with the `run_py_shard_*` bodies: the 'filter', 'build',
+    or 'reduce' `shard_stage` of the slice `shard_index` of the combinations.
+    ITERs are the same as the serial version. The environment is never read
+    for these; the script run by the bodies passes them on with
+    `**shard_args_from_env()`. See `_sharding.py`.
+
+    If `dry_run` is True, no files are created for any trial. Instead, the
+    FUNWAVE steps, core-hours, raw output files/bytes, and input/output NetCDF
+    bytes of each passing combination are estimated (see `_cost_estimate.py`,
+    `cost_params` overrides `COST_DEFAULTS`) and written to
+    `{name}_cost_estimate`, with their totals and distributions in
+    `{name}_cost_summary.csv`. The input/failure summaries and the journal
+    are left untouched.
+
+    The paths of every trial are resolved by a `PathResolver`, built once
+    from the environment, or from `env_file` (the .env file of
+    `setup_key_dirs`) without loading it into the environment.
+
+    If `nc_store` is 'ensemble', the NetCDF data of every trial is written to
+    a single ensemble store, `{name}_ensemble.nc` alongside the summaries,
+    with a `trial` dimension and shared fields (ie- bathymetry) stored once,
+    rather than one `tri_XXXXX.nc` per trial (see `_ensemble_store.py`).
+    Trials are read back by ITER with `read_ensemble_trial` (as
+    `get_into_netcdf` does), or written out on demand with
+    `write_trial_netcdfs`.
+
+    The NetCDF types (float32/int32, float64 for X/Y if float32 cannot
+    resolve the grid) are applied as the data is written, through its
+    encoding, rather than by copying the fields in memory (see
+    `ensure_net_cdf_type`). `nc_encoding` overrides the encoding of any
+    variable by name (ie- packing Z into int16 with a `scale_factor`). If
+    `implicit_coords` is True, X/Y are not stored, and are rebuilt from
+    DX/DY and Mglob/Nglob when read (see `restore_implicit_coords`). If
+    `compact_uniform` is True, alongshore-uniform fields (ie- Z of
+    `z_from_SLOPE`) are stored as their (X) profile rather than (X, Y); read
+    them back with `expand_alongshore_uniform`.
     '''
+    if append and (lazy or resume):
+        raise ValueError('`append` cannot be combined with `lazy` or `resume`')
+    if dry_run and (resume or n_shards):
+        raise ValueError('`dry_run` cannot be combined with `resume` or sharded generation')
+    if nc_store not in NC_STORES:
+        raise ValueError(f'`nc_store` must be one of {NC_STORES}, not {nc_store}')
+
+    previous_log_level = get_log_level()
+    if log_level is not None:
+        set_log_level(log_level)
+
+    # Paths of the trials, resolved once rather than from the environment
+    if env_file is not None:
+        resolver = PathResolver.from_env_file(env_file)
+    else:
+        resolver = PathResolver.from_environ()
+    previous_resolver = set_path_resolver(resolver)
+
+    ## Sharded generation: stage and slice of this task
+    shard = None
+    n_shards = n_shards or 0
+    if n_shards:
+        if append:
+            raise ValueError('`append` cannot be combined with sharded generation')
+        shard = get_shard(n_shards, shard_index, shard_stage)
+        logger.info(f'SHARD {shard.index} of {shard.n_shards}: {shard.stage} stage')
+        if shard.stage == 'reduce':
+            try:
+                df_pass,df_fail = reduce_shards(n_shards,
+                                                summary_formats,
+                                                flush_every = summary_flush_every,
+                                                nc_store = nc_store)
+            except BaseException:
+                set_log_level(previous_log_level)
+                raise
+            finally:
+                set_path_resolver(previous_resolver)
+            logger.info('FILE GENERATION SUCCESSFUL!')
+            set_log_level(previous_log_level)
+            return df_pass,df_fail
 
+    ## Numbering of new trials, after any existing ones
+    iter_offset, combo_offset = 0, 0
+    if append:
+        iter_offset, combo_offset = get_summary_offsets()
+        logger.info(f'Appending after COMBO_NUM {combo_offset} and ITER {iter_offset}')
+
+    ## Initialization: summaries are streamed out every `summary_flush_every` rows
+    if dry_run:
+        pass_data,fail_data = get_cost_writer(summary_formats,
+                                              flush_every = summary_flush_every), []
+    elif shard is not None:
+        pass_data,fail_data = get_shard_writers(shard,
+                                                flush_every = summary_flush_every)
+    else:
+        pass_data,fail_data = get_summary_writers(summary_formats,
+                                                  flush_every = summary_flush_every,
+                                                  append = append)
 
-    ## Initialization
-    fail_data,pass_data = [],[] 
-    k = 1                       
-    
     ## Load in design matrix, parse variables, and group
-    df_permutations = find_combinations(matrix_csv= matrix_csv,
-                                        matrix_dict= matrix_dict)
+    if design is not None:
+        df_permutations = design.reset_index(drop=True)
+    else:
+        df_permutations = find_combinations(matrix_csv= matrix_csv,
+                                            matrix_dict= matrix_dict,
+                                            lazy= lazy,
+                                            sampling= sampling,
+                                            n_samples= n_samples,
+                                            seed= seed)
+    if combo_offset:
+        df_permutations.index = df_permutations.index + combo_offset
+
+
+    ## Options of the NetCDF data, and its ensemble store (one per shard)
+    nc_options = {'implicit_coords': implicit_coords,
+                  'encoding': nc_encoding,
+                  'compact_uniform': compact_uniform}
+    store = None
+    if nc_store == 'ensemble' and not dry_run:
+        store_mode = 'a' if (resume or append) else 'w'
+        if shard is None:
+            store = EnsembleStore(get_ensemble_path(resolver), mode=store_mode,
+                                  flush_every = summary_flush_every)
+        elif shard.stage == 'build':
+            store = EnsembleStore(shard.path('ensemble') + '.nc', mode=store_mode,
+                                  flush_every = summary_flush_every)
+
+    ## Journal of completed combinations (one per shard)
+    journal = None
+    if shard is None and not dry_run:
+        journal = TrialJournal(get_journal_path(), resume=resume, append=append, store=store)
+    elif shard is not None and shard.stage == 'build':
+        journal = TrialJournal(shard.path('journal') + '.jsonl', resume=resume, store=store)
+
+    ## Instrumentation (stage totals only, for the progress line)
+    timing = None
+    if instrument or profile_slowest or get_log_level() == 'progress':
+        timing_files = {}
+        if shard is not None:
+            timing_files = {'base_path': get_shard_dir(),
+                            'name': os.path.basename(shard.path(shard.stage))}
+        timing = TimingCollector(profile_slowest = profile_slowest,
+                                 write = bool(instrument or profile_slowest),
+                                 **timing_files)
+        enable_instrumentation(timing.profile_dir)
+
+    # Summaries (and journal) are finalized even if generation is interrupted
+    progress = None
+    try:
+        ## Load in data that should only be loaded once
+        load_vars = None
+        if load_sets:
+            load_vars = add_load_params({},load_sets)
+
+        ## Prune the product with filters that declare their parameters
+        filter_sets = filter_sets or []
+        if lazy:
+            # Only the first shard records the pruned sub-combinations
+            pruned_data = fail_data
+            if shard is not None and (shard.stage != 'filter' or shard.index != 0):
+                pruned_data = []
+            filter_sets = prune_permutations(df_permutations,filter_sets,pruned_data)
+
+        ## Progress, by combination number out of the full product
+        n_total = df_permutations.n_full if lazy else len(df_permutations)
+        progress_offset = combo_offset
+
+        ## Slice of the (pruned) combinations of this shard, by position
+        start, stop = 0, None
+        if shard is not None:
+            start, stop = shard.bounds(len(df_permutations))
+            first, last = start, stop
+            if lazy and stop > start:
+                first = df_permutations.combo_index(start)
+                last = df_permutations.combo_index(stop - 1) + 1
+            n_total, progress_offset = last - first, first
+        progress = ProgressLine(n_total, pass_data, fail_data, timing, offset=progress_offset)
+
+        ## Split out vectorized dependencies/filters and apply them up front
+        function_set = function_set or []
+        clear_dependency_caches(function_set)
+        vector_function_set = [f for f in function_set if is_vectorized_dependency(f)]
+        function_set = [f for f in function_set if not is_vectorized_dependency(f)]
+        vector_filter_sets = [f for f in filter_sets if is_vectorized_filter(f)]
+        filter_sets = [f for f in filter_sets if not is_vectorized_filter(f)]
 
+        # Shards only build the combinations that passed their 'filter' stage
+        first_iter = iter_offset + 1
+        if shard is not None and shard.stage == 'build':
+            vector_filter_sets, filter_sets = [], []
+            first_iter = shard.iter_offset() + 1
 
-    ## Load in data that should only be loaded once
-    if load_sets:
-        load_vars = add_load_params({},load_sets)
+        if vector_function_set or vector_filter_sets:
+            permutations = iter_vectorized_pipeline(df_permutations,
+                                                    vector_function_set,
+                                                    vector_filter_sets,
+                                                    chunk_size = 1000*chunk_size,
+                                                    start = start,
+                                                    stop = stop)
+        else:
+            permutations = iter_permutation_dicts(df_permutations, start, stop)
 
-    ## CORE LOOP ============================================================== 
-    for perm_i, row in df_permutations.iterrows():
-        print(f'\nStarted processing permutation: {perm_i:05}...',flush=True)
+        if shard is not None and shard.stage == 'build':
+            passed = set(shard.read_passed())
+            permutations = (item for item in permutations if item[0] + 1 in passed)
+
+        ## SHARD FILTER STAGE =================================================
+        if shard is not None and shard.stage == 'filter':
+            passed = filter_shard(permutations,
+                                  load_vars = load_vars,
+                                  function_set = function_set,
+                                  filter_sets = filter_sets,
+                                  fail_data = fail_data,
+                                  progress = progress)
+            shard.write_passed(start, stop, passed)
+            logger.info(f'{len(passed)} of {stop - start} combinations of shard {shard.index} passed')
+        ## [END] SHARD FILTER STAGE ===========================================
+
+        ## DRY RUN ============================================================
+        elif dry_run:
+            estimate_permutations(permutations,
+                                  pass_data,
+                                  fail_data,
+                                  load_vars = load_vars,
+                                  function_set = function_set,
+                                  filter_sets = filter_sets,
+                                  cost_params = cost_params,
+                                  progress = progress,
+                                  first_iter = first_iter)
+        ## [END] DRY RUN ======================================================
+
+        ## PARALLEL LOOP ======================================================
+        elif n_workers > 1:
+            process_permutations_parallel(permutations,
+                                          n_workers = n_workers,
+                                          chunk_size = chunk_size,
+                                          load_vars = load_vars,
+                                          function_set = function_set,
+                                          filter_sets = filter_sets,
+                                          print_inputs = print_inputs,
+                                          print_sets = print_sets,
+                                          plot_sets = plot_sets,
+                                          journal = journal,
+                                          pass_data = pass_data,
+                                          fail_data = fail_data,
+                                          timing = timing,
+                                          progress = progress,
+                                          first_iter = first_iter,
+                                          store = store,
+                                          nc_options = nc_options)
+        ## [END] PARALLEL LOOP ================================================
+
+        ## CORE LOOP ==========================================================
+        else:
+            _process_permutations_serial(permutations,
+                                         journal,
+                                         pass_data,
+                                         fail_data,
+                                         load_vars = load_vars,
+                                         function_set = function_set,
+                                         filter_sets = filter_sets,
+                                         print_inputs = print_inputs,
+                                         print_sets = print_sets,
+                                         plot_sets = plot_sets,
+                                         timing = timing,
+                                         progress = progress,
+                                         first_iter = first_iter,
+                                         store = store,
+                                         nc_options = nc_options)
+        ## [END] CORE LOOP ====================================================
+
+    # The log level of this run is restored last, after the final messages
+    except BaseException:
+        set_log_level(previous_log_level)
+        raise
+
+    ## Save out summaries
+    finally:
+        if progress is not None:
+            progress.close()
+        if store is not None:
+            store.close()
+        if journal is not None:
+            journal.close()
+        df_pass = _close_summary(pass_data)
+        df_fail = _close_summary(fail_data)
+        if timing is not None:
+            timing.collect(drain_records())
+            timing.close()
+            disable_instrumentation()
+        set_path_resolver(previous_resolver)
+
+    try:
+        if dry_run:
+            summarize_costs(df_pass, base_path=resolver.get('is'), name=resolver.get('name'))
+            logger.info(f'DRY RUN COMPLETE: {len(df_fail)} combinations failed, no files created')
+        else:
+            logger.info('FILE GENERATION SUCCESSFUL!')
+    finally:
+        set_log_level(previous_log_level)
+    return df_pass,df_fail
+
+
+
+def _close_summary(summary_data):
+    '''
+    Finalizes a summary writer, or makes a DataFrame of a list of rows (ie-
+    the summary a shard stage does not write)
+    '''
+    if isinstance(summary_data, list):
+        return pd.DataFrame(summary_data)
+    return summary_data.close()
+
+
+
+def _process_permutations_serial(permutations,
+                                 journal,
+                                 pass_data,
+                                 fail_data,
+                                 load_vars = None,
+                                 function_set = None,
+                                 filter_sets = None,
+                                 print_inputs = True,
+                                 print_sets = None,
+                                 plot_sets = None,
+                                 timing = None,
+                                 progress = None,
+                                 first_iter = 1,
+                                 store = None,
+                                 nc_options = None):
+    '''
+    Core loop of `process_design_matrix`, one combination at a time. Summary
+    rows are appended to `pass_data`/`fail_data`, instrumentation records to
+    `timing`, progress to `progress`, and NetCDF data to the ensemble `store`
+    (if any), with `nc_options` (see `get_net_cdf`). Trials are numbered from
+    `first_iter`.
+    '''
+    k = first_iter
+    for perm_i, var_dict in permutations:
+        logger.debug(f'\nStarted processing permutation: {perm_i:05}...')
         # Keep track of the combination index, regardless if it fails
         combo_num = perm_i + 1
 
-        # Convert row to dictionary form
-        var_dict = row.to_dict()
+        # Record of the combination in the journal, if resuming
+        entry = journal.lookup(combo_num, var_dict)
+        row_dict = var_dict
+        start_trial(combo_num)
+
+        ## Merge with load set, add on dependent parameters, and filter
+        var_dict, failed_params = evaluate_combination(var_dict,
+                                                       load_vars,
+                                                       function_set,
+                                                       filter_sets)
 
-        # Merge with load set
-        if load_sets:
-            var_dict = {**var_dict, **load_vars}
-    
-        ## Add on dependent parameters
-        var_dict = add_dependent_values(var_dict,function_set)
-        
-        ## Filtering conditions
-        failed_params = apply_filters(var_dict,filter_sets)      
-        
         # FAILURE CASES -------------------------------------------------------
         if failed_params is not None:
             # Add on required parameters (just combo num)
             failed_params['COMBO_NUM'] = combo_num
             # Append to list
             fail_data.append(failed_params)
-            print(f'Combination {combo_num:05} FAILED. Moving on.')
+            if entry is None or 'failed' not in entry:
+                journal.record_fail(combo_num, row_dict, failed_params)
+            end_trial()
+            logger.log(TRIAL, f'Combination {combo_num:05} FAILED. Moving on.')
         # [END] FAILURE CASES -------------------------------------------------
-        
-        
-        
+
+        # RESUMED CASES -------------------------------------------------------
+        elif (entry is not None and 'failed' not in entry
+              and journal.is_complete(entry, k) and journal.is_current(entry, var_dict)):
+            pass_data.append(entry['attrs'])
+            end_trial()
+            logger.log(TRIAL, f'Trial {k:05} already complete (journal). Moving on.')
+            k = k + 1
+        # [END] RESUMED CASES -------------------------------------------------
+
+
+
         # SUCCESSFUL CASES ----------------------------------------------------
-        elif failed_params is None:    
-            ##  Add on required parameters
-            var_dict = add_required_params(var_dict,k,combo_num)
-            
-            # Create files other than input.txt 
-            if print_sets:                                                                                    
-                var_dict = print_supporting_file(var_dict,print_sets)
-                
-            # Output plots for visualization of input
-            if plot_sets:                                               
-                plot_supporting_file(var_dict,plot_sets)
-
-            # Create xarray
-            ds = get_net_cdf(var_dict)       
-
-            ## Print `input.txt` for this given trial
-            if print_inputs:
-                print_input_dot_text(ds.attrs)
-                
+        else:
+            ## Print supporting files, plots, NetCDF, and input.txt
+            var_hash = hash_content(var_dict)
+            attrs = build_trial(var_dict,
+                                k,
+                                combo_num,
+                                print_inputs = print_inputs,
+                                print_sets = print_sets,
+                                plot_sets = plot_sets,
+                                store = store,
+                                nc_options = nc_options)
+
             # Get data for summary
-            pass_data.append(ds.attrs)
+            pass_data.append(attrs)
+            journal.record_pass(combo_num, row_dict, attrs, var_hash)
+            end_trial(k)
 
             ## End loop iteration
-            print(f'SUCCESSFULLY PRINTED FILES FOR TRIAL: {k:05}',flush=True)
-            print('#'*40)
+            logger.log(TRIAL, f'SUCCESSFULLY PRINTED FILES FOR TRIAL: {k:05}')
+            logger.debug('#'*40)
             k = k + 1
         # [END] SUCCESSFUL CASES ----------------------------------------------
-    ## [END] CORE LOOP ========================================================
 
-    ## Save out summaries
-    df_pass,df_fail = save_out_summary(pass_data,fail_data,summary_formats)
-    print('FILE GENERATION SUCCESSFUL!')
-    return df_pass,df_fail
+        if timing is not None:
+            timing.collect(drain_records())
+        if progress is not None:
+            progress.update(combo_num)
+    return
@@ -1,117 +1,317 @@
-import pandas as pd
-import pickle
-from itertools import product
-from concurrent.futures import ProcessPoolExecutor, as_completed
-
-def process_permutation(k, perm, variable_ranges, set_name, pipeline, p, print_inputs, print_sets, plot_sets):
-    # Create dictionary for parameters and values in permutation
-    var_dict = dict(zip(variable_ranges.keys(), perm))
-    ptr = fpy.get_FW_tri_paths(tri_num=k)
-
-    # Add iteration-dependent values
-    var_dict['TITLE'] = f'input_{k:05}'
-    var_dict['DEP_PARAM_PIPELINE'] = set_name
-    var_dict['RESULT_FOLDER'] = ptr['RESULT_FOLDER']
-    var_dict['ITER'] = k
-
-    # Add dependent parameters
-    var_dict = add_dependent_values(var_dict, pipeline)
-
-    # Apply filter functions, proceed if none fail
-    failed_params = None
-    if filter_sets is not None:
-        failed_params = apply_filters(var_dict, filter_sets)
-
-    # Proceed if no failures
-    if failed_params is None:
-        # Print supporting files if indicated
-        if print_sets is not None:
-            var_dict = print_supporting_file(var_dict, print_sets)
-
-        # Plot supporting plots if indicated
-        if plot_sets is not None:
-            plot_supporting_file(var_dict, plot_sets)
-
-        # Print input.txt files if indicated
-        if print_inputs:
-            print_input_file(var_dict, ptr)
-
-        # Output individual trial data
-        with open(ptr['i_file_pkl'], 'wb') as f:
-            pickle.dump(var_dict, f)
-
-        return var_dict, ptr['RESULT_FOLDER']  # Return results
-    else:
-        return None, failed_params  # Return None for failed
-
-def write_files2(matrix, 
-                  print_inputs=True,
-                  function_sets=None, 
-                  filter_sets=None,
-                  print_sets=None, 
-                  plot_sets=None, 
-                  extra_values=None):
-    
-    ###########################################################
-    # Setup
-    ###########################################################
-    make_FW_paths()
-    p = get_FW_paths()
-
-    complete_matrix = []
-    all_dicts = {}
-    filter_failures = pd.DataFrame()
-
-    ###########################################################
-    # Finding permutations of all variables
-    ###########################################################
-    variable_ranges = group_variables(matrix)
-
-    # Add on extra values if provided
-    if extra_values is not None:
-        variable_ranges = add_extra_values(variable_ranges, extra_values)
-
-    # Get all possible permutations
-    permutations = list(product(*[variable_ranges[var] for var in variable_ranges]))
-
-    ###########################################################
-    # Looping through all permutations
-    ###########################################################
-    k = 1
-    with ProcessPoolExecutor() as executor:
-        futures = []
-        
-        # Loop: Processing Pipeline
-        for set_name, pipeline in function_sets.items():
-            # Loop: Permutation of variables
-            for perm in permutations:
-                futures.append(executor.submit(process_permutation, k, perm, variable_ranges, set_name, pipeline, p, print_inputs, print_sets, plot_sets))
-                k += 1
-
-        # Handle results
-        for future in as_completed(futures):
-            result, folder_or_failed = future.result()
-            if result is None:
-                # Record failure if triggered
-                filter_failures = pd.concat([filter_failures, folder_or_failed], ignore_index=True, sort=False)
-                print(f'PERMUTATION DOES NOT PASS FILTER: SKIP')
-            else:
-                # Update summaries
-                complete_matrix.append(pd.DataFrame([result]))
-                all_dicts[f'tri_{k:05}'] = folder_or_failed
-                print(f'SUCCESSFULLY PRINTED FILES FOR TRIAL: {k:05}')
-                print('#########################################################')
-                
-    ###########################################################
-    # Save summary files
-    ########################################################### 
-    with open(p['Id'], 'wb') as f:
-        pickle.dump(all_dicts, f)
-
-    complete_matrix = pd.concat(complete_matrix, ignore_index=True, sort=False)
-    complete_matrix.to_csv(p['Im'], index=False)
-
-    # Save failures to CSV
-    filter_failures.to_csv(p['If'], index=False)
-
-    return
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+
+from ._process_combination import evaluate_combination, build_trial
+from ._instrumentation import enable_instrumentation, start_trial, end_trial, drain_records
+from ._journal import hash_content
+from ._vectorized_pipeline import VectorizedFailure
+
+# Outer module imports
+from ..setup_paths_envs import set_path_resolver, get_path_resolver
+from ..log_tools import logger, TRIAL, set_log_level, get_log_level
+
+
+'''
+Multi-process version of the core loop of `process_design_matrix`.
+
+Trial numbers (ITER) must be identical to those of the serial version, which
+are consecutive over the PASSING combinations in COMBO_NUM order. Since the
+ITER of a combination depends on how many combinations before it passed, the
+work is split into two stages:
+    1. FILTER: chunks of combinations have their dependent values added and
+        filters applied in the workers, returning only pass/fail
+    2. BUILD: as filter results come back (in COMBO_NUM order), ITERs are
+        assigned to passing combinations, which are then sent back out to
+        the workers to create the files.
+
+The dependency functions are rerun in the BUILD stage rather than sending
+the (potentially large) xarray objects between processes. With an ensemble
+store, the (compacted) NetCDF data of each trial is sent back to the main
+process, which is the only one to write to the store. If there are no
+filters, every combination passes (other than those that failed the
+vectorized filters, see `VectorizedFailure`, which are recorded by the main
+process) and the FILTER stage is skipped entirely.
+When resuming, trials found complete in the journal are still evaluated in
+the BUILD stage, but their files are only rebuilt if the content hash of
+their final parameters has changed (see `hash_content`). Trials are
+journaled as soon as they (and all trials before them) are complete.
+'''
+
+# State of each worker process, set once by `_init_worker`
+_WORKER_STATE = {}
+
+
+def _init_worker(state):
+    '''
+    Sets the functions/load data needed by the worker once, rather than
+    sending them along with each chunk
+    '''
+    _WORKER_STATE.update(state)
+    set_log_level(state['log_level'])
+    set_path_resolver(state['resolver'])
+    if state.get('instrument'):
+        enable_instrumentation(state.get('profile_dir'))
+
+
+def _filter_chunk(chunk):
+    '''
+    FILTER stage: returns failed_params (or None if passed) for each
+    (perm_i, var_dict) in the chunk, and any instrumentation records
+    '''
+    results = []
+    for perm_i, var_dict in chunk:
+        start_trial(perm_i + 1)
+        _, failed_params = evaluate_combination(var_dict,
+                                                _WORKER_STATE['load_vars'],
+                                                _WORKER_STATE['function_set'],
+                                                _WORKER_STATE['filter_sets'])
+        end_trial()
+        results.append(failed_params)
+    return results, drain_records()
+
+
+def _build_chunk(chunk):
+    '''
+    BUILD stage: creates the files of each (var_dict, iter_num, combo_num,
+    var_hash) in the chunk and returns the attributes for the summary (None
+    for trials already complete in the journal, with an unchanged `var_hash`),
+    the content hash of each trial, any instrumentation records, and the
+    NetCDF data for the ensemble store (None without one)
+    '''
+    all_attrs, var_hashes = [], []
+    datasets = [] if _WORKER_STATE['ensemble'] else None
+    for var_dict, iter_num, combo_num, journal_hash in chunk:
+        start_trial(combo_num)
+        var_dict, _ = evaluate_combination(var_dict,
+                                           _WORKER_STATE['load_vars'],
+                                           _WORKER_STATE['function_set'],
+                                           [])
+        var_hash = hash_content(var_dict)
+        var_hashes.append(var_hash)
+        if journal_hash == var_hash:
+            end_trial()
+            all_attrs.append(None)
+            logger.log(TRIAL, f'Trial {iter_num:05} already complete (journal). Moving on.')
+            continue
+        attrs = build_trial(var_dict,
+                            iter_num,
+                            combo_num,
+                            print_inputs = _WORKER_STATE['print_inputs'],
+                            print_sets = _WORKER_STATE['print_sets'],
+                            plot_sets = _WORKER_STATE['plot_sets'],
+                            store = datasets,
+                            nc_options = _WORKER_STATE['nc_options'])
+        end_trial(iter_num)
+        all_attrs.append(attrs)
+        logger.log(TRIAL, f'SUCCESSFULLY PRINTED FILES FOR TRIAL: {iter_num:05}')
+    return all_attrs, var_hashes, drain_records(), datasets
+
+
+def _chunk_permutations(permutations, chunk_size):
+    '''
+    Yields lists of `chunk_size` (perm_i, var_dict) pairs
+    '''
+    permutations = iter(permutations)
+    while True:
+        chunk = list(islice(permutations, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class _OrderedResults:
+    '''
+    Passing trials in ITER order, pending in a BUILD stage future. Each is
+    (var_dict, iter_num, combo_num, entry), with the journal `entry` of the
+    trials that may be reused from it. Completed trials are moved into
+    `pass_data` (and journaled) strictly in order, after their NetCDF data
+    is added to the ensemble `store` (if any). While more than `max_pending`
+    BUILD stage futures are in flight, harvesting waits on the oldest, such
+    that the results held in memory stay bounded.
+    '''
+    def __init__(self, journal, pass_data, timing, store=None, max_pending=None):
+        self.journal = journal
+        self.pending = deque()
+        self.pass_data = pass_data
+        self.timing = timing
+        self.store = store
+        self.max_pending = max_pending
+        self.n_futures = 0
+
+    def add_future(self, future, to_build):
+        self.pending.append((future, to_build))
+        self.n_futures = self.n_futures + 1
+
+    def harvest(self, wait=False):
+        while self.pending:
+            future, to_build = self.pending[0]
+            full = self.max_pending is not None and self.n_futures > self.max_pending
+            if not (wait or full or future.done()):
+                return
+            all_attrs, var_hashes, records, datasets = future.result()
+            self.n_futures = self.n_futures - 1
+            if self.timing is not None:
+                self.timing.collect(records)
+            if self.store is not None:
+                self.store.extend(datasets)
+            for (var_dict, _, combo_num, entry), attrs, var_hash in zip(to_build, all_attrs, var_hashes):
+                # Reused from the journal
+                if attrs is None:
+                    self.pass_data.append(entry['attrs'])
+                    continue
+                if self.journal is not None:
+                    self.journal.record_pass(combo_num, var_dict, attrs, var_hash)
+                self.pass_data.append(attrs)
+            self.pending.popleft()
+
+
+def process_permutations_parallel(permutations,
+                                  n_workers = 2,
+                                  chunk_size = 16,
+                                  load_vars = None,
+                                  function_set = None,
+                                  filter_sets = None,
+                                  print_inputs = True,
+                                  print_sets = None,
+                                  plot_sets = None,
+                                  journal = None,
+                                  pass_data = None,
+                                  fail_data = None,
+                                  timing = None,
+                                  progress = None,
+                                  first_iter = 1,
+                                  store = None,
+                                  nc_options = None):
+    '''
+    Processes all permutations with a pool of `n_workers` processes.
+
+    Arguments:
+    - permutations (iterable): (perm_i, var_dict) of each combination to
+        process, in order
+    - n_workers (int): number of worker processes
+    - chunk_size (int): number of combinations sent to a worker at a time
+    - journal (TrialJournal/None): journal of completed combinations
+    - pass_data/fail_data (list/SummaryWriter/None): where the summary rows
+        are appended, new lists if None
+    - timing (TimingCollector/None): collects the instrumentation records of
+        the workers, if instrumentation is on
+    - progress (ProgressLine/None): progress line, updated as chunks finish
+    - first_iter (int): ITER of the first passing combination
+    - store (EnsembleStore/None): ensemble store of the NetCDF data, written
+        by the main process only
+    - nc_options (dict/None): passed on to `get_net_cdf`
+    - remaining arguments as in `process_design_matrix`
+
+    Returns:
+    - pass_data (list): attributes of each passing trial, in ITER order
+    - fail_data (list): failed parameters of each failed combination, in
+        COMBO_NUM order
+    '''
+    state = {'load_vars': load_vars,
+             'function_set': function_set,
+             'filter_sets': filter_sets,
+             'print_inputs': print_inputs,
+             'print_sets': print_sets,
+             'plot_sets': plot_sets,
+             'nc_options': nc_options,
+             'log_level': get_log_level(),
+             'resolver': get_path_resolver(),
+             'ensemble': store is not None,
+             'instrument': timing is not None,
+             'profile_dir': timing.profile_dir if timing is not None else None}
+
+    pass_data = [] if pass_data is None else pass_data
+    fail_data = [] if fail_data is None else fail_data
+    results = _OrderedResults(journal, pass_data, timing, store, max_pending=2*n_workers)
+    k = first_iter
+
+    def lookup(perm_i, var_dict):
+        if journal is None:
+            return None
+        return journal.lookup(perm_i + 1, var_dict)
+
+    def submit_build(to_build):
+        # Trials complete in the journal are only rebuilt if their final
+        # parameters changed, which is checked by the worker
+        chunk = [(var_dict, iter_num, combo_num, entry['var_hash'] if entry else None)
+                 for var_dict, iter_num, combo_num, entry in to_build]
+        results.add_future(executor.submit(_build_chunk, chunk), to_build)
+
+    def record_failure(combo_num, var_dict, failed_params, entry):
+        failed_params['COMBO_NUM'] = combo_num
+        fail_data.append(failed_params)
+        if journal is not None and (entry is None or 'failed' not in entry):
+            journal.record_fail(combo_num, var_dict, failed_params)
+        logger.log(TRIAL, f'Combination {combo_num:05} FAILED. Moving on.')
+
+    def reusable(entry, iter_num):
+        return (entry is not None and 'failed' not in entry
+                and 'var_hash' in entry and journal.is_complete(entry, iter_num))
+
+    chunks = _chunk_permutations(permutations, chunk_size)
+    with ProcessPoolExecutor(max_workers=n_workers,
+                             initializer=_init_worker,
+                             initargs=(state,)) as executor:
+
+        ## NO FILTERS: every combination passes, ITER follows COMBO_NUM
+        # (at most 2*n_workers BUILD stage chunks in flight, see `harvest`)
+        if not filter_sets:
+            for chunk in chunks:
+                to_build = []
+                for perm_i, var_dict in chunk:
+                    entry = lookup(perm_i, var_dict)
+                    if isinstance(var_dict, VectorizedFailure):
+                        record_failure(perm_i + 1, var_dict, dict(var_dict.failed_params), entry)
+                        continue
+                    to_build.append((var_dict, k, perm_i + 1, entry if reusable(entry, k) else None))
+                    k = k + 1
+                if to_build:
+                    submit_build(to_build)
+                results.harvest()
+                if progress is not None:
+                    progress.update(chunk[-1][0] + 1)
+
+        ## FILTERS: keep a bounded window of FILTER (and BUILD) stage chunks
+        ## in flight
+        else:
+            def submit_filter(chunk):
+                entries = [lookup(perm_i, var_dict) for perm_i, var_dict in chunk]
+                return (chunk, entries, executor.submit(_filter_chunk, chunk))
+
+            filter_futures = deque()
+            for chunk in islice(chunks, 2*n_workers):
+                filter_futures.append(submit_filter(chunk))
+
+            while filter_futures:
+                # Oldest chunk first, such that ITERs are assigned in order
+                chunk, entries, future = filter_futures.popleft()
+                filter_results, records = future.result()
+                if timing is not None:
+                    timing.collect(records)
+
+                # Refill the window
+                next_chunk = next(chunks, None)
+                if next_chunk is not None:
+                    filter_futures.append(submit_filter(next_chunk))
+
+                # Assign ITERs to passing combinations
+                to_build = []
+                for (perm_i, var_dict), entry, failed_params in zip(chunk, entries, filter_results):
+                    combo_num = perm_i + 1
+                    if failed_params is not None:
+                        record_failure(combo_num, var_dict, failed_params, entry)
+                    else:
+                        to_build.append((var_dict, k, combo_num, entry if reusable(entry, k) else None))
+                        k = k + 1
+
+                if to_build:
+                    submit_build(to_build)
+                results.harvest()
+                if progress is not None:
+                    progress.update(chunk[-1][0] + 1)
+
+        ## Collect the rest in ITER order
+        results.harvest(wait=True)
+
+    return results.pass_data, fail_data
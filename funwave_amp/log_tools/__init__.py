@@ -0,0 +1 @@
+from ._logger import logger, set_log_level, get_log_level, ProgressLine, TRIAL
\ No newline at end of file
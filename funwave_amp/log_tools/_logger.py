@@ -0,0 +1,142 @@
+import sys
+import time
+import logging
+
+
+'''
+Leveled logging for FUNWAVE_AMP. All messages go through the `funwave_amp`
+logger, printed to stdout as-is. The levels are:
+    > debug   : everything, including the output of every function applied
+                to every trial
+    > trial   : one line per trial/failed combination (default)
+    > info    : only messages about the run as a whole
+    > progress: as 'info', plus a single progress line that is updated in
+                place (or printed periodically if stdout is not a terminal,
+                ie- a SLURM log file)
+    > warning : warnings only
+'''
+
+# Custom level between DEBUG and INFO for one line per trial
+TRIAL = 15
+logging.addLevelName(TRIAL, 'TRIAL')
+
+LOG_LEVELS = {'debug': logging.DEBUG,
+              'trial': TRIAL,
+              'info': logging.INFO,
+              'progress': logging.INFO,
+              'warning': logging.WARNING}
+
+
+class _StdoutHandler(logging.StreamHandler):
+    '''
+    Writes to whatever `sys.stdout` currently is
+    '''
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+logger = logging.getLogger('funwave_amp')
+if not logger.handlers:
+    _handler = _StdoutHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.propagate = False
+    logger.setLevel(TRIAL)
+
+# Name of the current level
+_LEVEL = {'name': 'trial'}
+
+
+def set_log_level(level):
+    '''
+    Sets the level of the `funwave_amp` logger, one of 'debug', 'trial',
+    'info', 'progress', or 'warning'
+    '''
+    if level not in LOG_LEVELS:
+        raise ValueError(f'`level` must be one of {list(LOG_LEVELS)}, not {level}')
+    _LEVEL['name'] = level
+    logger.setLevel(LOG_LEVELS[level])
+
+
+def get_log_level():
+    return _LEVEL['name']
+
+
+def _format_seconds(seconds):
+    seconds = int(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f'{hours:d}:{minutes:02d}:{seconds:02d}'
+
+
+class ProgressLine:
+    '''
+    Progress of the generation, only shown at the 'progress' level. Since
+    combinations are processed in order, progress is measured by the current
+    combination number out of `n_total`.
+    '''
+    def __init__(self, n_total, pass_data, fail_data, timing=None, interval=30, offset=0):
+        '''
+        Arguments:
+        - n_total (int): number of combinations
+        - pass_data/fail_data (list/SummaryWriter): summary rows, for counts
+        - timing (TimingCollector/None): stage totals, for the slowest stage
+        - interval (float): seconds between lines if not a terminal
+        - offset (int): combination number before the first one, if added on
+            to an existing generation
+        '''
+        self.enabled = get_log_level() == 'progress'
+        self.n_total = max(int(n_total), 1)
+        self.pass_data = pass_data
+        self.fail_data = fail_data
+        self.timing = timing
+        self.offset = offset
+        self.n_before = (len(pass_data), len(fail_data))
+        self.is_tty = sys.stdout.isatty()
+        self.interval = 0.2 if self.is_tty else interval
+
+        self.start = time.perf_counter()
+        self.last = None
+        self.combo_num = 0
+
+    def update(self, combo_num, force=False):
+        if not self.enabled:
+            return
+        self.combo_num = max(self.combo_num, combo_num - self.offset)
+        now = time.perf_counter()
+        if not force and self.last is not None and now - self.last < self.interval:
+            return
+        self.last = now
+
+        # Rate and ETA
+        elapsed = now - self.start
+        rate = self.combo_num / elapsed if elapsed > 0 else 0.0
+        eta = (self.n_total - self.combo_num) / rate if rate > 0 else 0.0
+        line = (f'[{self.combo_num}/{self.n_total} {100*self.combo_num/self.n_total:5.1f}%] '
+                f'{rate:.1f} comb/s, elapsed {_format_seconds(elapsed)}, ETA {_format_seconds(eta)} | '
+                f'passed {len(self.pass_data) - self.n_before[0]}, '
+                f'failed {len(self.fail_data) - self.n_before[1]}')
+
+        # Slowest stage so far
+        if self.timing is not None and self.timing.stage_totals:
+            stage, seconds = max(self.timing.stage_totals.items(), key=lambda item: item[1])
+            line = line + f' | slowest stage: {stage} ({seconds:.1f} s)'
+
+        if self.is_tty:
+            sys.stdout.write('\r' + line + ' ' * 4)
+            sys.stdout.flush()
+        else:
+            logger.info(line)
+
+    def close(self):
+        if not self.enabled:
+            return
+        self.update(self.combo_num, force=True)
+        if self.is_tty:
+            sys.stdout.write('\n')
+            sys.stdout.flush()
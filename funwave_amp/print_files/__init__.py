@@ -3,4 +3,5 @@ from .print_FRICTION_FILE import print_FRICTION_FILE
 from .print_FRICTION_or_BREAKWATER_FILE import print_FRICTION_OR_BREAKWATER_FILE
 from .print_STATIONS_FILE import print_STATIONS_FILE
 from .print_WK_TIME_SERIES import print_WK_TIME_SERIES
-from .print_input_dot_text import print_input_dot_text
\ No newline at end of file
+from .print_input_dot_text import print_input_dot_text
+from ._input_template import InputTemplate, write_input_files
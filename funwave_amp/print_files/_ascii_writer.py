@@ -0,0 +1,157 @@
+import re
+import numpy as np
+
+
+"""
+High-throughput ASCII writer for supporting files (DEPTH_FILE, FRICTION_FILE,
+BREAKWATER_FILE, ...), producing the SAME bytes as `np.savetxt`. Rather than
+formatting every value through Python, a block of rows is formatted at once:
+    > each value is split into its sign, integer, and fractional digits with
+      integer arithmetic, into a fixed-width byte array (one row per value),
+      followed by the delimiter, or a newline at the end of a row
+    > the padding of narrower values is dropped, and the block is written
+      with a single call
+Values whose last digit could round differently than `%f` (ie- exactly
+half-way, or too large to scale exactly) are formatted by Python instead.
+Arrays whose rows are all identical (ie- 1D domains broadcast along Y) are
+formatted once and the line is repeated.
+
+Only fixed-point (`%f`, `%.Nf`) and integer (`%d`) formats are accelerated,
+anything else falls back to `np.savetxt`.
+"""
+
+_FIXED_FMT = re.compile(r'^%(?:\.(\d))?f$')
+_BLOCK_SIZE = 1 << 20           # Values formatted at once
+_MAX_SCALED = 2.0**52           # Largest exact scaled value
+
+
+def _parse_fmt(fmt):
+    '''
+    Number of decimals of a fixed-point format, 0 and True for `%d`, or None
+    if the format is not accelerated
+    '''
+    if fmt == '%d':
+        return 0, True
+    match = _FIXED_FMT.match(fmt)
+    if match is None:
+        return None, False
+    return (6 if match.group(1) is None else int(match.group(1))), False
+
+
+def _format_block(values, decimals, is_int, fmt, separators):
+    '''
+    Formats a flat block of values, each followed by its separator
+
+    Returns:
+    - bytes: the formatted block
+    '''
+    n = len(values)
+
+    # Scaled absolute value, rounded as `%f` would (ie- -0.000000 keeps its sign)
+    if is_int:
+        negative = values < 0
+        rounded = np.abs(values)
+        slow = np.zeros(n, dtype=bool)
+    else:
+        negative = np.signbit(values)
+        with np.errstate(invalid='ignore'):
+            scaled = np.abs(values) * 10.0**decimals
+            floor = np.floor(scaled)
+            remainder = scaled - floor
+            slow = ~(scaled < _MAX_SCALED) | (np.abs(remainder - 0.5) <= 1e-7 + scaled * 4.5e-16)
+        rounded = np.where(slow, 0, floor + (remainder > 0.5))
+
+    # Smallest unsigned type for the digit arithmetic
+    max_rounded = int(rounded.max()) if n else 0
+    rounded = rounded.astype(np.uint32 if max_rounded < 2**32 else np.uint64)
+    whole = rounded // (10**decimals) if decimals else rounded
+    width_whole = len(str(int(whole.max()))) if n else 1
+
+    ## Fixed-width characters (transposed), right aligned, 0 marks padding
+    width = 1 + width_whole + (decimals + 1 if decimals else 0) + 1
+    chars = np.zeros((width, n), dtype=np.uint8)
+    chars[-1] = separators
+    column = width - 2
+    remaining = rounded
+    for _ in range(decimals):
+        remaining, digit = np.divmod(remaining, 10)
+        chars[column] = digit
+        chars[column] += ord('0')
+        column = column - 1
+    if decimals:
+        chars[column] = ord('.')
+        column = column - 1
+
+    # Integer part, without leading zeros
+    n_whole = np.ones(n, dtype=np.int64)
+    for j in range(width_whole):
+        remaining, digit = np.divmod(remaining, 10)
+        chars[column] = digit
+        chars[column] += ord('0')
+        if j > 0:
+            leading = whole < 10**j
+            chars[column][leading] = 0
+            n_whole += ~leading
+        column = column - 1
+
+    # Sign directly before the first digit
+    index = np.flatnonzero(negative)
+    chars[column + width_whole - n_whole[index], index] = ord('-')
+    chars = np.ascontiguousarray(chars.T)
+
+    ## Values that need Python's formatting
+    for i in np.flatnonzero(slow):
+        text = (fmt % values[i]).encode()
+        if len(text) + 1 > width:
+            # Too wide for the block: format the whole block by Python
+            return b''.join((fmt % value).encode() + bytes([sep])
+                            for value, sep in zip(values, separators))
+        chars[i] = 0
+        chars[i, width - 1 - len(text):width - 1] = np.frombuffer(text, dtype=np.uint8)
+        chars[i, -1] = separators[i]
+
+    return chars[chars != 0].tobytes()
+
+
+def write_ascii_array(path, array, fmt='%f', delimiter=' '):
+    '''
+    Writes an array as `np.savetxt(path, array, fmt=fmt, delimiter=delimiter)`
+    would, byte for byte
+
+    Arguments:
+    - path (str): path of the file
+    - array (array): 1D (one value per line) or 2D array
+    - fmt (str): format of every value
+    - delimiter (str): delimiter between the values of a row
+    '''
+    array = np.asarray(array)
+    if array.ndim == 1:
+        array = array.reshape(-1, 1)
+    decimals, is_int = _parse_fmt(fmt)
+    accelerated = (decimals is not None and array.ndim == 2 and len(delimiter) == 1
+                   and array.dtype.kind in ('iu' if is_int else 'iuf'))
+    if not accelerated or array.size == 0:
+        np.savetxt(path, array, fmt=fmt, delimiter=delimiter)
+        return
+
+    n_rows, n_cols = array.shape
+    row_separators = np.full(n_cols, ord(delimiter), dtype=np.uint8)
+    row_separators[-1] = ord('\n')
+
+    # Rows broadcast from a single row (ie- an alongshore-uniform field) are
+    # identical without comparing them, or copying the whole array
+    broadcast_rows = n_rows > 1 and array.strides[0] == 0
+    values = (array[:1] if broadcast_rows else array).astype(np.int64 if is_int else np.float64)
+
+    with open(path, 'wb') as f:
+        # Identical rows: format one and repeat the line
+        if broadcast_rows or (n_rows > 1 and np.array_equal(values, np.broadcast_to(values[0], values.shape))):
+            line = _format_block(values[0], decimals, is_int, fmt, row_separators)
+            f.write(line * n_rows)
+            return
+
+        rows_per_block = max(1, _BLOCK_SIZE // n_cols)
+        for start in range(0, n_rows, rows_per_block):
+            block = values[start:start + rows_per_block]
+            separators = np.tile(row_separators, len(block))
+            f.write(_format_block(block.ravel(), decimals, is_int, fmt, separators))
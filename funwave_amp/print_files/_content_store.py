@@ -0,0 +1,105 @@
+import os
+import shutil
+import hashlib
+import numpy as np
+from ._ascii_writer import write_ascii_array
+from ..setup_paths_envs import get_env
+from ..log_tools import logger
+
+
+"""
+Content-addressed store for supporting files (DEPTH_FILE, FRICTION_FILE,
+WaveCompFile, STATIONS_FILE, ...). Many trials of a design matrix often share
+identical supporting files, ie- the same bathymetry for every wave height.
+The store mode is set by `file_store` in `setup_key_dirs`:
+    > None      : a file is written for every trial (default)
+    > 'shared'  : each unique file is written ONCE, named by the hash of its
+                  content, and input.txt points at that shared copy
+    > 'hardlink': as 'shared', but the usual per-trial file name is a hard
+                  link to the shared copy (no extra data is written)
+    > 'symlink' : as 'hardlink', with symbolic links
+"""
+
+FILE_STORE_MODES = [None, 'shared', 'hardlink', 'symlink']
+
+
+def get_file_store():
+    '''
+    Content-addressed store mode from the environment
+    '''
+    mode = get_env('file_store') or None
+    if mode not in FILE_STORE_MODES:
+        raise ValueError(f'`file_store` must be one of {FILE_STORE_MODES}, not {mode}')
+    return mode
+
+
+def hash_array(array, fmt):
+    '''
+    Content hash of an array, as it would be printed with `fmt`
+    '''
+    array = np.ascontiguousarray(array)
+    sha = hashlib.sha1()
+    sha.update(f'{fmt}|{array.dtype.str}|{array.shape}|'.encode())
+    sha.update(array.tobytes())
+    return sha.hexdigest()
+
+
+def _link(shared_path, trial_path, mode):
+    '''
+    Points the per-trial file name at the shared copy
+    '''
+    if os.path.lexists(trial_path):
+        os.remove(trial_path)
+    try:
+        if mode == 'hardlink':
+            os.link(shared_path, trial_path)
+        else:
+            os.symlink(os.path.abspath(shared_path), trial_path)
+    # Links not supported by the file system- fall back to a copy
+    except OSError:
+        shutil.copyfile(shared_path, trial_path)
+
+
+def save_supporting_file(array, trial_path, fmt, delimiter=' '):
+    '''
+    Saves an array to a supporting file as `np.savetxt` would (with the fast
+    writer of `_ascii_writer.py`), respecting the content-addressed store
+    mode.
+
+    Arguments:
+    - array (array): array to print
+    - trial_path (str): per-trial path of the file (ie- bathy_00001.txt)
+    - fmt (str): format of `np.savetxt`
+    - delimiter (str): delimiter of `np.savetxt`
+
+    Returns:
+    - path (str): path that input.txt should point at
+    - content_hash (str/None): hash of the content, None if not in a store mode
+    '''
+    mode = get_file_store()
+    if mode is None:
+        write_ascii_array(trial_path, array, fmt=fmt, delimiter=delimiter)
+        return trial_path, None
+
+    # Shared copy, named by hash, in the same directory (ie- bathy_<hash>.txt)
+    content_hash = hash_array(array, fmt)
+    directory, file_name = os.path.split(trial_path)
+    # With a fan-out layout, in the base directory of all the subdirectories
+    if int(get_env('fan_digits') or 0):
+        directory = os.path.dirname(directory)
+    prefix = file_name.split('_')[0]
+    shared_path = os.path.join(directory, f'{prefix}_{content_hash[:16]}.txt')
+
+    # Only write unique content, atomically since workers may race
+    if not os.path.exists(shared_path):
+        tmp_path = f'{shared_path}.{os.getpid()}.tmp'
+        write_ascii_array(tmp_path, array, fmt=fmt, delimiter=delimiter)
+        os.replace(tmp_path, shared_path)
+    else:
+        logger.debug(f'\t\tReusing identical file: {shared_path}')
+
+    if mode == 'shared':
+        return shared_path, content_hash
+
+    _link(shared_path, trial_path, mode)
+    return trial_path, content_hash
@@ -0,0 +1,153 @@
+import numpy as np
+import funwave_amp as fpy
+from ..log_tools import logger
+
+
+"""
+Compiled templates for input.txt. The key order and the formatting of each
+key are taken ONCE (from the first trial, or a DataFrame), such that each
+trial is rendered from a flat tuple of its values, without copying or
+inspecting the whole dictionary.
+
+Formatting is explicit and does not depend on numpy's str():
+    > strings as-is
+    > floats in positional notation, by the shortest text that round-trips
+      in their OWN precision, ie- 0.1 for float32(0.1) rather than the
+      0.10000000149011612 of its double. NaN values are skipped.
+    > integers as base-10 integers
+    > anything else (arrays, objects, numpy booleans) is skipped
+"""
+
+
+#%% FORMATTING
+def _format_str(value):
+    return value
+
+
+def _format_float(value):
+    # NaN is skipped
+    if value != value:
+        return None
+    if not isinstance(value, np.floating):
+        value = np.float64(value)
+    return np.format_float_positional(value, unique=True, trim='0')
+
+
+def _format_int(value):
+    return str(int(value))
+
+
+def _skip(value):
+    return None
+
+
+def _get_formatter(kind):
+    if issubclass(kind, str):
+        return _format_str
+    elif issubclass(kind, bool):
+        return str
+    elif issubclass(kind, (float, np.floating)):
+        return _format_float
+    elif issubclass(kind, (int, np.integer)):
+        return _format_int
+    return _skip
+
+
+def format_value(value):
+    '''
+    Text of a value in input.txt, None if it is not written
+    '''
+    return _get_formatter(type(value))(value)
+
+
+#%% TEMPLATE
+class InputTemplate:
+    '''
+    Template of input.txt for a fixed order of keys
+    '''
+    def __init__(self, keys, example_values=None):
+        '''
+        Arguments:
+        - keys (iterable): FUNWAVE parameters, in the order they are written
+        - example_values (iterable/None): values of a trial, to compile the
+            formatting of each key. Values of another type are formatted by
+            `format_value`.
+        '''
+        self.keys = tuple(keys)
+        self.prefixes = tuple(f'{key} = ' for key in self.keys)
+        if example_values is None:
+            example_values = [None] * len(self.keys)
+        self.kinds = tuple(type(value) for value in example_values)
+        self.formatters = tuple(_get_formatter(kind) for kind in self.kinds)
+
+    @classmethod
+    def from_dict(cls, var_dict):
+        return cls(var_dict.keys(), var_dict.values())
+
+    def render(self, values):
+        '''
+        Text of input.txt from a flat tuple of values, in the order of `keys`
+        '''
+        lines = []
+        for prefix, kind, formatter, value in zip(self.prefixes, self.kinds, self.formatters, values):
+            text = formatter(value) if type(value) is kind else format_value(value)
+            if text is not None:
+                lines.append(f'{prefix}{text}\n')
+        return ''.join(lines)
+
+    def write(self, path, values):
+        with open(path, 'w') as f:
+            f.write(self.render(values))
+
+
+# Compiled templates, by the keys of the trials
+_TEMPLATES = {}
+
+
+def get_input_template(var_dict):
+    '''
+    Compiled template for a dictionary of FUNWAVE parameters, compiled on the
+    first trial with these keys and reused after
+    '''
+    keys = tuple(var_dict)
+    template = _TEMPLATES.get(keys)
+    if template is None:
+        template = InputTemplate.from_dict(var_dict)
+        _TEMPLATES[keys] = template
+    return template
+
+
+#%% BATCH
+def write_input_files(df_trials, template=None, resolver=None):
+    '''
+    Writes the input.txt of many trials at once, one per row of a DataFrame
+    (ie- the input summary), with ITER giving the path of each.
+
+    Arguments:
+    - df_trials (DataFrame): one row per trial, including ITER
+    - template (InputTemplate/None): compiled from the columns and first row
+        if None. Note that the dtype of each column decides its formatting
+        (ie- an integer column with missing values is float).
+    - resolver (PathResolver/None): resolver of the paths, the active one if
+        None (see `set_path_resolver`)
+
+    Returns:
+    - paths (list): path of each input.txt written
+    '''
+    if template is None:
+        first_row = next(df_trials.itertuples(index=False, name=None), None)
+        template = InputTemplate(df_trials.columns, first_row)
+    positions = [df_trials.columns.get_loc(key) for key in template.keys]
+    iter_position = df_trials.columns.get_loc('ITER')
+    if resolver is None:
+        resolver = fpy.get_path_resolver()
+
+    paths = []
+    for row in df_trials.itertuples(index=False, name=None):
+        iter_num = int(row[iter_position])
+        resolver.make_trial_dirs(iter_num)
+        path = fpy.get_key_dirs(tri_num=iter_num, resolver=resolver)['in']
+        template.write(path, [row[i] for i in positions])
+        paths.append(path)
+    logger.info(f'{len(paths)} input.txt files written')
+    return paths
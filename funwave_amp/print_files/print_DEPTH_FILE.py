@@ -1,24 +1,28 @@
 import numpy as np
 import funwave_amp as fpy
+from ._content_store import save_supporting_file
+from ..log_tools import logger
 
 
 """
 Code to print out the DEPTH_FILE for FUNWAVE-TVD
 """
 
-def print_DEPTH_FILE(vars):
-    print('\t\tStarted printing bathymetry file (DEPTH_FILE)...')
+def print_DEPTH_FILE(vars, resolver=None):
+    logger.debug('\t\tStarted printing bathymetry file (DEPTH_FILE)...')
 
     # Unpack variables
     bathy_array = vars['DOM']['Z'].values.T
     ITER = int(vars['ITER'])
 
     # Get path for bathymetry file- this is DEPTH_FILE
-    ptr = fpy.get_key_dirs(tri_num = ITER)
+    ptr = fpy.get_key_dirs(tri_num = ITER, resolver = resolver)
     bathy_path = ptr['ba']
 
-    # Print
-    np.savetxt(bathy_path, bathy_array, delimiter=' ', fmt='%f')
+    # Print (once per unique bathymetry in a content-addressed store mode)
+    bathy_path, bathy_hash = save_supporting_file(bathy_array, bathy_path, fmt='%f')
     
-    print(f'\t\tDEPTH_FILE file successfully saved to: {bathy_path}')
+    logger.debug(f'\t\tDEPTH_FILE file successfully saved to: {bathy_path}')
+    if bathy_hash:
+        return {'DEPTH_FILE': bathy_path, 'DEPTH_FILE_HASH': bathy_hash}
     return {'DEPTH_FILE': bathy_path}
\ No newline at end of file
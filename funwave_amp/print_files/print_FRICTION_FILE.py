@@ -1,24 +1,28 @@
 import numpy as np
 import funwave_amp as fpy
+from ._content_store import save_supporting_file
+from ..log_tools import logger
 
 
 """
 Code to print out the DEPTH_FILE for FUNWAVE-TVD
 """
 
-def print_FRICTION_FILE(vars):
-    print('\t\tStarted printing friction file (FRICTION_FILE)...')
+def print_FRICTION_FILE(vars, resolver=None):
+    logger.debug('\t\tStarted printing friction file (FRICTION_FILE)...')
 
     # Unpack variables
     friction_array = vars['DOM']['friction'].values.T
     ITER = int(vars['ITER'])
 
     # Get path for bathymetry file- this is DEPTH_FILE
-    ptr = fpy.get_key_dirs(tri_num = ITER)
+    ptr = fpy.get_key_dirs(tri_num = ITER, resolver = resolver)
     friction_path = ptr['fr']
 
-    # Print
-    np.savetxt(friction_path, friction_array, delimiter=' ', fmt='%f')
+    # Print (once per unique friction field in a content-addressed store mode)
+    friction_path, friction_hash = save_supporting_file(friction_array, friction_path, fmt='%f')
     
-    print(f'\t\tFRICTION_FILE file successfully saved to: {friction_path}')
+    logger.debug(f'\t\tFRICTION_FILE file successfully saved to: {friction_path}')
+    if friction_hash:
+        return {'FRICTION_FILE': friction_path, 'FRICTION_FILE_HASH': friction_hash}
     return {'FRICTION_FILE': friction_path}
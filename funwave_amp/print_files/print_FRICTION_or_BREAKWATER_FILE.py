@@ -2,46 +2,52 @@
 import numpy as np
 
 import funwave_amp as fpy
+from ._content_store import save_supporting_file
+from ..log_tools import logger
 
 
-def print_FRICTION_OR_BREAKWATER_FILE(var_dict):
-    print('\t\tChecking for FRICTION_FILE and/or BREAKWATER_FILE...')
+def print_FRICTION_OR_BREAKWATER_FILE(var_dict, resolver=None):
+    logger.debug('\t\tChecking for FRICTION_FILE and/or BREAKWATER_FILE...')
     
     ## Figure out friction
     DOM = var_dict['DOM']
     
     if "friction" in DOM.data_vars:
-        print('\t\tIdentified FRICTION_FILE!')
-        print('\t\tStarted printing friction file (FRICTION_FILE)...')
+        logger.debug('\t\tIdentified FRICTION_FILE!')
+        logger.debug('\t\tStarted printing friction file (FRICTION_FILE)...')
         # Unpack variables
         friction_array = var_dict['DOM']['friction'].values.T
         ITER = int(var_dict['ITER'])
 
         # Get path for bathymetry file- this is DEPTH_FILE
-        ptr = fpy.get_key_dirs(tri_num = ITER)
+        ptr = fpy.get_key_dirs(tri_num = ITER, resolver = resolver)
         friction_path = ptr['fr']
 
-        # Print
-        np.savetxt(friction_path, friction_array, delimiter=' ', fmt='%f')
+        # Print (once per unique friction field in a content-addressed store mode)
+        friction_path, friction_hash = save_supporting_file(friction_array, friction_path, fmt='%f')
         
-        print(f'\t\tFRICTION_FILE file successfully saved to: {friction_path}')
+        logger.debug(f'\t\tFRICTION_FILE file successfully saved to: {friction_path}')
+        if friction_hash:
+            return {'FRICTION_FILE': friction_path, 'FRICTION_FILE_HASH': friction_hash}
         return {'FRICTION_FILE': friction_path}
     
     if "BW_Width" in DOM.data_vars:
-        print('\t\tIdentified BREAKWATER_FILE!')
-        print('\t\tStarted printing breakwater file (BREAKWATER_FILE)...')
+        logger.debug('\t\tIdentified BREAKWATER_FILE!')
+        logger.debug('\t\tStarted printing breakwater file (BREAKWATER_FILE)...')
         # Unpack variables
         BWAC_array = var_dict['DOM']['BW_Width'].values.T
         ITER = int(var_dict['ITER'])
 
         # Get path for bathymetry file- this is DEPTH_FILE
-        ptr = fpy.get_key_dirs(tri_num = ITER)
+        ptr = fpy.get_key_dirs(tri_num = ITER, resolver = resolver)
         bwac_path = ptr['bw']
 
-        # Print
-        np.savetxt(bwac_path, BWAC_array, delimiter=' ', fmt='%f')
+        # Print (once per unique breakwater field in a content-addressed store mode)
+        bwac_path, bwac_hash = save_supporting_file(BWAC_array, bwac_path, fmt='%f')
         
-        print(f'\t\tBREAKWATER_FILE file successfully saved to: {bwac_path}')
+        logger.debug(f'\t\tBREAKWATER_FILE file successfully saved to: {bwac_path}')
+        if bwac_hash:
+            return {'BREAKWATER_FILE': bwac_path, 'BREAKWATER_FILE_HASH': bwac_hash}
         return {'BREAKWATER_FILE': bwac_path}
         
     else:
@@ -1,9 +1,11 @@
 import numpy as np
 import funwave_amp as fpy
+from ._content_store import save_supporting_file
+from ..log_tools import logger
 
 
-def print_STATIONS_FILE(var_dict):
-    print('\t\tStarted printing station file (STATIONS_FILE)...')
+def print_STATIONS_FILE(var_dict, resolver=None):
+    logger.debug('\t\tStarted printing station file (STATIONS_FILE)...')
 
     # Unpack variables
     DOM = var_dict['DOM']
@@ -15,13 +17,15 @@ def print_STATIONS_FILE(var_dict):
 
     # Get directories
     # Get path for bathymetry file- this is DEPTH_FILE
-    ptr = fpy.get_key_dirs(tri_num = ITER)
+    ptr = fpy.get_key_dirs(tri_num = ITER, resolver = resolver)
     station_path = ptr['st']
 
-    # Print
-    np.savetxt(station_path, station_array, delimiter=' ', fmt='%d')
+    # Print (once per unique set of stations in a content-addressed store mode)
+    station_path, station_hash = save_supporting_file(station_array, station_path, fmt='%d')
     
-    print(f'\t\tSTATION file successfully saved to: {station_path}')
+    logger.debug(f'\t\tSTATION file successfully saved to: {station_path}')
+    if station_hash:
+        return {'STATIONS_FILE':station_path, 'STATIONS_FILE_HASH':station_hash}
     return {'STATIONS_FILE':station_path}
 
 
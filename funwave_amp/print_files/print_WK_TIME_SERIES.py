@@ -1,14 +1,16 @@
 import numpy as np
 import funwave_amp as fpy
+from ._content_store import save_supporting_file
+from ..log_tools import logger
 
 
-def print_WK_TIME_SERIES(var_dict):
+def print_WK_TIME_SERIES(var_dict, resolver=None):
     ITER = var_dict['ITER']
     WK = var_dict['WK']
 
 
     # Get path for bathymetry file- this is DEPTH_FILE
-    ptr = fpy.get_key_dirs(tri_num = ITER)
+    ptr = fpy.get_key_dirs(tri_num = ITER, resolver = resolver)
     spectra_path = ptr['sp']
 
     # Unpack
@@ -16,9 +18,13 @@ def print_WK_TIME_SERIES(var_dict):
     amp = WK.amp.values
     pha = WK.phase.values
 
-    np.savetxt(spectra_path, np.column_stack((period, amp, pha)), fmt='%12.8f')
-    print(f'\t\tWaveCompFile successfully saved to: {spectra_path}')
+    # Print (once per unique spectrum in a content-addressed store mode)
+    spectra_path, spectra_hash = save_supporting_file(np.column_stack((period, amp, pha)),
+                                                      spectra_path, fmt='%12.8f')
+    logger.debug(f'\t\tWaveCompFile successfully saved to: {spectra_path}')
 
+    if spectra_hash:
+        return {'WaveCompFile': spectra_path, 'WaveCompFile_HASH': spectra_hash}
     return {'WaveCompFile': spectra_path}
 
 
@@ -1,23 +1,17 @@
-import copy
-import numpy as np
 import funwave_amp as fpy
+from ..log_tools import logger
+from ._input_template import get_input_template
 
-def print_input_dot_text(var_dict):
-    print('\nPRINTING input.txt...')
-    print('\tStarted printing input file...')
+def print_input_dot_text(var_dict, resolver=None):
+    logger.debug('\nPRINTING input.txt...')
+    logger.debug('\tStarted printing input file...')
 
-    ptr = fpy.get_key_dirs(tri_num=var_dict['ITER'])
+    ptr = fpy.get_key_dirs(tri_num=var_dict['ITER'], resolver=resolver)
     in_path = ptr['in']
     
-    var_dict_copy = copy.deepcopy(var_dict)
-    with open(in_path, 'w') as f:
-        for var_name, value in var_dict_copy.items():
-            # Allow only strings and numeric scalars
-            if isinstance(value, (str, int, float, np.integer, np.floating)):
-                # Skip NaN values (for floats/NumPy floats only)
-                if isinstance(value, (float, np.floating)) and np.isnan(value):
-                    continue
-                f.write(f"{var_name} = {value}\n")
+    # Only strings and numeric scalars are written, skipping NaN values
+    template = get_input_template(var_dict)
+    template.write(in_path, var_dict.values())
     
-    print(f"\tinput.txt file successfully saved to: {ptr['in']}", flush=True)
-    return
\ No newline at end of file
+    logger.debug(f"\tinput.txt file successfully saved to: {ptr['in']}")
+    return
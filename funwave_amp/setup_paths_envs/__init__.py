@@ -1,2 +1,3 @@
-from ._path_tools import get_key_dirs
-from .setup import setup_key_dirs
\ No newline at end of file
+from ._path_tools import (get_key_dirs, PathResolver, set_path_resolver,
+                          get_path_resolver, get_env)
+from .setup import setup_key_dirs
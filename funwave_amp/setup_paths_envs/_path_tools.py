@@ -1,4 +1,7 @@
 import os
+import numpy as np
+import pandas as pd
+from dotenv import dotenv_values
 
 
 
@@ -13,8 +16,190 @@ def add_dirs_to_path(env_file,dirs_to_add):
                 os.makedirs(path_name, exist_ok=True)
 
 
+#%% KEY FILES
+# File names and extensions of the key files of a trial
+KEY_FILES = {'in': ['input','.txt'], 
+             'ba': ['bathy','.txt'],
+             'fr': ['friction','.txt'],
+             'or': ['out_raw','/'],
+             'bw': ['breakwater','.txt'],
+             'sp': ['spectra','.txt'],
+             'st': ['stations','.txt'],
+             'nc': ['tri','.nc'],
+             'ns': ['tri_sta','.nc']
+             }
+
+
+# Defaults of the layout of the key files
+PAD_WIDTH = 5
+FAN_DIGITS = 0
+
+
+class PathResolver:
+    '''
+    Paths of the key files of each trial, resolved from the variables of an
+    .env file (see `setup_key_dirs`) read ONCE, rather than from the
+    environment on every call. The prefix of every key file (ie-
+    `{in}/input_`) is built up front, such that the paths of a trial only
+    need its number formatted.
+
+    The layout of the key files is set by `pad_width` and `fan_digits` of the
+    .env file. Trial numbers are zero padded to `pad_width` digits, and if
+    `fan_digits` > 0, the key files are fanned out to subdirectories named by
+    the first `fan_digits` digits of the padded number, ie- for a
+    `pad_width` of 7 and `fan_digits` of 3:
+        {in}/012/input_0123456.txt
+        {or}/012/out_raw_0123456/
+    such that no directory holds more than 10**(pad_width - fan_digits)
+    trials.
+    '''
+    def __init__(self, env):
+        '''
+        Arguments:
+        - env (dictionary): variables of the .env file (in, ba, nc, is, name, ...)
+        '''
+        self.env = {key: value for key, value in env.items() if value is not None}
+        self.pad_width = int(self.env.get('pad_width') or PAD_WIDTH)
+        self.fan_digits = int(self.env.get('fan_digits') or FAN_DIGITS)
+        check_layout(self.pad_width, self.fan_digits)
+
+        # Directory (with separator), file name prefix, and extension
+        self.prefixes = {}
+        for key, (name, ext) in KEY_FILES.items():
+            base_path = self.env.get(key)
+            if base_path:
+                self.prefixes[key] = (os.path.join(base_path, ''), f'{name}_', ext)
+        self._made_dirs = set()
+
+    @classmethod
+    def from_env_file(cls, env_file):
+        '''
+        Resolver of an .env file, without loading it into the environment
+        '''
+        if not os.path.exists(env_file):
+            raise FileNotFoundError(f'.env file not found: {env_file}')
+        return cls(dotenv_values(env_file))
+
+    @classmethod
+    def from_environ(cls):
+        '''
+        Resolver of the current environment (ie- after `load_dotenv`)
+        '''
+        return cls(os.environ)
+
+    def get(self, key, default=None):
+        '''
+        Variable of the .env file, as `os.getenv`
+        '''
+        return self.env.get(key, default)
+
+    def format_trial(self, tri_num):
+        '''
+        Zero padded trial number (ie- 00001)
+        '''
+        return f'{tri_num:0{self.pad_width}}'
+
+    def get_key_dirs(self, tri_num=None):
+        '''
+        Paths of the key files of trial `tri_num` (see `get_key_dirs`)
+        '''
+        if tri_num is None:
+            tri_num = int(self.env['TRI_NUM'])
+        number = self.format_trial(tri_num)
+        fan_dir = f'{number[:self.fan_digits]}{os.sep}' if self.fan_digits else ''
+        trial_paths = {key: f'{directory}{fan_dir}{name}{number}{ext}'
+                       for key, (directory, name, ext) in self.prefixes.items()}
+        trial_paths['time_dt'] = os.path.join(trial_paths['or'], 'time_dt.txt')
+        return trial_paths
+
+    def make_trial_dirs(self, tri_num=None):
+        '''
+        Makes the fan-out subdirectories of the key files of trial `tri_num`,
+        once each (nothing to do for a flat layout)
+        '''
+        if not self.fan_digits:
+            return
+        for path in self.get_key_dirs(tri_num).values():
+            directory = os.path.dirname(path.rstrip(os.sep))
+            if directory not in self._made_dirs:
+                os.makedirs(directory, exist_ok=True)
+                self._made_dirs.add(directory)
+
+    def get_iter_paths(self, first_iter, last_iter, keys=None):
+        '''
+        Paths of the key files of trials `first_iter` to `last_iter`
+        (inclusive) at once
+
+        Arguments:
+        - first_iter, last_iter (int): first and last trial numbers
+        - keys (list/None): key files to include, all available if None
+
+        Returns:
+        - paths (DataFrame): one row per ITER, one column per key file
+        '''
+        keys = list(self.prefixes) + ['time_dt'] if keys is None else keys
+        iters = np.arange(first_iter, last_iter + 1)
+        numbers = np.char.zfill(iters.astype(str), self.pad_width)
+        fan_dirs = ''
+        if self.fan_digits:
+            # Truncating the strings keeps their leading digits
+            fan_dirs = np.char.add(numbers.astype(f'U{self.fan_digits}'), os.sep)
+
+        paths = {}
+        for key in keys:
+            prefix_key, suffix = (key, '') if key != 'time_dt' else ('or', 'time_dt.txt')
+            directory, name, ext = self.prefixes[prefix_key]
+            file_names = np.char.add(np.char.add(name, numbers), ext + suffix)
+            paths[key] = np.char.add(np.char.add(directory, fan_dirs), file_names)
+        return pd.DataFrame(paths, index=pd.Index(iters, name='ITER'))
+
+
+def check_layout(pad_width, fan_digits):
+    if pad_width < 1:
+        raise ValueError(f'`pad_width` must be at least 1, not {pad_width}')
+    if not 0 <= fan_digits < pad_width:
+        raise ValueError(f'`fan_digits` must be in [0, `pad_width`), not {fan_digits}')
+
+
+# Resolver used by `get_key_dirs`, set for the duration of a generation
+_RESOLVER = {'active': None}
+
+
+def set_path_resolver(resolver):
+    '''
+    Sets the resolver used by `get_key_dirs` (and `get_env`) when none is
+    given, None to go back to the environment
+
+    Returns:
+    - previous (PathResolver/None): the resolver it replaced
+    '''
+    previous = _RESOLVER['active']
+    _RESOLVER['active'] = resolver
+    return previous
+
+
+def get_path_resolver():
+    '''
+    Active resolver, or one of the current environment if none is set
+    '''
+    resolver = _RESOLVER['active']
+    if resolver is None:
+        resolver = PathResolver.from_environ()
+    return resolver
+
+
+def get_env(key, default=None):
+    '''
+    Variable of the active resolver, or of the environment if none is set
+    '''
+    resolver = _RESOLVER['active']
+    if resolver is None:
+        return os.getenv(key, default)
+    return resolver.get(key, default)
+
+
 #%%
-def get_key_dirs(tri_num=None):
+def get_key_dirs(tri_num=None, resolver=None):
     '''
     For a given trial specified by `tri_num`, construct the file paths 
     to each of the following .txt files:
@@ -29,38 +214,10 @@ def get_key_dirs(tri_num=None):
         > tri_XXXXX_sta.nc [ns] (tri_sta)
         
     and time_dt
-    '''
-    if tri_num is None:
-        tri_num = int(os.getenv('TRI_NUM'))
 
-        
-    # Get the base path files
-    base_paths = {}
-    for file_type in ['in','ba','or','sp','st','fr','bw','nc','ns']:
-        base_path = os.getenv(file_type)
-        if base_path:
-            base_paths[file_type] = base_path
-    
-    # Specify file names and extensions of the key files
-    name_ext = {'in': ['input','.txt'], 
-          'ba': ['bathy','.txt'],
-          'fr': ['friction','.txt'],
-          'or': ['out_raw','/'],
-          'bw': ['breakwater','.txt'],
-          'sp': ['spectra','.txt'],
-          'st': ['stations','.txt'],
-          'nc': ['tri','.nc'],
-          'ns': ['tri_sta','.nc']
-          }
-    
-    # Construct the paths
-    trial_paths = {}
-    for key,name_ext_ in name_ext.items():
-        if key in base_paths:
-                name = f'{name_ext_[0]}_{tri_num:05}{name_ext_[1]}'
-                trial_paths[key] = os.path.join(base_paths[key],name)
-
-    # Add on time_dt
-    trial_paths['time_dt'] = os.path.join(f"{trial_paths['or']}","time_dt.txt")
-        
-    return trial_paths
\ No newline at end of file
+    The base paths are taken from `resolver`, the active resolver (see
+    `set_path_resolver`), or the environment, in that order.
+    '''
+    if resolver is None:
+        resolver = get_path_resolver()
+    return resolver.get_key_dirs(tri_num)
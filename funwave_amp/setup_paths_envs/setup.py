@@ -1,4 +1,6 @@
 import os
+from ._path_tools import check_layout, PAD_WIDTH, FAN_DIGITS
+from ..log_tools import logger
 
 ## PATH SETUP
 def setup_key_dirs(name='NAME',
@@ -18,39 +20,66 @@ def setup_key_dirs(name='NAME',
                     conda = None,
                     input_sum_dir = None,
                     FW_ex = None,
+                    file_store = None,
+                    pad_width = PAD_WIDTH,
+                    fan_digits = FAN_DIGITS,
                     dir_add_ons = None):
+    '''
+    `file_store` sets the content-addressed store mode of supporting files
+    (None, 'shared', 'hardlink' or 'symlink'). In a store mode, each unique
+    DEPTH_FILE/FRICTION_FILE/WaveCompFile/STATIONS_FILE is only written once
+    and its content hash is recorded in the summary.
+
+    `pad_width` sets the number of digits trial numbers are zero padded to
+    (ie- input_00001.txt), and `fan_digits` fans the key files of the trials
+    out to subdirectories named by the first `fan_digits` digits of the
+    padded number (ie- in/012/input_0123456.txt for 7 and 3), such that no
+    directory holds more than 10**(pad_width - fan_digits) trials. See
+    `PathResolver`.
+    '''
     
     
     # main_dir
     if main_dir is None:
         raise ValueError("`main_dir` must be specified")
     else:
-        print(f'main_dir Directory set as: {main_dir}')
+        logger.info(f'main_dir Directory set as: {main_dir}')
     
     # input.txt files
     if input_dir is None:
         raise ValueError("`input_dir` must be specified")
     else:
-        print(f'Directory for input.txt files set to: {input_dir}')
+        logger.info(f'Directory for input.txt files set to: {input_dir}')
         
     # RESULT_FOLDER files
     if result_folder_dir is None:
         raise ValueError("`result_folder_dir` must be specified")
     else:
-        print(f'Directory for RESULT_FOLDER directories set to: {result_folder_dir}')
+        logger.info(f'Directory for RESULT_FOLDER directories set to: {result_folder_dir}')
         
     # NetCDF
     if nc_dir is None:
         raise ValueError("`nc_dir` must be specified")
     else:
-        print(f'Directory for NetCDF outputs set to: {nc_dir}')
+        logger.info(f'Directory for NetCDF outputs set to: {nc_dir}')
         
     # Need NetCDF station directory if specified
     if station_dir:
         if nc_sta_dir is None:
             raise ValueError("`nc_sta_dir` must be specified")
         else:
-            print(f'Directory for NetCDF outputs at stations set to: {nc_dir}')
+            logger.info(f'Directory for NetCDF outputs at stations set to: {nc_dir}')
+
+    # Content-addressed store of supporting files
+    if file_store not in [None, 'shared', 'hardlink', 'symlink']:
+        raise ValueError("`file_store` must be one of None, 'shared', 'hardlink', 'symlink'")
+    elif file_store:
+        logger.info(f'Supporting files deduplicated with store mode: {file_store}')
+
+    # Layout of the key files of each trial
+    check_layout(pad_width, fan_digits)
+    if pad_width != PAD_WIDTH or fan_digits:
+        logger.info(f'Trial numbers padded to {pad_width} digits, fanned out by the first {fan_digits}')
 
     # Default directories that need to exist
     if log_dir is None:
@@ -84,26 +113,29 @@ def setup_key_dirs(name='NAME',
              'FW_ex': FW_ex,
              'conda': conda,
              'name': name,
+             'file_store': file_store,
+             'pad_width': pad_width,
+             'fan_digits': fan_digits,
              'PYTHONPATH': main_dir}
     
     
     # Make Directories
     for key,path_name in paths.items():
-        if key not in {'FW_ex','conda','PYTHONPATH','name'}:
+        if key not in {'FW_ex','conda','PYTHONPATH','name','file_store','pad_width','fan_digits'}:
             if path_name:
-                  print(f'\tSpecifying {key}: {path_name}')
+                  logger.info(f'\tSpecifying {key}: {path_name}')
                   os.makedirs(path_name, exist_ok=True)
             
     # Other directories to add
     if dir_add_ons:
         for key,path_name in dir_add_ons.items():
-            print(f'\tMaking {key}: {path_name}')
+            logger.info(f'\tMaking {key}: {path_name}')
             os.makedirs(path_name, exist_ok=True)
 
 
     # Write to Environment File
     env_path = os.path.join(env_dir,f'{name}.env')
-    print(f'.env file created at {env_path}')
+    logger.info(f'.env file created at {env_path}')
     with open(env_path, "w") as f:
         for key,path_name in paths.items():
             if path_name:
@@ -0,0 +1 @@
+from .dispersion import dispersion_k, dispersion_L
\ No newline at end of file
@@ -0,0 +1,66 @@
+import numpy as np
+
+
+'''
+Vectorized solver of the linear dispersion relation
+
+    omega^2 = g*k*tanh(k*h)
+
+Every argument may be a scalar or an array (broadcast against each other), so 
+the wavenumber for every combination of a design matrix can be found in a 
+single call. The relation is solved in the nondimensional form
+x*tanh(x) = y with x = kh, y = omega^2 h/g, using Newton iteration from
+Eckart's approximation, which is already within a few percent everywhere.
+'''
+
+
+def dispersion_k(h=None,
+                 T=None,
+                 g=9.81,
+                 tol=1e-12,
+                 max_iter=50):
+    '''
+    Solves the linear dispersion relation for the wavenumber k
+
+    Arguments:
+    - h (float/array): water depth [m]
+    - T (float/array): wave period [s]
+    - g (float): gravitational acceleration [m/s^2]
+    - tol (float): tolerance on the relative Newton update of kh
+    - max_iter (int): maximum number of Newton iterations
+
+    Returns:
+    - k (float/array): wavenumber [rad/m], same shape as broadcast h,T
+    '''
+    h = np.asarray(h, dtype=np.float64)
+    T = np.asarray(T, dtype=np.float64)
+
+    # Nondimensional deep water wavenumber
+    omega = 2*np.pi/T
+    y = omega**2*h/g
+
+    # Initial guess: Eckart (1952)
+    x = y/np.sqrt(np.tanh(y))
+
+    # Newton iteration on f(x) = x*tanh(x) - y
+    for _ in range(max_iter):
+        t = np.tanh(x)
+        dx = (x*t - y)/(t + x*(1 - t**2))
+        x = x - dx
+        if np.all(np.abs(dx) <= tol*np.abs(x)):
+            break
+
+    k = x/h
+    return k if k.ndim else k.item()
+
+
+def dispersion_L(h=None,
+                 T=None,
+                 g=9.81,
+                 tol=1e-12,
+                 max_iter=50):
+    '''
+    Solves the linear dispersion relation for the wavelength L = 2*pi/k.
+    See `dispersion_k` for the arguments.
+    '''
+    return 2*np.pi/dispersion_k(h, T, g, tol, max_iter)
@@ -1,5 +1,7 @@
 import numpy as np
 import xarray as xr
+from . import _bathymetry as bathy
+from . import _dem as dem
 
 
 '''
@@ -15,8 +17,96 @@ It is based on the xarray object. Use of the DomainObject is REQUIRED to
 correctly set up the bathymetry, even if a DEPTH_FILE is not used. This is 
 because the generation of the xarray for the outputs directly pull on the
 DomainObject.
+
+Fields built from a 1D cross-shore profile (ie- `z_from_SLOPE`,
+`friction_from_1D_array`) are ALONGSHORE-UNIFORM: rather than tiling the
+profile Nglob times, the (X, Y) field is a read-only broadcast view of the
+profile, flagged with the `alongshore_uniform` attribute. NetCDF files
+store full (X, Y) fields by default. With `compact_uniform` (see
+`process_design_matrix`), they store only the (X) profile (see
+`compact_alongshore_uniform`), so code reading them should broadcast it back
+out with `expand_alongshore_uniform` (a no-op on (X, Y) files).
+
+The X and Y coordinates are DX*arange(Mglob) and DY*arange(Nglob), so they
+may be left out of the NetCDF files (see `drop_implicit_coords`) and rebuilt
+from the attributes when read (see `restore_implicit_coords`).
 '''
 
+UNIFORM_FLAG = 'alongshore_uniform'
+
+# Coordinates implied by the attributes: name -> (spacing, number of points)
+IMPLICIT_COORDS = {'X': ('DX', 'Mglob'), 'Y': ('DY', 'Nglob')}
+
+
+def is_alongshore_uniform(data_array):
+    return bool(data_array.attrs.get(UNIFORM_FLAG, 0))
+
+
+def compact_alongshore_uniform(ds):
+    '''
+    Replaces each alongshore-uniform (X, Y) field of a Dataset by its (X)
+    profile, ie- for writing to NetCDF
+    '''
+    compact = {name: ds[name].isel(Y=0, drop=True) for name in ds.data_vars
+               if is_alongshore_uniform(ds[name]) and ds[name].dims == ('X', 'Y')}
+    return ds.assign(compact) if compact else ds
+
+
+def drop_uniform_flag(ds):
+    '''
+    Drops the alongshore-uniform flag of each (X, Y) field of a Dataset, ie-
+    for writing full fields to NetCDF (the flag only marks (X) profiles there)
+    '''
+    flagged = [name for name in ds.data_vars
+               if is_alongshore_uniform(ds[name]) and ds[name].dims == ('X', 'Y')]
+    if not flagged:
+        return ds
+    ds = ds.copy(deep=False)
+    for name in flagged:
+        ds[name].attrs.pop(UNIFORM_FLAG)
+    return ds
+
+
+def expand_alongshore_uniform(ds):
+    '''
+    Broadcasts each alongshore-uniform (X) profile of a Dataset (ie- read
+    from NetCDF) back out to a read-only (X, Y) field, without copying it
+    '''
+    expanded = {}
+    for name in ds.data_vars:
+        if is_alongshore_uniform(ds[name]) and ds[name].dims == ('X',):
+            profile = ds[name].values
+            field = np.broadcast_to(profile[:, np.newaxis], (ds.sizes['X'], ds.sizes['Y']))
+            expanded[name] = xr.Variable(('X', 'Y'), field, attrs=ds[name].attrs)
+    return ds.assign(expanded) if expanded else ds
+
+
+def drop_implicit_coords(ds):
+    '''
+    Drops the X/Y coordinates of a Dataset that are exactly spacing*arange
+    of its attributes (see `IMPLICIT_COORDS`), ie- for writing to NetCDF
+    '''
+    implicit = []
+    for name, (spacing, count) in IMPLICIT_COORDS.items():
+        if name in ds.coords and spacing in ds.attrs and count in ds.attrs:
+            values = ds[name].values
+            expected = ds.attrs[spacing] * np.arange(0, ds.attrs[count])
+            if values.shape == expected.shape and np.allclose(values, expected, rtol=0, atol=1e-6*abs(ds.attrs[spacing])):
+                implicit.append(name)
+    return ds.drop_vars(implicit) if implicit else ds
+
+
+def restore_implicit_coords(ds):
+    '''
+    Rebuilds X/Y coordinates left out by `drop_implicit_coords` (ie- read
+    from NetCDF) from the attributes
+    '''
+    restored = {}
+    for name, (spacing, count) in IMPLICIT_COORDS.items():
+        if name not in ds.coords and spacing in ds.attrs and count in ds.attrs:
+            restored[name] = ds.attrs[spacing] * np.arange(0, ds.attrs[count])
+    return ds.assign_coords(restored) if restored else ds
+
 
 class DomainObject(xr.Dataset):
     __slots__ = ()
@@ -40,6 +130,50 @@ class DomainObject(xr.Dataset):
         self.attrs['Nglob'] = Nglob
         self.attrs['DX'] = DX
         self.attrs['DY'] = DY
+
+    def _set_alongshore_uniform(self, name, profile):
+        '''
+        Stores a 1D cross-shore profile as an alongshore-uniform (X, Y) field,
+        a read-only view of the profile rather than a tiled copy
+        '''
+        profile = np.asarray(profile)
+        field = np.broadcast_to(profile[:, np.newaxis], (self.attrs['Mglob'], self.attrs['Nglob']))
+        self[name] = xr.Variable(('X', 'Y'), field, attrs={UNIFORM_FLAG: 1})
+
+    @classmethod
+    def from_batch(cls, Z, DX=None, DY=None, Nglob=None):
+        '''
+        Builds one DomainObject per trial from a batch of bathymetries (see
+        `_bathymetry.py`), ie- in a vectorized dependency function. Each
+        DomainObject holds a view of its row of `Z`, rather than a copy.
+
+        Arguments:
+        - Z (array): (n_trials, Mglob) alongshore-uniform profiles, or
+            (n_trials, Mglob, Nglob) fields
+        - DX, DY (float): grid spacing, common to all trials
+        - Nglob (int): alongshore points, for profiles
+
+        Returns:
+        - domains (list): DomainObject of each trial
+        '''
+        Z = np.asarray(Z)
+        if Z.ndim == 2:
+            if Nglob is None:
+                raise ValueError('`Nglob` must be specified for (n_trials, Mglob) profiles')
+        elif Z.ndim == 3:
+            Nglob = Z.shape[2]
+        else:
+            raise ValueError(f'`Z` must be (n_trials, Mglob) or (n_trials, Mglob, Nglob), not {Z.shape}')
+
+        domains = []
+        for z in Z:
+            domain = cls(DX=DX, DY=DY, Mglob=Z.shape[1], Nglob=Nglob)
+            if Z.ndim == 2:
+                domain._set_alongshore_uniform('Z', z)
+            else:
+                domain.z_from_2D_array(z)
+            domains.append(domain)
+        return domains
     ## [END] INITIALIZE =======================================================
 
 
@@ -54,30 +188,15 @@ class DomainObject(xr.Dataset):
         
         '''
         Construct the bathymetry from the DEPTH_TYPE = SLOPE Case. Note that this
-        will automatically tile the 1D array constructed in the cross-shore to 
-        whatever Nglob is set as.
+        will automatically broadcast the 1D array constructed in the cross-shore
+        to whatever Nglob is set as.
         '''
 
-        # Attributes
-        DX = self.attrs['DX']
-        Mglob = self.attrs['Mglob']
-        
-
-        # Initialize Bathy array
-        z = [DEPTH_FLAT] * Mglob
-        
-        # Get indices of sloping portion
-        indices = list(range(int(Xslp // DX), Mglob))
-        
-        # Add onto portion
-        for i in indices:
-            z[i] = DEPTH_FLAT - SLP * (i - Xslp // DX) * DX
-        
-        # Construct output dictionary
-        # Tile the array along Y
-        bathy_array = np.tile(z, (self.attrs['Nglob'], 1)).T
+        z = bathy.slope_profile(self.attrs['Mglob'], self.attrs['DX'],
+                                DEPTH_FLAT, Xslp, SLP)
 
-        self['Z'] = (('X', 'Y'), bathy_array)  
+        # Alongshore-uniform along Y
+        self._set_alongshore_uniform('Z', z)
         return
     
     # DEPTH_TYPE = FLAT 
@@ -85,8 +204,8 @@ class DomainObject(xr.Dataset):
                 DEPTH_FLAT = None):
         '''
         Construct the bathymetry from the DEPTH_TYPE = FLAT Case. Note that this
-        will automatically tile the 1D array constructed in the cross-shore to 
-        whatever Nglob is set as.
+        will automatically broadcast the 1D array constructed in the cross-shore
+        to whatever Nglob is set as.
         '''
 
         # Attributes
@@ -96,25 +215,21 @@ class DomainObject(xr.Dataset):
         # Create array
         z = [DEPTH_FLAT] * Mglob
         
-        bathy_array = np.tile(z, (self.attrs['Nglob'], 1)).T
-
-        self['Z'] = (('X', 'Y'), bathy_array)  
+        self._set_alongshore_uniform('Z', z)
         return
     
     # DEPTH_TYPE = DATA (1D) 
     def z_from_1D_array(self, bathy_array_1D):
         '''
         Construct the bathymetry from the DEPTH_TYPE = DATA Case. The input
-        is a 1D array, that will be tiled along Nglob, which should at a 
+        is a 1D array, that will be broadcast along Nglob, which should at a 
         minimum be 3
         '''
 
         # First, check that it is indeed 1D and Mglob-dimensional
         if np.reshape(bathy_array_1D, -1).shape[0] == self.attrs['Mglob']:
-            # Tile the array along Y
-            bathy_array = np.tile(bathy_array_1D, (self.attrs['Nglob'], 1)).T
-            # Add to object as a data variable
-            self['Z'] = (('X', 'Y'), bathy_array)  
+            # Add to object as an alongshore-uniform data variable
+            self._set_alongshore_uniform('Z', np.reshape(bathy_array_1D, -1))
             
         else:
             raise ValueError(f"Array dimensions {bathy_array_1D.shape} do not match expected "
@@ -130,10 +245,121 @@ class DomainObject(xr.Dataset):
 
         self['Z'] = (('X', 'Y'), bathy_array_2D)  
             
+        return
+    # Multi-segment slopes
+    def z_from_PIECEWISE(self,
+                         DEPTH_FLAT = None,
+                         X_breaks = None,
+                         slopes = None):
+        '''
+        Construct a multi-segment bathymetry: flat at DEPTH_FLAT up to
+        X_breaks[0], then sloping up at slopes[k] from X_breaks[k] to
+        X_breaks[k+1]. Alongshore-uniform.
+        '''
+        z = bathy.piecewise_slope_profile(self.attrs['Mglob'], self.attrs['DX'],
+                                          DEPTH_FLAT, X_breaks, slopes)
+        self._set_alongshore_uniform('Z', z)
+        return
+
+    # Dean equilibrium profile
+    def z_from_DEAN(self,
+                    A = None,
+                    X_shore = None,
+                    DEPTH_FLAT = None,
+                    beach_slope = 0.1):
+        '''
+        Construct a Dean equilibrium profile h = A*d^(2/3) offshore of the
+        shoreline at X_shore, capped at DEPTH_FLAT, with a planar beach of
+        `beach_slope` onshore. Alongshore-uniform.
+        '''
+        z = bathy.dean_profile(self.attrs['Mglob'], self.attrs['DX'],
+                               A, X_shore, DEPTH_FLAT, beach_slope)
+        self._set_alongshore_uniform('Z', z)
+        return
+
+    # External gridded bathymetry (DEM)
+    def z_from_DEM(self,
+                   path = None,
+                   origin = (0.0, 0.0),
+                   rotation = 0.0,
+                   method = 'bilinear',
+                   positive = 'up',
+                   variable = None,
+                   cache_dir = None):
+        '''
+        Construct the bathymetry from a DEM (ESRI ASCII or NetCDF grid),
+        cropped to the domain and regridded (see `_dem.py`). The regridded
+        bathymetry is cached, such that trials at the same resolution and
+        placement reuse it, and is shared (read-only) between them.
+
+        Arguments:
+        - path (str): DEM file
+        - origin (tuple): DEM coordinates of X = Y = 0
+        - rotation (float): degrees, counter-clockwise from the DEM x-axis to X
+        - method (str): 'bilinear' or 'conservative'
+        - positive (str): 'up' if the DEM is elevation, 'down' if depth
+        - variable (str/None): elevation variable of a NetCDF DEM
+        - cache_dir (str/None): on-disk cache, `{is}/dem_cache` if None
+        '''
+        z = dem.regrid_dem(path, self.attrs['Mglob'], self.attrs['Nglob'],
+                           self.attrs['DX'], self.attrs['DY'], origin=origin,
+                           rotation=rotation, method=method, positive=positive,
+                           variable=variable, cache_dir=cache_dir)
+        self.z_from_2D_array(z)
         return
     ## [END] ADD BATHYMETRY =========================================================
 
 
+    ## BATHYMETRY FEATURES ==========================================================
+    def _update_profile(self, func, **kwargs):
+        '''
+        Applies a feature of `_bathymetry.py` to the bathymetry, keeping an
+        alongshore-uniform bathymetry as a profile
+        '''
+        if 'Z' not in self:
+            raise ValueError('The bathymetry must be constructed before adding features onto it')
+        Mglob, DX = self.attrs['Mglob'], self.attrs['DX']
+        if is_alongshore_uniform(self['Z']):
+            self._set_alongshore_uniform('Z', func(self['Z'].values[:, 0], Mglob, DX, **kwargs))
+        else:
+            # (Mglob, Nglob) fields: the feature is applied to each column
+            z = func(self['Z'].values.T, Mglob, DX, **kwargs).T
+            self['Z'] = (('X', 'Y'), z)
+        return
+
+    def add_bar(self, bar_height=None, bar_X=None, bar_width=None):
+        '''
+        Adds a Gaussian sandbar of `bar_height`, centered at `bar_X`
+        '''
+        self._update_profile(bathy.add_bar, bar_height=bar_height,
+                             bar_X=bar_X, bar_width=bar_width)
+        return
+
+    def add_reef(self, reef_depth=None, reef_X=None, reef_width=None, reef_slope=None):
+        '''
+        Adds a submerged trapezoidal reef, with a crest at `reef_depth` from
+        `reef_X` to `reef_X + reef_width`
+        '''
+        self._update_profile(bathy.add_reef, reef_depth=reef_depth, reef_X=reef_X,
+                             reef_width=reef_width, reef_slope=reef_slope)
+        return
+
+    def add_alongshore_feature(self, amplitude=None, wavelength=None,
+                               X_center=None, X_width=None, phase=0.0):
+        '''
+        Adds an alongshore-periodic feature (ie- rip channels), such that the
+        bathymetry is no longer alongshore-uniform
+        '''
+        if 'Z' not in self:
+            raise ValueError('The bathymetry must be constructed before adding features onto it')
+        perturbation = bathy.alongshore_feature(self.attrs['Mglob'], self.attrs['DX'],
+                                                self.attrs['Nglob'], self.attrs['DY'],
+                                                amplitude, wavelength, X_center, X_width, phase)
+        self['Z'] = (('X', 'Y'), self['Z'].values + perturbation)
+        return
+    ## [END] BATHYMETRY FEATURES ====================================================
+
+
     ## ADD FRICTION =================================================================
     # DEPTH_TYPE = DATA (1D) 
     def friction_from_1D_array(self, friction_array_1D):
@@ -143,11 +369,8 @@ class DomainObject(xr.Dataset):
 
         # First, check that it is indeed 1D and Mglob-dimensional
         if np.reshape(friction_array_1D, -1).shape[0] == self.attrs['Mglob']:
-            # Tile the array along Y
-            print(self.attrs['Nglob'])
-            bathy_array = np.tile(friction_array_1D, (self.attrs['Nglob'], 1)).T
-            # Add to object as a data variable
-            self['friction'] = (('X', 'Y'), bathy_array)  
+            # Add to object as an alongshore-uniform data variable
+            self._set_alongshore_uniform('friction', np.reshape(friction_array_1D, -1))
             
         else:
             raise ValueError(f"Array dimensions {friction_array_1D.shape} do not match expected "
@@ -181,10 +404,8 @@ class DomainObject(xr.Dataset):
 
         # First, check that it is indeed 1D and Mglob-dimensional
         if np.reshape(BWAC_array_1D, -1).shape[0] == self.attrs['Mglob']:
-            # Tile the array along Y
-            bathy_array = np.tile(BWAC_array_1D, (self.attrs['Nglob'], 1)).T
-            # Add to object as a data variable
-            self['BW_Width'] = (('X', 'Y'), bathy_array)  
+            # Add to object as an alongshore-uniform data variable
+            self._set_alongshore_uniform('BW_Width', np.reshape(BWAC_array_1D, -1))
             
         else:
             raise ValueError(f"Array dimensions {BWAC_array_1D.shape} do not match expected "
@@ -1,5 +1,6 @@
 import xarray as xr
 import numpy as np
+from . import _spectra as spectra
 
 '''
 The WavemakerObject is the primary object storing everything to do with 
@@ -10,6 +11,10 @@ WAVE_COMP_FILE
 It is based on the xarray object. Use of the WavemakerObject is NOT REQUIRED
 if using WK_REG, WK_IRR, JON_1D, or any of the other wave conditions that can
 be set solely in the input.txt file without a WAVECOMPFILE. 
+
+Components are found from measured/synthetic time series with
+`from_time_series` (batched real FFT, optional taper, and optional reduction
+to at most `max_components` components, see `_spectra.py`).
 '''
 class WK_TIME_SERIES(xr.Dataset):
     __slots__ = ()
@@ -33,7 +38,52 @@ class WK_TIME_SERIES(xr.Dataset):
       if PeakPeriod is None:
          i_peak = np.argmax(amp)
          self.attrs['PeakPeriod'] = period[i_peak]
-         
+      else:
+         self.attrs['PeakPeriod'] = PeakPeriod
+
+    @classmethod
+    def from_time_series(cls, t=None,
+                              eta=None,
+                              f_lo=None,
+                              f_hi=None,
+                              taper=None,
+                              alpha=0.1,
+                              max_components=None,
+                              correction='energy'):
+      '''
+      Builds the wave components of one or many time series (see
+      `get_rfft_values`). Tapered series are corrected to preserve their
+      energy by default (see `_spectra.rfft_components`). The mean (f = 0)
+      bin is dropped. If `max_components` is given, the components are
+      merged into at most that many, conserving m0 and the peak period (see
+      `reduce_components`).
+
+      Returns:
+      - WK (WK_TIME_SERIES): for a (n_t) series, or a list of them for
+          (n_series, n_t) series
+      '''
+      f, amp, phase = WK_TIME_SERIES.get_rfft_values(t, eta, f_lo, f_hi, taper, alpha, correction)
+      single = np.ndim(amp) == 1
+      amp, phase = np.atleast_2d(amp), np.atleast_2d(phase)
+
+      # Mean (f = 0) bin has no period
+      wave = f > 0
+      f, amp, phase = f[wave], amp[:, wave], phase[:, wave]
+
+      # Peak of each spectrum, before any reduction
+      f_peak = f[np.argmax(amp, axis=-1)]
+      f_all = np.broadcast_to(f, amp.shape)
+      if max_components:
+         f_all, amp, phase = spectra.reduce_components(f, amp, phase, max_components)
+
+      wavemakers = []
+      for f_i, amp_i, phase_i, f_peak_i in zip(f_all, amp, phase, f_peak):
+         used = np.isfinite(f_i)
+         wavemakers.append(cls(period = 1/f_i[used],
+                               amp = amp_i[used],
+                               phase = phase_i[used],
+                               PeakPeriod = 1/f_peak_i))
+      return wavemakers[0] if single else wavemakers
 
     ## [END] INITIALIZE =========================================================
 
@@ -49,26 +99,30 @@ class WK_TIME_SERIES(xr.Dataset):
       # Assert time and series the same length
       assert(len(t)==len(eta)),'t and eta must have the same length!'
       
-      # Basic Info
-      dt = t[1]-t[0]     # time step
-      N = len(eta)       # record length
-      
-      # FFT and associated frequencies
-      fft_values = np.fft.fft(eta) 
-      f = np.fft.fftfreq(N, d=dt)
-
-      # Cut to Nyquist
-      f = f[:N//2]
-      fft_values = fft_values[:N//2]
-
-      # Amplitude and Phase at each frequency
-      amp = 2*np.abs(fft_values) /N
-      phase = -np.angle(fft_values)
-
-      # Cut off if necessary
-      if f_lo:
-         f,amp,phase = f[f>f_lo],amp[f>f_lo] , phase[f>f_lo]
-      if f_hi:
-         f,amp,phase = f[f<f_hi],amp[f<f_hi] , phase[f<f_hi]
-      
-      return f,amp,phase
\ No newline at end of file
+      return spectra.rfft_components(t, eta, f_lo, f_hi)
+
+    @staticmethod
+    def get_rfft_values(t=None,
+                        eta=None,
+                        f_lo=None,
+                        f_hi=None,
+                        taper=None,
+                        alpha=0.1,
+                        correction='energy'):
+      '''
+      Batched version of `get_fft_values`: `eta` may be (n_t) or
+      (n_series, n_t), with an optional 'hann' or 'tukey' taper and its
+      'energy' or 'amplitude' correction (see `_spectra.rfft_components`)
+      '''
+      return spectra.rfft_components(t, eta, f_lo, f_hi, taper, alpha, correction)
+
+    @staticmethod
+    def reduce_components(f=None,
+                          amp=None,
+                          phase=None,
+                          max_components=None):
+      '''
+      Merges frequency bins into at most `max_components` components,
+      conserving m0 and the peak period (see `_spectra.reduce_components`)
+      '''
+      return spectra.reduce_components(f, amp, phase, max_components)
\ No newline at end of file
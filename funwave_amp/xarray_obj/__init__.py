@@ -1,4 +1,10 @@
 from ._input_nc_creation import *
 from ._output_nc_creation import *
-from .DomainObject import DomainObject
+from .DomainObject import (DomainObject, expand_alongshore_uniform,
+                           drop_implicit_coords, restore_implicit_coords)
+from ._bathymetry import (slope_profile, piecewise_slope_profile, dean_profile,
+                          add_bar, add_reef, alongshore_feature, add_alongshore_feature)
+from ._dem import regrid_dem
+from ._ensemble_store import (NC_STORES, EnsembleStore, get_ensemble_path,
+                              read_ensemble_trial, write_trial_netcdfs)
 from .WavemakerObject import WK_TIME_SERIES
\ No newline at end of file
@@ -0,0 +1,152 @@
+import numpy as np
+
+
+'''
+Vectorized library of bathymetry profiles. Depths are positive downward (as
+in DEPTH_FILE), and X increases toward the shore, ie- X = DX*[0, ..., Mglob-1]
+as in the DomainObject.
+
+Every parameter may be a scalar, or an array with one entry per trial, such
+that the profiles of many trials are built at once:
+    > scalar parameters only        -> (Mglob) profile
+    > (n_trials) parameter arrays   -> (n_trials, Mglob) profiles
+    > `add_alongshore_feature`      -> (n_trials, Mglob, Nglob) fields
+The profiles of a batch are turned into DomainObjects (without copying) with
+`DomainObject.from_batch`, ie- in a vectorized dependency function:
+
+    @fpy.vectorized_dependency
+    def add_domains(df):
+        Z = fpy.dean_profile(Mglob, DX, A=df['A'].values, X_shore=df['X_shore'].values)
+        Z = fpy.add_bar(Z, Mglob, DX, bar_height=df['bar_height'].values, bar_X=150, bar_width=20)
+        return {'DOM': fpy.DomainObject.from_batch(Z, DX=DX, DY=DY, Nglob=Nglob)}
+'''
+
+
+#%% HELPERS
+def _column(param):
+    '''
+    Parameter as a float array, with a trailing axis to broadcast against X
+    '''
+    return np.asarray(param, dtype=float)[..., np.newaxis]
+
+
+def get_X(Mglob, DX):
+    '''
+    Cross-shore coordinates of the grid, as in the DomainObject
+    '''
+    return DX * np.arange(0, Mglob)
+
+
+#%% PROFILES
+def slope_profile(Mglob, DX, DEPTH_FLAT, Xslp, SLP):
+    '''
+    DEPTH_TYPE = SLOPE: flat at DEPTH_FLAT up to Xslp, then sloping up at SLP,
+    identical to the FUNWAVE-TVD definition (the slope starts at the grid
+    point of Xslp)
+    '''
+    index = np.arange(0, Mglob)
+    start = _column(Xslp) // DX
+    return _column(DEPTH_FLAT) - _column(SLP) * np.maximum(index - start, 0) * DX
+
+
+def piecewise_slope_profile(Mglob, DX, DEPTH_FLAT, X_breaks, slopes):
+    '''
+    Multi-segment profile: flat at DEPTH_FLAT up to the first break point, then
+    sloping up at `slopes[k]` from `X_breaks[k]` to `X_breaks[k+1]` (the last
+    slope continues to the end of the domain)
+
+    Arguments:
+    - DEPTH_FLAT (float/array): offshore depth
+    - X_breaks (array): (n_segments) or (n_trials, n_segments) start of each
+        segment, increasing
+    - slopes (array): slope of each segment, the same shape as `X_breaks`
+    '''
+    X_breaks = np.asarray(X_breaks, dtype=float)
+    slopes = np.asarray(slopes, dtype=float)
+    if X_breaks.shape != slopes.shape:
+        raise ValueError(f'`X_breaks` {X_breaks.shape} and `slopes` {slopes.shape} must be the same shape')
+
+    # Length of each segment, the last one without end
+    lengths = np.diff(X_breaks, axis=-1, append=np.inf)
+    X = get_X(Mglob, DX)
+    # (..., n_segments, Mglob): distance covered within each segment
+    covered = np.clip(X - X_breaks[..., np.newaxis], 0, lengths[..., np.newaxis])
+    return _column(DEPTH_FLAT) - np.sum(slopes[..., np.newaxis] * covered, axis=-2)
+
+
+def dean_profile(Mglob, DX, A, X_shore, DEPTH_FLAT=None, beach_slope=0.1):
+    '''
+    Dean equilibrium profile h = A*d^(2/3), for a distance d offshore of the
+    shoreline at X_shore, and a planar beach of `beach_slope` onshore of it
+
+    Arguments:
+    - A (float/array): shape parameter [m^(1/3)], ie- ~0.1 for fine sand
+    - X_shore (float/array): cross-shore position of the shoreline
+    - DEPTH_FLAT (float/array/None): depth the profile is capped at offshore
+    - beach_slope (float/array): slope of the beach above the shoreline
+    '''
+    distance = _column(X_shore) - get_X(Mglob, DX)
+    z = np.where(distance > 0,
+                 _column(A) * np.abs(distance)**(2/3),
+                 _column(beach_slope) * distance)
+    if DEPTH_FLAT is not None:
+        z = np.minimum(z, _column(DEPTH_FLAT))
+    return z
+
+
+#%% FEATURES
+def add_bar(z, Mglob, DX, bar_height, bar_X, bar_width):
+    '''
+    Adds a Gaussian sandbar onto profile(s) `z`, of height `bar_height`
+    centered at `bar_X`, with e-folding half-width `bar_width`
+    '''
+    shape = np.exp(-((get_X(Mglob, DX) - _column(bar_X)) / _column(bar_width))**2)
+    return z - _column(bar_height) * shape
+
+
+def add_reef(z, Mglob, DX, reef_depth, reef_X, reef_width, reef_slope):
+    '''
+    Adds a submerged trapezoidal reef onto profile(s) `z`: a crest at depth
+    `reef_depth` from `reef_X` to `reef_X + reef_width`, with flanks of
+    `reef_slope`. The reef only ever makes the profile shallower.
+    '''
+    X = get_X(Mglob, DX)
+    start = _column(reef_X)
+    distance = np.maximum(np.maximum(start - X, X - (start + _column(reef_width))), 0)
+    return np.minimum(z, _column(reef_depth) + _column(reef_slope) * distance)
+
+
+def alongshore_feature(Mglob, DX, Nglob, DY, amplitude, wavelength,
+                       X_center, X_width, phase=0.0):
+    '''
+    Alongshore-periodic depth perturbation (ie- rip channels or crescentic
+    bars) of
+        amplitude*cos(2*pi*Y/wavelength + phase)*exp(-((X - X_center)/X_width)^2)
+    Positive amplitudes deepen the profile where the cosine is positive.
+
+    Returns:
+    - perturbation (array): (Mglob, Nglob) or (n_trials, Mglob, Nglob)
+    '''
+    Y = DY * np.arange(0, Nglob)
+    cross_shore = np.exp(-((get_X(Mglob, DX) - _column(X_center)) / _column(X_width))**2)
+    alongshore = np.cos(2*np.pi*Y / _column(wavelength) + _column(phase))
+    return (_column(amplitude)[..., np.newaxis]
+            * cross_shore[..., :, np.newaxis]
+            * alongshore[..., np.newaxis, :])
+
+
+def add_alongshore_feature(z, Mglob, DX, Nglob, DY, amplitude, wavelength,
+                           X_center, X_width, phase=0.0):
+    '''
+    Extends profile(s) `z` along Y with an alongshore-periodic feature (see
+    `alongshore_feature`). Several features are combined by adding their
+    `alongshore_feature` perturbations onto `z[..., np.newaxis]`.
+
+    Returns:
+    - z (array): (Mglob, Nglob) or (n_trials, Mglob, Nglob) fields
+    '''
+    z = np.asarray(z, dtype=float)
+    if z.shape[-1:] != (Mglob,):
+        raise ValueError(f'`z` must be (Mglob) or (n_trials, Mglob) profiles, not {z.shape}')
+    return z[..., np.newaxis] + alongshore_feature(Mglob, DX, Nglob, DY, amplitude, wavelength,
+                                                    X_center, X_width, phase)
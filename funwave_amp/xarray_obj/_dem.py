@@ -0,0 +1,352 @@
+import os
+import hashlib
+import numpy as np
+from collections import OrderedDict
+import pandas as pd
+import xarray as xr
+
+from ..setup_paths_envs import get_env
+from ..log_tools import logger
+
+
+'''
+Ingest of external gridded bathymetry (DEMs) onto the FUNWAVE-TVD grid, see
+`DomainObject.z_from_DEM`. Supported sources:
+    > ESRI ASCII grids (.asc): parsed ONCE into a NumPy sidecar in the cache,
+      which is memory mapped from then on
+    > NetCDF grids: opened lazily, such that only the window around the
+      domain is read
+
+The FUNWAVE grid is placed on the DEM by the `origin` (DEM coordinates of
+X = Y = 0) and `rotation` (degrees, counter-clockwise from the DEM x-axis to
+the FUNWAVE X-axis), cropped to the window it covers, and regridded with
+vectorized interpolation:
+    > 'bilinear'    : bilinear interpolation at each grid point
+    > 'conservative': area-weighted average of the DEM cells overlapping each
+                      grid cell (no rotation)
+
+The regridded bathymetry is cached in `{is}/dem_cache`, keyed by (hash of
+the source file, DX, DY, Mglob, Nglob, origin, rotation, method, ...), such
+that trials that share a resolution reuse it at no cost. The last
+`REGRID_MEMORY_SIZE` regridded bathymetries are also kept in memory.
+'''
+
+DEM_METHODS = ['bilinear', 'conservative']
+
+# Names the elevation and coordinates of a NetCDF DEM are searched for with
+NC_VARIABLES = ['Z', 'z', 'elevation', 'depth', 'Band1', 'topo', 'bathy']
+NC_X = ['x', 'X', 'lon', 'longitude', 'easting']
+NC_Y = ['y', 'Y', 'lat', 'latitude', 'northing']
+
+# Number of regridded bathymetries kept in memory (least recently used are
+# discarded, and memory mapped from the on-disk cache if needed again)
+REGRID_MEMORY_SIZE = 8
+
+# In-memory caches, of file hashes (by path, size, and modification time)
+# and of regridded bathymetries (by cache key)
+_FILE_HASHES = {}
+_REGRIDDED = OrderedDict()
+
+
+def _remember_regrid(key, z):
+    _REGRIDDED[key] = z
+    _REGRIDDED.move_to_end(key)
+    while len(_REGRIDDED) > REGRID_MEMORY_SIZE:
+        _REGRIDDED.popitem(last=False)
+
+
+#%% SOURCES
+def hash_file(path, block_size=1 << 24):
+    '''
+    Content hash of a file, computed once per version of the file
+    '''
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _FILE_HASHES:
+        sha = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                sha.update(block)
+        _FILE_HASHES[key] = sha.hexdigest()
+    return _FILE_HASHES[key]
+
+
+def get_dem_cache_dir(cache_dir=None):
+    '''
+    Directory of the on-disk cache, `{is}/dem_cache` by default, or None if
+    there is none (in-memory cache only)
+    '''
+    if cache_dir is None and get_env('is'):
+        cache_dir = os.path.join(get_env('is'), 'dem_cache')
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def _read_asc_header(path):
+    header = {}
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) != 2 or not parts[0][0].isalpha():
+                break
+            header[parts[0].lower()] = float(parts[1])
+    return header
+
+
+def read_asc(path, cache_dir=None):
+    '''
+    Reads an ESRI ASCII grid. The values are parsed once into `.npy` in the
+    cache, which is memory mapped on later reads.
+
+    Returns:
+    - x, y (array): coordinates of the cell centers, increasing
+    - z (array): (len(y), len(x)) elevation, NaN where there is no data
+    '''
+    header = _read_asc_header(path)
+    nx, ny = int(header['ncols']), int(header['nrows'])
+    cell = header['cellsize']
+    x0 = header.get('xllcenter', header.get('xllcorner', 0.0) + cell/2)
+    y0 = header.get('yllcenter', header.get('yllcorner', 0.0) + cell/2)
+
+    cache_dir = get_dem_cache_dir(cache_dir)
+    npy_path = os.path.join(cache_dir, f'dem_{hash_file(path)[:16]}.npy') if cache_dir else None
+    if npy_path and os.path.exists(npy_path):
+        z = np.load(npy_path, mmap_mode='r')
+    else:
+        logger.info(f'Parsing ASCII DEM: {path}')
+        z = pd.read_csv(path, skiprows=len(header), sep=r'\s+', header=None,
+                        dtype=np.float64, engine='c').to_numpy()
+        if z.shape != (ny, nx):
+            raise ValueError(f'ASCII DEM {path} is {z.shape}, not ({ny}, {nx}) as in its header')
+        if 'nodata_value' in header:
+            z[z == header['nodata_value']] = np.nan
+        # First row is the northernmost
+        z = z[::-1]
+        if npy_path:
+            tmp_path = f'{npy_path}.{os.getpid()}.tmp.npy'
+            np.save(tmp_path, z)
+            os.replace(tmp_path, npy_path)
+            z = np.load(npy_path, mmap_mode='r')
+
+    x = x0 + cell * np.arange(nx)
+    y = y0 + cell * np.arange(ny)
+    return x, y, z
+
+
+def _find_name(names, candidates, kind):
+    for name in candidates:
+        if name in names:
+            return name
+    raise ValueError(f'No {kind} found in the DEM among {candidates}, specify it')
+
+
+def open_nc_dem(path, variable=None):
+    '''
+    Opens a NetCDF DEM lazily (nothing is read until it is indexed)
+
+    Returns:
+    - da (DataArray): elevation, dimensions (y, x) with increasing coordinates
+    '''
+    ds = xr.open_dataset(path)
+    variable = variable or _find_name(ds.data_vars, NC_VARIABLES, 'elevation variable')
+    da = ds[variable]
+    x_name = _find_name(da.dims, NC_X, 'x dimension')
+    y_name = _find_name(da.dims, NC_Y, 'y dimension')
+    da = da.transpose(y_name, x_name)
+    for name in [x_name, y_name]:
+        if da[name].size > 1 and da[name].values[1] < da[name].values[0]:
+            da = da.isel({name: slice(None, None, -1)})
+    return da
+
+
+#%% GEOMETRY
+def get_grid_points(Mglob, Nglob, DX, DY, origin=(0.0, 0.0), rotation=0.0):
+    '''
+    DEM coordinates of each FUNWAVE grid point
+
+    Returns:
+    - x, y (array): (Mglob, Nglob)
+    '''
+    X = DX * np.arange(0, Mglob)[:, np.newaxis]
+    Y = DY * np.arange(0, Nglob)[np.newaxis, :]
+    theta = np.deg2rad(rotation)
+    x = origin[0] + X*np.cos(theta) - Y*np.sin(theta)
+    y = origin[1] + X*np.sin(theta) + Y*np.cos(theta)
+    return x, y
+
+
+def _window(coords, low, high):
+    '''
+    Slice of the (increasing) coordinates covering [low, high], with one
+    extra point on either side for interpolation
+    '''
+    start = max(int(np.searchsorted(coords, low, side='right')) - 1, 0)
+    stop = min(int(np.searchsorted(coords, high, side='left')) + 1, len(coords))
+    return slice(start, stop)
+
+
+#%% REGRIDDING
+def _bilinear(x_src, y_src, z_src, x, y):
+    '''
+    Bilinear interpolation of a regular grid at points (x, y), NaN outside
+    '''
+    dx = x_src[1] - x_src[0] if len(x_src) > 1 else 1.0
+    dy = y_src[1] - y_src[0] if len(y_src) > 1 else 1.0
+    fi = (x - x_src[0]) / dx
+    fj = (y - y_src[0]) / dy
+    outside = (fi < 0) | (fi > len(x_src) - 1) | (fj < 0) | (fj > len(y_src) - 1)
+
+    i = np.clip(np.floor(fi).astype(int), 0, max(len(x_src) - 2, 0))
+    j = np.clip(np.floor(fj).astype(int), 0, max(len(y_src) - 2, 0))
+    wi = np.clip(fi - i, 0, 1)
+    wj = np.clip(fj - j, 0, 1)
+    i1 = np.minimum(i + 1, len(x_src) - 1)
+    j1 = np.minimum(j + 1, len(y_src) - 1)
+
+    z = ((1 - wj) * ((1 - wi) * z_src[j, i] + wi * z_src[j, i1])
+         + wj * ((1 - wi) * z_src[j1, i] + wi * z_src[j1, i1]))
+    z[outside] = np.nan
+    return z
+
+
+def _overlap_weights(edges_src, edges):
+    '''
+    (n_target, n_source) fraction of each target cell covered by each source
+    cell, for 1D cell edges
+    '''
+    low = np.maximum(edges[:-1, np.newaxis], edges_src[np.newaxis, :-1])
+    high = np.minimum(edges[1:, np.newaxis], edges_src[np.newaxis, 1:])
+    overlap = np.clip(high - low, 0, None)
+    covered = overlap.sum(axis=1, keepdims=True)
+    # Cells not fully covered by the DEM are NaN
+    full = np.isclose(covered[:, 0], np.diff(edges))
+    weights = overlap / np.where(covered > 0, covered, 1)
+    weights[~full] = np.nan
+    return weights
+
+
+def _edges(centers, spacing):
+    return np.concatenate([centers - spacing/2, [centers[-1] + spacing/2]])
+
+
+def _conservative(x_src, y_src, z_src, x, y, DX, DY):
+    '''
+    Area-weighted average of the source cells over each (axis aligned) grid
+    cell, as separable overlap weights: Wy @ z_src @ Wx.T. Missing data is
+    zeroed out of the product and tracked by the same product of the valid
+    mask, such that only the grid cells overlapping it are NaN.
+    '''
+    dx = x_src[1] - x_src[0] if len(x_src) > 1 else DX
+    dy = y_src[1] - y_src[0] if len(y_src) > 1 else DY
+    Wx = _overlap_weights(_edges(x_src, dx), _edges(x[:, 0], DX))
+    Wy = _overlap_weights(_edges(y_src, dy), _edges(y[0, :], DY))
+
+    # Cells not fully covered by the DEM have NaN weights
+    outside = np.isnan(Wy[:, 0])[:, np.newaxis] | np.isnan(Wx[:, 0])[np.newaxis, :]
+    Wx, Wy = np.nan_to_num(Wx), np.nan_to_num(Wy)
+
+    # Weighted sum of the data, and weight of the valid data, in each cell
+    z_src = np.asarray(z_src, dtype=float)
+    valid = ~np.isnan(z_src)
+    total = Wy @ np.where(valid, z_src, 0.0) @ Wx.T
+    covered = Wy @ valid.astype(float) @ Wx.T
+    full = np.isclose(covered, 1.0) & ~outside
+    z = np.full(total.shape, np.nan)
+    z[full] = total[full] / covered[full]
+    # (Mglob, Nglob)
+    return z.T
+
+
+def regrid_dem(path,
+               Mglob,
+               Nglob,
+               DX,
+               DY,
+               origin = (0.0, 0.0),
+               rotation = 0.0,
+               method = 'bilinear',
+               positive = 'up',
+               variable = None,
+               cache_dir = None):
+    '''
+    Regridded bathymetry of a DEM on the FUNWAVE grid, from the cache if
+    available (see module docstring)
+
+    Arguments:
+    - path (str): ESRI ASCII (.asc) or NetCDF DEM
+    - Mglob, Nglob, DX, DY: FUNWAVE grid
+    - origin (tuple): DEM coordinates of X = Y = 0
+    - rotation (float): degrees, counter-clockwise from the DEM x-axis to X
+    - method (str): 'bilinear' or 'conservative'
+    - positive (str): 'up' for elevations (negated into depths), or 'down'
+        for depths
+    - variable (str/None): elevation variable of a NetCDF DEM
+    - cache_dir (str/None): on-disk cache, `{is}/dem_cache` if None
+
+    Returns:
+    - z (array): (Mglob, Nglob) read-only depth, positive downward
+    '''
+    if method not in DEM_METHODS:
+        raise ValueError(f'`method` must be one of {DEM_METHODS}, not {method}')
+    if positive not in ['up', 'down']:
+        raise ValueError(f"`positive` must be 'up' or 'down', not {positive}")
+    if method == 'conservative' and rotation % 360 != 0:
+        raise ValueError("The 'conservative' method does not support a rotated grid, use 'bilinear'")
+    Mglob, Nglob = int(Mglob), int(Nglob)
+    origin = tuple(float(value) for value in origin)
+
+    ## Cache ==================================================================
+    key_fields = (hash_file(path), float(DX), float(DY), Mglob, Nglob,
+                  origin, float(rotation), method, positive, variable)
+    key = hashlib.sha1(repr(key_fields).encode()).hexdigest()[:16]
+    if key in _REGRIDDED:
+        _REGRIDDED.move_to_end(key)
+        return _REGRIDDED[key]
+
+    cache_dir = get_dem_cache_dir(cache_dir)
+    cache_path = os.path.join(cache_dir, f'regrid_{key}.npy') if cache_dir else None
+    if cache_path and os.path.exists(cache_path):
+        z = np.load(cache_path, mmap_mode='r')
+        _remember_regrid(key, z)
+        return z
+    ## [END] Cache ============================================================
+
+    ## Read only the window of the DEM the domain covers
+    x, y = get_grid_points(Mglob, Nglob, DX, DY, origin, rotation)
+    pad_x, pad_y = (DX/2, DY/2) if method == 'conservative' else (0.0, 0.0)
+    if os.path.splitext(path)[1].lower() == '.asc':
+        x_src, y_src, z_src = read_asc(path, cache_dir)
+        i_window = _window(x_src, x.min() - pad_x, x.max() + pad_x)
+        j_window = _window(y_src, y.min() - pad_y, y.max() + pad_y)
+        x_src, y_src = x_src[i_window], y_src[j_window]
+        z_src = np.asarray(z_src[j_window, i_window], dtype=float)
+    else:
+        da = open_nc_dem(path, variable)
+        x_name, y_name = da.dims[1], da.dims[0]
+        i_window = _window(da[x_name].values, x.min() - pad_x, x.max() + pad_x)
+        j_window = _window(da[y_name].values, y.min() - pad_y, y.max() + pad_y)
+        da = da.isel({x_name: i_window, y_name: j_window})
+        x_src, y_src = da[x_name].values, da[y_name].values
+        z_src = da.values.astype(float)
+        da.close()
+
+    ## Regrid
+    if method == 'bilinear':
+        z = _bilinear(x_src, y_src, z_src, x, y)
+    else:
+        z = _conservative(x_src, y_src, z_src, x, y, DX, DY)
+    if np.isnan(z).any():
+        raise ValueError(f'{np.isnan(z).sum()} grid points are outside of the DEM (or on '
+                         f'missing data), check `origin`, `rotation`, and the grid')
+    if positive == 'up':
+        z = -z
+
+    if cache_path:
+        tmp_path = f'{cache_path}.{os.getpid()}.tmp.npy'
+        np.save(tmp_path, z)
+        os.replace(tmp_path, cache_path)
+    z.flags.writeable = False
+    _remember_regrid(key, z)
+    logger.debug(f'\t\tRegridded DEM {path} to ({Mglob}, {Nglob}) at ({DX}, {DY})')
+    return z
@@ -0,0 +1,388 @@
+import os
+import hashlib
+import numpy as np
+import xarray as xr
+import netCDF4
+
+from ..setup_paths_envs import get_path_resolver
+from ..log_tools import logger
+
+
+'''
+Ensemble store: the input NetCDF data of every trial in ONE NetCDF4 file,
+`{is}/{name}_ensemble.nc`, rather than one `tri_XXXXX.nc` per trial (see the
+`nc_store` argument of `process_design_matrix`). Layout:
+    > root: an unlimited `trial` dimension, and each scalar parameter (the
+      attributes of a trial NetCDF, including ITER) as a (trial) variable.
+      `param_names` lists the parameter variables of each trial, in order,
+      such that the attributes of a trial are recovered exactly.
+    > /fields/{name}: (trial) hash of the data variable `name` (ie- Z) of
+      each trial, '' if it has none. Coordinates not attached to any data
+      variable are stored as fields of their own.
+    > /fields/h{hash}: the data variable (and its coordinates) with that
+      hash, stored only once, such that grids/bathymetries shared by many
+      trials are not duplicated
+
+The data of a trial is read back by ITER with `read_ensemble_trial`, and
+identical per-trial files can still be written from the store on demand
+with `write_trial_netcdfs`.
+'''
+
+NC_STORES = ['trial', 'ensemble']
+
+# Fill values of parameters a trial does not have (never read back)
+_FILL = {'f': np.nan, 'i': netCDF4.default_fillvals['i4'], 'u': 0, 'S': ''}
+
+
+def get_ensemble_path(resolver=None):
+    '''
+    Path of the ensemble store, alongside the input summary
+    '''
+    if resolver is None:
+        resolver = get_path_resolver()
+    return os.path.join(resolver.get('is'), f"{resolver.get('name')}_ensemble.nc")
+
+
+#%% HELPERS
+def _kind_of(value):
+    '''
+    NetCDF type of a parameter value: str, or its numpy dtype
+    '''
+    if isinstance(value, str):
+        return str
+    return np.asarray(value).dtype
+
+
+def _kind_code(kind):
+    return 'S' if kind is str else np.dtype(kind).kind
+
+
+# Encoding that changes what is written (see `ensure_net_cdf_type`)
+ENCODING_KEYS = ['dtype', '_FillValue', 'scale_factor', 'add_offset']
+
+
+def _hash_field(data_array):
+    '''
+    Hash of a data variable, including its dimensions, coordinates,
+    attributes, and encoding
+    '''
+    sha = hashlib.sha1()
+    for name, variable in [(data_array.name, data_array.variable),
+                           *sorted((str(k), v.variable) for k, v in data_array.coords.items())]:
+        values = np.ascontiguousarray(variable.values)
+        encoding = [(key, str(variable.encoding[key])) for key in ENCODING_KEYS if key in variable.encoding]
+        sha.update(repr((name, variable.dims, values.shape, values.dtype.str,
+                         sorted(variable.attrs.items()), encoding)).encode())
+        sha.update(values.tobytes() if values.dtype.kind != 'O' else repr(values.tolist()).encode())
+    return sha.hexdigest()[:20]
+
+
+def _write_variable(group, name, variable, attrs=None):
+    '''
+    Writes an xarray Variable to a netCDF4 group (its dimensions must exist),
+    encoded as `to_netcdf` would (type, fill value, scale/offset)
+    '''
+    variable = variable.to_base_variable()
+    variable.encoding = {key: variable.encoding[key] for key in ENCODING_KEYS if key in variable.encoding}
+    encoded = xr.conventions.encode_cf_variable(variable, name=name)
+    values = encoded.values
+    var_attrs = {**encoded.attrs, **(attrs or {})}
+    fill_value = var_attrs.pop('_FillValue', None)
+    if values.dtype.kind in 'USO':
+        var = group.createVariable(name, str, encoded.dims)
+        var[...] = np.asarray(values, dtype=object)
+    else:
+        var = group.createVariable(name, values.dtype, encoded.dims, fill_value=fill_value)
+        var.set_auto_maskandscale(False)
+        var[...] = values
+    var.setncatts(var_attrs)
+
+
+def _read_group(group):
+    '''
+    Dataset of a field group, decoded as `load_dataset` would
+    '''
+    variables = {}
+    for name, var in group.variables.items():
+        var.set_auto_maskandscale(False)
+        attrs = {key: var.getncattr(key) for key in var.ncattrs()}
+        variables[name] = xr.Variable(var.dimensions, var[...], attrs=attrs)
+    return xr.decode_cf(xr.Dataset(variables)).load()
+
+
+#%% STORE
+class EnsembleStore:
+    '''
+    Incremental writer (and reader) of an ensemble store. Trials are added
+    with `append` (in any order of ITER, a trial already in the store is
+    overwritten), and parameters are written `flush_every` trials at a time.
+    New fields are written as soon as they are seen.
+
+    `append`/`extend` match a list, such that a store can be passed anywhere
+    a list of trial datasets was.
+    '''
+
+    ## INITIALIZE =============================================================
+    def __init__(self, path, mode='a', flush_every=100):
+        '''
+        Arguments:
+        - path (str): path of the store
+        - mode (str): 'w' to start a new store, 'a' to add on to an existing
+            one (created if it does not exist), or 'r' to read only
+        - flush_every (int): number of trials written at a time
+        '''
+        if mode not in ['w', 'a', 'r']:
+            raise ValueError(f"`mode` must be 'w', 'a', or 'r', not {mode}")
+        if mode == 'a' and not os.path.exists(path):
+            mode = 'w'
+        self.path = path
+        self.mode = mode
+        self.flush_every = flush_every
+        self.nc = netCDF4.Dataset(path, mode, format='NETCDF4')
+
+        if mode == 'w':
+            self.nc.createDimension('trial', None)
+            self.nc.createVariable('param_names', str, ('trial',))
+            self.nc.createGroup('fields')
+            self.nc.setncattr('title', 'FUNWAVE-TVD ensemble input store')
+        self.fields = self.nc['fields']
+
+        # Row of each ITER, parameter variables by (key, kind), known fields
+        self.rows = {}
+        if 'ITER' in self.nc.variables:
+            iter_nums = np.ma.getdata(self.nc['ITER'][:])
+            self.rows = {int(iter_num): row for row, iter_num in enumerate(iter_nums)}
+        self.next_row = len(self.nc.dimensions['trial'])
+        self.params = {}
+        for name, var in self.nc.variables.items():
+            if 'param' in var.ncattrs():
+                self.params[(var.getncattr('param'), _kind_code(var.dtype))] = name
+        self.known = set(self.fields.groups)
+
+        self.pending = []
+        self._cache = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+    ## [END] INITIALIZE =======================================================
+
+
+    ## WRITING ================================================================
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, iter_num):
+        return int(iter_num) in self.rows
+
+    def append(self, ds):
+        '''
+        Adds the (type enforced) dataset of a trial, as created by
+        `get_net_cdf`
+        '''
+        iter_num = int(ds.attrs['ITER'])
+        row = self.rows.get(iter_num)
+        if row is None:
+            row = self.next_row
+            self.next_row = self.next_row + 1
+            self.rows[iter_num] = row
+
+        # Fields are stored once per hash: the data variables, and any
+        # coordinates not attached to one (ie- Y of compacted fields)
+        fields = dict(ds.data_vars)
+        attached = {name for data_array in fields.values() for name in data_array.coords}
+        fields.update((name, ds[name]) for name in ds.coords if name not in attached)
+        hashes = {}
+        for name, data_array in fields.items():
+            key = _hash_field(data_array)
+            if f'h{key}' not in self.known:
+                self._write_field(f'h{key}', data_array)
+            hashes[name] = key
+
+        self.pending.append((row, dict(ds.attrs), hashes))
+        if len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def extend(self, datasets):
+        for ds in datasets:
+            self.append(ds)
+
+    def merge(self, path):
+        '''
+        Adds on every trial of the ensemble store at `path`, in ITER order
+        '''
+        with EnsembleStore(path, mode='r') as other:
+            for iter_num in other.iter_nums:
+                self.append(other.read_trial(iter_num))
+            return len(other)
+
+    def _write_field(self, group_name, data_array):
+        group = self.fields.createGroup(group_name)
+        for name, coord in data_array.coords.items():
+            for dim, size in zip(coord.dims, coord.shape):
+                if dim not in group.dimensions:
+                    group.createDimension(dim, size)
+        for dim, size in zip(data_array.dims, data_array.shape):
+            if dim not in group.dimensions:
+                group.createDimension(dim, size)
+
+        for name, coord in data_array.coords.items():
+            _write_variable(group, name, coord.variable)
+        if data_array.name not in data_array.coords:
+            coordinates = [name for name in data_array.coords if name not in data_array.dims]
+            attrs = {'coordinates': ' '.join(coordinates)} if coordinates else None
+            _write_variable(group, data_array.name, data_array.variable, attrs)
+        self.known.add(group_name)
+
+    def _param_var(self, key, value):
+        '''
+        Variable of a parameter, created on first use. Should a parameter
+        change type between trials, each type has its own variable.
+        '''
+        kind = _kind_of(value)
+        code = _kind_code(kind)
+        name = self.params.get((key, code))
+        if name is None:
+            name = key if key not in self.nc.variables else f'{key}__{code}'
+            var = self.nc.createVariable(name, kind, ('trial',))
+            var.setncattr('param', key)
+            self.params[(key, code)] = name
+        return name
+
+    def _field_var(self, name):
+        if name not in self.fields.variables:
+            self.fields.createVariable(name, str, ('trial',))
+        return name
+
+    def flush(self):
+        '''
+        Writes the parameters of the pending trials
+        '''
+        if not self.pending:
+            return
+        pending = sorted(self.pending, key=lambda item: item[0])
+        self.pending = []
+        rows = [row for row, _, _ in pending]
+
+        # Column of each variable over the pending trials
+        columns = {'param_names': [''] * len(pending)}
+        field_columns = {name: [''] * len(pending) for name in self.fields.variables}
+        for i, (_, attrs, hashes) in enumerate(pending):
+            names = []
+            for key, value in attrs.items():
+                name = self._param_var(key, value)
+                if name not in columns:
+                    var = self.nc[name]
+                    fill = _FILL.get(_kind_code(var.dtype), 0)
+                    columns[name] = [fill] * len(pending)
+                columns[name][i] = value
+                names.append(name)
+            columns['param_names'][i] = '\n'.join(names)
+            for name, key in hashes.items():
+                if name not in field_columns:
+                    field_columns[self._field_var(name)] = [''] * len(pending)
+                field_columns[name][i] = key
+
+        # Contiguous rows are written as a slice, otherwise row by row
+        contiguous = rows == list(range(rows[0], rows[0] + len(rows)))
+        for group, group_columns in [(self.nc, columns), (self.fields, field_columns)]:
+            for name, column in group_columns.items():
+                var = group[name]
+                column = np.asarray(column, dtype=object if var.dtype is str else var.dtype)
+                if contiguous:
+                    var[rows[0]:rows[0] + len(rows)] = column
+                else:
+                    for row, value in zip(rows, column):
+                        var[row] = value
+        self.nc.sync()
+
+    def close(self):
+        if self.nc.isopen():
+            if self.mode != 'r':
+                self.flush()
+            self.nc.close()
+            logger.debug(f'Closed ensemble store of {len(self.rows)} trials: {self.path}')
+    ## [END] WRITING ==========================================================
+
+
+    ## READING ================================================================
+    @property
+    def iter_nums(self):
+        return sorted(self.rows)
+
+    def _read_field(self, group_name):
+        if group_name not in self._cache:
+            self._cache[group_name] = _read_group(self.fields[group_name])
+        return self._cache[group_name]
+
+    def read_trial(self, iter_num):
+        '''
+        Dataset of trial `iter_num`, identical to its `tri_XXXXX.nc`
+        '''
+        iter_num = int(iter_num)
+        if iter_num not in self.rows:
+            raise KeyError(f'Trial {iter_num} is not in the ensemble store: {self.path}')
+        self.flush()
+        row = self.rows[iter_num]
+
+        # Data variables of each field
+        datasets = []
+        for name, var in self.fields.variables.items():
+            key = var[row]
+            if key:
+                datasets.append(self._read_field(f'h{key}'))
+        ds = xr.merge(datasets) if datasets else xr.Dataset()
+
+        # Parameters, in order
+        attrs = {}
+        for name in self.nc['param_names'][row].split('\n'):
+            var = self.nc[name]
+            value = var[row]
+            if not isinstance(value, str):
+                value = np.ma.getdata(value)[()]
+            attrs[var.getncattr('param')] = value
+        ds.attrs = attrs
+        return ds
+    ## [END] READING ==========================================================
+
+
+
+def read_ensemble_trial(iter_num, path=None, resolver=None):
+    '''
+    Dataset of trial `iter_num` from the ensemble store at `path` (that of
+    the active resolver if None)
+    '''
+    path = path or get_ensemble_path(resolver)
+    with EnsembleStore(path, mode='r') as store:
+        return store.read_trial(iter_num)
+
+
+def write_trial_netcdfs(iter_nums=None, path=None, resolver=None):
+    '''
+    Writes the `tri_XXXXX.nc` of trials of the ensemble store on demand, as
+    they would have been by `get_net_cdf`
+
+    Arguments:
+    - iter_nums (iterable/None): trials to write, all if None
+    - path (str/None): ensemble store, that of the resolver if None
+    - resolver (PathResolver/None): resolver of the paths, the active one if
+        None (see `set_path_resolver`)
+
+    Returns:
+    - paths (list): path of each file written
+    '''
+    if resolver is None:
+        resolver = get_path_resolver()
+    path = path or get_ensemble_path(resolver)
+
+    paths = []
+    with EnsembleStore(path, mode='r') as store:
+        for iter_num in (store.iter_nums if iter_nums is None else iter_nums):
+            resolver.make_trial_dirs(int(iter_num))
+            nc_path = resolver.get_key_dirs(int(iter_num))['nc']
+            store.read_trial(iter_num).to_netcdf(nc_path)
+            paths.append(nc_path)
+    logger.info(f'{len(paths)} trial NetCDF files written from: {path}')
+    return paths
@@ -2,41 +2,62 @@ import numpy as np
 import xarray as xr
 import funwave_amp as fpy
 import warnings
+from .DomainObject import compact_alongshore_uniform, drop_uniform_flag, drop_implicit_coords
+from ..log_tools import logger
 
 
-def ensure_net_cdf_type(nc_data):
+# Float coordinates are stored in float32 unless that moves a point by more
+# than this fraction of the grid spacing, in which case they stay float64
+COORD_TOLERANCE = 1e-4
+
+
+def get_net_cdf_dtype(variable, is_coord=False, coord_tolerance=COORD_TOLERANCE):
     """
-    Enforces type compatibility for NETCDF:
+    NetCDF type of a variable: float32 for floats (float64 for coordinates
+    that need it, see `COORD_TOLERANCE`), int32 for integers, and None (as-is)
+    otherwise
     """
-    
-    print("\tStarting type enforcement on NETCDF")
+    dtype = variable.dtype
+    if np.issubdtype(dtype, np.floating):
+        if is_coord and variable.ndim == 1 and variable.size > 1 and dtype.itemsize > 4:
+            values = variable.values
+            steps = np.abs(np.diff(values))
+            spacing = steps[steps > 0].min() if np.any(steps > 0) else 1.0
+            error = np.max(np.abs(values.astype(np.float32) - values))
+            if error > coord_tolerance*spacing:
+                return np.dtype(np.float64)
+        return np.dtype(np.float32)
+    elif np.issubdtype(dtype, np.integer):
+        return np.dtype(np.int32)
+    return None
 
-    # DATA VARIABLES ----------------------------------------------------------
-    for var_name in nc_data.data_vars:
-        # Get the type
-        dtype = nc_data[var_name].dtype
-        
-        # Convert floats
-        if np.issubdtype(dtype, np.floating):
-            nc_data[var_name] = nc_data[var_name].astype(np.float32)
-        # Convert integers
-        elif np.issubdtype(dtype, np.integer):
-            nc_data[var_name] = nc_data[var_name].astype(np.int32)
-    # [END] DATA VARIABLES ----------------------------------------------------
-    
+
+def ensure_net_cdf_type(nc_data, encoding=None, coord_tolerance=COORD_TOLERANCE):
+    """
+    Enforces type compatibility for NETCDF. The types of the data variables
+    and coordinates (see `get_net_cdf_dtype`) are set as their encoding, and
+    applied as they are written, rather than converting (copying) them in
+    memory. Attributes are converted, since they are also the parameters of
+    input.txt and the summaries.
+
+    Arguments:
+    - nc_data (Dataset): data of a trial, its variables are given an encoding
+    - encoding (dict/None): encoding of any variable to override the type
+        policy with, by name (ie- {'Z': {'dtype': 'int16', 'scale_factor':
+        0.001, '_FillValue': -32768}})
+    - coord_tolerance (float): see `COORD_TOLERANCE`
+    """
     
-    # COORDINATES -------------------------------------------------------------
-    for coord_name in nc_data.coords:
-        # Get the type
-        dtype = nc_data.coords[coord_name].dtype
-        
-        # Convert floats
-        if np.issubdtype(dtype, np.floating):
-            nc_data.coords[coord_name] = nc_data.coords[coord_name].astype(np.float32)
-        # Convert integers
-        elif np.issubdtype(dtype, np.integer):
-            nc_data.coords[coord_name] = nc_data.coords[coord_name].astype(np.int32)
-    # [END] COORDINATES -------------------------------------------------------
+    logger.debug("\tStarting type enforcement on NETCDF")
+
+    # VARIABLES ---------------------------------------------------------------
+    for name, variable in nc_data.variables.items():
+        dtype = get_net_cdf_dtype(variable, name in nc_data.coords, coord_tolerance)
+        if dtype is not None:
+            variable.encoding['dtype'] = dtype
+        if encoding and name in encoding:
+            variable.encoding.update(encoding[name])
+    # [END] VARIABLES ---------------------------------------------------------
     
     
     # ATTRIBUTES --------------------------------------------------------------
@@ -56,7 +77,7 @@ def ensure_net_cdf_type(nc_data):
         # Convert to string otherwise
         else:
             new_attrs[attr_name] = str(attr_value)
-            print(f"\t\tUnsupported Type: Converted attribute '{attr_name}' to string")
+            logger.debug(f"\t\tUnsupported Type: Converted attribute '{attr_name}' to string")
     
     nc_data.attrs = new_attrs
     # [END] ATTRIBUTES --------------------------------------------------------
@@ -65,11 +86,19 @@ def ensure_net_cdf_type(nc_data):
     return nc_data
 
 
-def get_net_cdf(var_dict):
+def get_net_cdf(var_dict, resolver=None, store=None, implicit_coords=False, encoding=None,
+                compact_uniform=False):
     '''
-    Coerces input data into a NETCDF file
+    Coerces input data into a NETCDF file, or adds it onto the ensemble
+    store `store` (see `_ensemble_store.py`) if given. Types are applied as
+    the data is written (see `ensure_net_cdf_type`, `encoding` overrides the
+    type policy by variable name). If `implicit_coords` is True, X/Y are left
+    out of the file and rebuilt from DX/DY when read (see
+    `drop_implicit_coords`). If `compact_uniform` is True, alongshore-uniform
+    fields are saved as their (X) profile rather than as (X, Y) fields (see
+    `compact_alongshore_uniform`).
     '''
-    print('\nStarted compressing data to NETCDF...')
+    logger.debug('\nStarted compressing data to NETCDF...')
     
     
 
@@ -84,7 +113,7 @@ def get_net_cdf(var_dict):
             xr_datasets.append(value)
         # Raise warning for things that aren't xarrays/ints/floats/strings
         elif not isinstance(value, (int, float, str)):
-            print(f'Warning: {key} not saved to .nc due to type {type(value)}')
+            logger.warning(f'Warning: {key} not saved to .nc due to type {type(value)}')
     
     # Merge any datasets that may exist
     nc_data = xr.merge(xr_datasets) 
@@ -100,21 +129,35 @@ def get_net_cdf(var_dict):
         
         # Raise warning if the variable can't be stored
         elif not isinstance(value, xr.Dataset):
-            print(f"Warning: {key} cannot be saved to NetCDF since it is of type {type(value).__name__}")
+            logger.warning(f"Warning: {key} cannot be saved to NetCDF since it is of type {type(value).__name__}")
     ## [END] ATTRIBUTE HANDLING -----------------------------------------------    
             
             
     ## ASSERT AND SAVE OUT ----------------------------------------------------
+    # Alongshore-uniform fields are saved as their cross-shore profile (opt-in)
+    if compact_uniform:
+        nc_data = compact_alongshore_uniform(nc_data)
+    else:
+        nc_data = drop_uniform_flag(nc_data)
+
+    # X/Y coordinates implied by DX/DY
+    if implicit_coords:
+        nc_data = drop_implicit_coords(nc_data)
+
     # One last double check on types
-    nc_data = ensure_net_cdf_type(nc_data)
+    nc_data = ensure_net_cdf_type(nc_data, encoding=encoding)
 
+    # Add onto the ensemble store
+    if store is not None:
+        store.append(nc_data)
     # Get the file path and save
-    ITER = int(var_dict['ITER'])
-    ptr = fpy.get_key_dirs(tri_num = ITER)
-    nc_path = ptr['nc']
-    nc_data.to_netcdf(nc_path)
+    else:
+        ITER = int(var_dict['ITER'])
+        ptr = fpy.get_key_dirs(tri_num = ITER, resolver = resolver)
+        nc_path = ptr['nc']
+        nc_data.to_netcdf(nc_path)
     ## [END] ASSERT AND SAVE OUT ----------------------------------------------
     
-    print('NETCDF for input data successful!')
+    logger.debug('NETCDF for input data successful!')
     return nc_data
 
@@ -8,6 +8,9 @@ import warnings
 from pathlib import Path
 from typing import  Dict, Any, Optional
 from pathlib import Path
+from .DomainObject import (compact_alongshore_uniform, expand_alongshore_uniform,
+                           restore_implicit_coords, is_alongshore_uniform)
+from ._ensemble_store import read_ensemble_trial
 
 def find_prefixes_path(directory):
         prefixes = []
@@ -146,10 +149,20 @@ def get_into_netcdf():
     print('\nStarted compressing raw output files in NetCDF...')
 
     # Acess necessary paths
-    ptr = fpy.get_key_dirs()
+    resolver = fpy.get_path_resolver()
+    ptr = fpy.get_key_dirs(resolver=resolver)
+    resolver.make_trial_dirs()
 
-    # Get the NETCDF Created in the input phase
-    ds = xr.load_dataset(ptr['nc'])
+    # Get the NETCDF Created in the input phase, with full (X, Y) fields
+    if os.path.exists(ptr['nc']):
+        ds = xr.load_dataset(ptr['nc'])
+    # Or the slice of this trial of the ensemble store
+    else:
+        ds = read_ensemble_trial(int(resolver.get('TRI_NUM')), resolver=resolver)
+    # Outputs keep the layout of the inputs: compacted only if they were
+    compact = any(is_alongshore_uniform(ds[name]) and ds[name].dims == ('X',)
+                  for name in ds.data_vars)
+    ds = expand_alongshore_uniform(restore_implicit_coords(ds))
     # Get dimensions needed from inputs
     Mglob, Nglob = ds.attrs['Mglob'], ds.attrs['Nglob']
 
@@ -220,12 +233,14 @@ def get_into_netcdf():
                     'v_sta': (['GAGE_NUM', 't_station'], v_station),
                     'Mglob_gage': (['GAGE_NUM'], ds['Mglob_gage'].values),
                     'Nglob_gage': (['GAGE_NUM'], ds['Nglob_gage'].values),
-                    'Z': (['X','Y'], ds['Z'].values)  
+                    'Z': ds['Z'].variable
                 }
             )
 
             ds_station.attrs = ds.attrs.copy()
             # Save to netcdf
+            if compact:
+                ds_station = compact_alongshore_uniform(ds_station)
             ds_station.to_netcdf(ptr['ns'])
             print(f"\t\tSuccessfully compressed station data to .nc file: {ptr['ns']}")
 
@@ -240,6 +255,11 @@ def get_into_netcdf():
             # Add variable
             ds = ds.assign( {var_name: ( ['t_AVE','Y','X'], var_value)})
 
+    # Alongshore-uniform fields are saved as their cross-shore profile, if
+    # the inputs were
+    if compact:
+        ds = compact_alongshore_uniform(ds)
+
     # EDIT 3-17
     comp = dict(zlib=True, complevel=4)  # Compression level 1 (low) to 9 (high)
     encoding = {var: comp for var in ds.data_vars}  # Apply to all variables
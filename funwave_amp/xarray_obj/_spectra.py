@@ -0,0 +1,182 @@
+import numpy as np
+
+
+'''
+Wave components of wavemaker time series, for the WaveCompFile of a
+WK_TIME_SERIES. Series are handled as batches: `eta` may be a single (n_t)
+series, or (n_series, n_t) series sharing the time vector `t`, in which case
+the amplitudes and phases are (n_series, n_f).
+
+FUNWAVE-TVD's wavemaker cost scales with NumWaveComp, so the components of a
+long record (one per frequency bin) can be merged into at most K components
+with `reduce_components`:
+    > the bins are split into K bands of equal energy, and each band becomes
+      one component of the band's energy, ie- m0 is conserved exactly
+    > each component is at the energy-weighted mean frequency of its band,
+      except the band with the spectral peak, which is at the peak frequency
+      such that the peak period is preserved
+    > each component takes the phase of the most energetic bin of its band
+'''
+
+TAPERS = ['hann', 'tukey']
+TAPER_CORRECTIONS = ['energy', 'amplitude']
+
+
+#%% FFT
+def taper_window(N, taper=None, alpha=0.1):
+    '''
+    Taper window of N points, None if `taper` is None
+
+    Arguments:
+    - taper (str/None): 'hann', or 'tukey' (cosine tapered ends)
+    - alpha (float): fraction of the record tapered by 'tukey'
+    '''
+    if taper is None:
+        return None
+    if taper not in TAPERS:
+        raise ValueError(f'`taper` must be one of {TAPERS} or None, not {taper}')
+    if taper == 'hann':
+        return np.hanning(N)
+
+    # Tukey: cosine tapers over alpha*N/2 points at each end
+    window = np.ones(N)
+    width = int(np.floor(alpha * (N - 1) / 2))
+    if width > 0:
+        ramp = 0.5 * (1 - np.cos(np.pi * np.arange(0, width) / width))
+        window[:width] = ramp
+        window[N - width:] = ramp[::-1]
+    return window
+
+
+def rfft_components(t, eta, f_lo=None, f_hi=None, taper=None, alpha=0.1,
+                    correction='energy'):
+    '''
+    Amplitude and phase of each frequency bin of one or many real series, by
+    real FFT. Bins are below the Nyquist frequency, and within (f_lo, f_hi)
+    if given. Tapered series are corrected for the loss to the window:
+        > 'energy'   : by its RMS, sqrt(mean(window**2)), such that the
+                       variance (m0) of a broadband series is preserved
+        > 'amplitude': by its coherent gain, mean(window), such that the
+                       amplitude of a pure sinusoid is preserved (this
+                       inflates m0, ie- by 1.5x for 'hann')
+
+    Arguments:
+    - t (array): (n_t) uniformly spaced time
+    - eta (array): (n_t) or (n_series, n_t) series
+    - f_lo, f_hi (float/None): frequency limits (exclusive)
+    - taper, alpha: see `taper_window`
+    - correction (str): 'energy' or 'amplitude', for tapered series
+
+    Returns:
+    - f (array): (n_f) frequencies
+    - amp, phase (array): (n_f) or (n_series, n_f)
+    '''
+    t = np.asarray(t).ravel()
+    eta = np.asarray(eta, dtype=float)
+    if eta.shape[-1] != len(t):
+        raise ValueError(f'`t` ({len(t)}) and the last axis of `eta` {eta.shape} must have the same length')
+
+    # Basic Info
+    dt = t[1] - t[0]
+    N = len(t)
+
+    # Taper, with its gain
+    if correction not in TAPER_CORRECTIONS:
+        raise ValueError(f'`correction` must be one of {TAPER_CORRECTIONS}, not {correction}')
+    gain = 1.0
+    window = taper_window(N, taper, alpha)
+    if window is not None:
+        eta = eta * window
+        if correction == 'energy':
+            gain = np.sqrt(np.mean(window**2))
+        else:
+            gain = window.mean()
+
+    # Real FFT, cut to below Nyquist
+    fft_values = np.fft.rfft(eta, axis=-1)[..., :N//2]
+    f = np.fft.rfftfreq(N, d=dt)[:N//2]
+
+    # Amplitude and Phase at each frequency
+    amp = 2*np.abs(fft_values) / (N*gain)
+    phase = -np.angle(fft_values)
+
+    # Cut off if necessary
+    keep = np.ones(len(f), dtype=bool)
+    if f_lo:
+        keep &= f > f_lo
+    if f_hi:
+        keep &= f < f_hi
+    return f[keep], amp[..., keep], phase[..., keep]
+
+
+#%% REDUCTION
+def reduce_components(f, amp, phase, max_components):
+    '''
+    Merges the frequency bins of one or many spectra into at most
+    `max_components` components (see module docstring)
+
+    Arguments:
+    - f (array): (n_f) frequencies
+    - amp, phase (array): (n_f) or (n_series, n_f)
+    - max_components (int): K, maximum number of components
+
+    Returns:
+    - f, amp, phase (array): for a single spectrum, (<= K) components in
+        increasing frequency. For many, (n_series, K) with the components
+        of each in increasing frequency; unused components (if a single bin
+        holds the energy of several bands) have an amplitude of 0 and a
+        frequency of NaN.
+    '''
+    f = np.asarray(f, dtype=float)
+    amp = np.asarray(amp, dtype=float)
+    phase = np.asarray(phase, dtype=float)
+    K = int(max_components)
+    if K < 1:
+        raise ValueError(f'`max_components` must be at least 1, not {max_components}')
+    single = amp.ndim == 1
+    amp2, phase2 = np.atleast_2d(amp), np.atleast_2d(phase)
+    n, n_f = amp2.shape
+
+    # Already few enough components
+    if n_f <= K:
+        if single:
+            return f, amp, phase
+        f_out = np.full((n, K), np.nan)
+        f_out[:, :n_f] = f
+        return (f_out,
+                np.pad(amp2, ((0, 0), (0, K - n_f))),
+                np.pad(phase2, ((0, 0), (0, K - n_f))))
+
+    ## Band of each bin, by its cumulative energy
+    energy = amp2**2 / 2
+    total = energy.sum(axis=-1, keepdims=True)
+    centers = np.cumsum(energy, axis=-1) - energy/2
+    band = np.minimum((K * centers / np.where(total > 0, total, 1)).astype(int), K - 1)
+    flat = (band + K*np.arange(n)[:, np.newaxis]).ravel()
+
+    ## Energy and energy-weighted frequency of each band
+    E_band = np.bincount(flat, energy.ravel(), minlength=n*K)
+    fE_band = np.bincount(flat, (energy * f).ravel(), minlength=n*K)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        f_band = np.where(E_band > 0, fE_band / E_band, np.nan)
+    amp_band = np.sqrt(2*E_band)
+
+    ## Phase of the most energetic bin of each band
+    order = np.lexsort((energy.ravel(), flat))
+    flat_sorted = flat[order]
+    last = np.append(flat_sorted[1:] != flat_sorted[:-1], True)
+    phase_band = np.zeros(n*K)
+    phase_band[flat_sorted[last]] = phase2.ravel()[order[last]]
+
+    ## The band of the peak is at the peak frequency
+    rows = np.arange(n)
+    i_peak = np.argmax(energy, axis=-1)
+    has_energy = total[:, 0] > 0
+    peak_flat = (band[rows, i_peak] + K*rows)[has_energy]
+    f_band[peak_flat] = f[i_peak[has_energy]]
+
+    f_band, amp_band, phase_band = (x.reshape(n, K) for x in (f_band, amp_band, phase_band))
+    if single:
+        used = amp_band[0] > 0
+        return f_band[0, used], amp_band[0, used], phase_band[0, used]
+    return f_band, amp_band, phase_band